@@ -1,12 +1,7 @@
-while true;
-do
-	${XL_IDP_ROOT_DATACORE}/bash/forecast.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/margin_income_plan.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/volumes_orlovka_terminal.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/border_crossing_plans.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/terminals_plans_orlovka_manp.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/terminals_plans_p1-p4.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/sales_plan_pivot_table.sh;
-	${XL_IDP_ROOT_DATACORE}/bash/dkp.sh;
-	sleep 1;
-done
\ No newline at end of file
+#!/bin/bash
+
+export PYTHONPATH="${XL_IDP_ROOT_DATACORE}:${PYTHONPATH}"
+
+# Один резидентный процесс вместо запуска python3 на каждый файл.
+# Отдельные скрипты bash/*.sh остаются для ручного запуска одного конвейера.
+exec python3 -m scripts.daemon
@@ -1,9 +1,16 @@
 import os
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from multiprocessing import util
+from typing import List, Optional, Tuple
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 LOG_FORMAT: str = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 DATE_FTM: str = "%d/%B/%Y %H:%M:%S"
+LOG_MAX_BYTES: int = int(10.5 * pow(1024, 2))
+LOG_BACKUP_COUNT: int = 3
 
 os.environ["XL_IDP_ROOT_DATACORE"] = "."
 
@@ -19,8 +26,8 @@ def get_file_handler(name: str) -> logging.FileHandler:
     log_dir_name: str = f"{get_my_env_var('XL_IDP_ROOT_DATACORE')}/logging"
     if not os.path.exists(log_dir_name):
         os.mkdir(log_dir_name)
-    file_handler = RotatingFileHandler(filename=f"{log_dir_name}/{name}.log", mode='a', maxBytes=10.5 * pow(1024, 2),
-                                       backupCount=3)
+    file_handler = RotatingFileHandler(filename=f"{log_dir_name}/{name}.log", mode='a', maxBytes=LOG_MAX_BYTES,
+                                       backupCount=LOG_BACKUP_COUNT)
     file_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FTM))
     return file_handler
 
@@ -32,12 +39,89 @@ def get_stream_handler():
     return stream_handler
 
 
+def handle_record(handlers: Tuple[logging.Handler, ...], record: logging.LogRecord) -> None:
+    for handler in handlers:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+class LogListener(QueueListener):
+    def handle(self, item: Tuple[Tuple[logging.Handler, ...], logging.LogRecord]) -> None:
+        handle_record(*item)
+
+
+class LogQueue(object):
+    def __init__(self):
+        """
+        The queue of the log records of the process.
+
+        The records are formatted and written by the handlers in a background thread, which is started
+        on the first record of the process (also after a fork). The queued records are written before the process
+        exits; the records logged after that are written at once.
+        """
+        self.lock: threading.Lock = threading.Lock()
+        self.queue: Optional[queue.SimpleQueue] = None
+        self.listener: Optional[LogListener] = None
+        self.pid: Optional[int] = None
+        self.main_pid: int = os.getpid()
+        self.stopped: bool = False
+
+    def _start(self) -> None:
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.SimpleQueue()
+                self.listener = LogListener(self.queue)
+                self.listener.start()
+                self.stopped = False
+                if os.getpid() != self.main_pid:  # Worker processes exit without running the atexit handlers
+                    util.Finalize(None, self.stop, exitpriority=0)
+                self.pid = os.getpid()
+
+    def put(self, handlers: Tuple[logging.Handler, ...], record: logging.LogRecord) -> None:
+        if self.pid != os.getpid():
+            self._start()
+        if self.stopped:
+            handle_record(handlers, record)
+        else:
+            self.queue.put_nowait((handlers, record))
+
+    def stop(self) -> None:
+        """
+        Writes the queued records and stops the background thread.
+        :return: None
+        """
+        with self.lock:
+            if self.pid == os.getpid() and not self.stopped:
+                self.stopped = True
+                self.listener.stop()
+
+
+log_queue: LogQueue = LogQueue()
+atexit.register(log_queue.stop)
+
+
+class AsyncHandler(QueueHandler):
+    def __init__(self, handlers: List[logging.Handler]):
+        """
+        Passes the records to the given handlers through the log queue of the process,
+        so the logging thread doesn't wait for formatting and writing to disk.
+        :param handlers: The handlers of the records.
+        """
+        super().__init__(None)
+        self.handlers: Tuple[logging.Handler, ...] = tuple(handlers)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        log_queue.put(self.handlers, record)
+
+
 def get_logger(name: str) -> logging.getLogger:
     logger: logging.getLogger = logging.getLogger(name)
     if logger.hasHandlers():
         logger.handlers.clear()
-    logger.addHandler(get_file_handler(name))
-    logger.addHandler(get_stream_handler())
+    logger.addHandler(AsyncHandler([get_file_handler(name), get_stream_handler()]))
     logger.setLevel(logging.INFO)
     return logger
 
@@ -0,0 +1,204 @@
+import os
+import contextlib
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from datetime import datetime
+from functools import lru_cache
+from scripts.profiler import FileProfile
+from scripts.writers import create_writer
+from typing import Dict, Optional, Tuple
+from pandas.api.types import is_datetime64_dtype
+
+date_formats: tuple = ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S")
+
+# The shapes of `date_formats` which are parsed by `pd.to_datetime` exactly like `datetime.strptime` does
+# (pandas 1.x parses ISO formats leniently, so other strings are left to `convert_format_date`).
+DATE_PATTERNS: Dict[str, str] = {
+    "%Y-%m-%d": r"\d{4}-\d{2}-\d{2}",
+    "%d.%m.%Y": r"\d{2}\.\d{2}\.\d{4}",
+    "%Y-%m-%d %H:%M:%S": r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"
+}
+DATE_SAMPLE_SIZE: int = 100
+
+
+class BaseFlatConverter(object):
+    """
+    The common pipeline of the flat-file converters:
+    read → dropna → rename → strip → add columns → change types and values → write.
+
+    A converter describes its file with the class attributes and overrides the hooks only for
+    what is specific to it (e.g. the columns taken from the file name or derived from other columns).
+    """
+    headers_eng: Optional[dict] = None
+    dict_types: Optional[dict] = None
+    date_columns: Tuple[str, ...] = ()
+    round_columns: Tuple[str, ...] = ()
+    table: Optional[str] = None
+
+    def __init__(self, input_file_path: str, output_folder: str):
+        self.input_file_path: str = input_file_path
+        self.output_folder: str = output_folder
+        self.profile: FileProfile = FileProfile(type(self).__name__, os.path.basename(input_file_path))
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def convert_format_date(date: str) -> Optional[str]:
+        """
+        Convert to a date type. The results are cached, because the same dates repeat in the files.
+        """
+        for date_format in date_formats:
+            with contextlib.suppress(ValueError):
+                return str(datetime.strptime(date, date_format).date())
+        return None
+
+    @staticmethod
+    def detect_date_format(strings: pd.Series) -> Optional[str]:
+        """
+        Detect the format of most dates in the sample of the strings.
+        :param strings: The strings.
+        :return: The format or None if no string looks like a date.
+        """
+        sample: pd.Series = strings[:DATE_SAMPLE_SIZE]
+        counts: Dict[str, int] = {
+            date_format: sample.str.fullmatch(pattern).sum() for date_format, pattern in DATE_PATTERNS.items()
+        }
+        date_format: str = max(counts, key=counts.get)
+        return date_format if counts[date_format] else None
+
+    @classmethod
+    def convert_format_dates(cls, values: pd.Series) -> pd.Series:
+        """
+        Convert the column to dates, giving the same result as `convert_format_date(str(value))` for every value.
+
+        A datetime column is formatted at once. In other columns every distinct value is converted once:
+        the values of the dominant format are parsed by `pd.to_datetime`, the rest (other formats, invalid dates)
+        by `convert_format_date`.
+
+        :param values: The column.
+        :return: The column of "YYYY-MM-DD" strings and None.
+        """
+        if is_datetime64_dtype(values):
+            # str() of a timestamp with fractions of a second matches none of the formats
+            is_valid: pd.Series = values.notna() & (values.dt.floor("s") == values)
+            return values.dt.strftime("%Y-%m-%d").astype(object).where(is_valid, None)
+        codes, uniques = pd.factorize(values)
+        strings: pd.Series = pd.Series([str(value) for value in uniques], dtype=object)
+        dates: pd.Series = pd.Series([None] * len(strings), dtype=object)
+        if date_format := cls.detect_date_format(strings):
+            parsed: pd.Series = pd.to_datetime(
+                strings[strings.str.fullmatch(DATE_PATTERNS[date_format])], format=date_format, errors="coerce"
+            )
+            dates[parsed.index] = parsed.dt.strftime("%Y-%m-%d")
+        leftovers: pd.Series = dates.isna()
+        dates[leftovers] = [cls.convert_format_date(string) for string in strings[leftovers]]
+        return pd.Series(np.append(dates.to_numpy(), None)[codes], index=values.index, dtype=object)
+
+    def read_excel(self, io=None, sheet_name=0) -> DataFrame:
+        """
+        Read the sheet of the Excel file with the types of the converter.
+        """
+        with self.profile.stage("read_excel") as stage:
+            df: DataFrame = pd.read_excel(
+                self.input_file_path if io is None else io, sheet_name=sheet_name, dtype=self.dict_types
+            )
+            stage.add_rows(len(df))
+        return df
+
+    @staticmethod
+    def strip_values(df: DataFrame) -> DataFrame:
+        """
+        Strip whitespaces in string values.
+
+        Only object columns can contain strings, so numeric and date columns are skipped.
+        The values of the sheets repeat a lot (ports, clients, departments), so in a column
+        of strings only the unique values are stripped. Values of other types in a mixed column
+        are kept as they are.
+
+        :param df: The DataFrame.
+        :return: The DataFrame with stripped strings.
+        """
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            values: pd.Series = df[column]
+            inferred_type: str = pd.api.types.infer_dtype(values, skipna=True)
+            if inferred_type == "string":
+                codes, uniques = pd.factorize(values)
+                if len(uniques) * 2 < len(values):
+                    stripped: np.ndarray = np.array([value.strip() for value in uniques] + [None], dtype=object)
+                    df[column] = np.where(codes < 0, values.to_numpy(), stripped[codes])
+                else:
+                    df[column] = [x.strip() if isinstance(x, str) else x for x in values.to_numpy()]
+            elif inferred_type.startswith("mixed"):
+                df[column] = values.map(lambda x: x.strip() if isinstance(x, str) else x)
+        return df
+
+    def add_columns_from_filename(self, df: DataFrame) -> None:
+        """
+        Add columns taken from the file name.
+        """
+
+    def add_new_columns(self, df: DataFrame) -> None:
+        """
+        Add new columns.
+        """
+        df['original_file_name'] = os.path.basename(self.input_file_path)
+        df['original_file_parsed_on'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def add_derived_columns(self, df: DataFrame) -> None:
+        """
+        Add columns calculated from other columns.
+        """
+
+    def change_type_and_values(self, df: DataFrame) -> None:
+        """
+        Change data types or changing values.
+        """
+        for column in self.round_columns:
+            with contextlib.suppress(Exception):
+                df[column] = df[column].round(2)
+        for column in self.date_columns:
+            if column in df.columns:
+                with contextlib.suppress(Exception):
+                    df[column] = self.convert_format_dates(df[column])
+
+    def transform(self, df: DataFrame, headers_eng: Optional[dict] = None) -> DataFrame:
+        """
+        Run all stages of the pipeline between reading and writing.
+        :param df: The DataFrame read from the Excel file.
+        :param headers_eng: The header map (the one of the converter by default).
+        :return: The DataFrame ready to be written.
+        """
+        headers_eng = self.headers_eng if headers_eng is None else headers_eng
+        with self.profile.stage("transform", rows=len(df)):
+            df = df.dropna(axis=0, how='all')
+            if headers_eng:
+                df = df.rename(columns=headers_eng)
+            with self.profile.stage("strip_values", rows=len(df)):
+                df = self.strip_values(df)
+            self.add_columns_from_filename(df)
+            self.add_new_columns(df)
+            self.add_derived_columns(df)
+            with self.profile.stage("change_type_and_values", rows=len(df)):
+                self.change_type_and_values(df)
+        return df
+
+    def write_to_json(self, df: DataFrame, name: Optional[str] = None) -> None:
+        """
+        Write data to json (or another format selected by DATACORE_OUTPUT_FORMAT).
+        """
+        with self.profile.stage("write", rows=len(df)):
+            with create_writer(
+                self.output_folder, name or os.path.basename(self.input_file_path), table=self.table
+            ) as writer:
+                writer.write_frame(df)
+
+    def main(self) -> None:
+        """
+        The main function where we read the Excel file and write the file to json.
+        The time and memory of every stage are written to the log as one line (see `FileProfile`).
+        """
+        with self.profile:
+            df: DataFrame = self.read_excel()
+            df = self.transform(df)
+            self.write_to_json(df)
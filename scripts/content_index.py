@@ -0,0 +1,139 @@
+import glob
+import json
+import fcntl
+import hashlib
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from collections import OrderedDict
+from scripts.settings_dkp import *
+from scripts.app_logger import get_logger
+from typing import Hashable, Optional
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+CHUNK_SIZE: int = 1024 * 1024
+OUTPUT_SETTINGS: tuple = ("DATACORE_OUTPUT_FORMAT", "DATACORE_SINK", "DATACORE_JSON_BACKEND", "DKP_DIFF", "DKP_DIFF_STATE")
+
+
+def is_dedup_enabled() -> bool:
+    return os.environ.get("DATACORE_DEDUP", "1") != "0"
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Returns the SHA-256 of the file contents.
+    :param file_path: The path to the file.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def get_code_version() -> str:
+    """
+    Returns the hash of the converters code, so the files are converted again after the code is updated.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_content_key(file_path: str, reference_version: Optional[Hashable] = None) -> str:
+    """
+    Returns the key of the conversion result: the same key means the same output.
+
+    The key consists of the file contents and name (the name is written to every record as `original_file_name`),
+    the converters code, the output settings and the version of the reference used by the converter.
+
+    :param file_path: The path to the file.
+    :param reference_version: The version of the reference used by the converter.
+    :return: The key.
+    """
+    parts: list = [
+        hash_file(file_path),
+        os.path.basename(file_path),
+        get_code_version(),
+        *[os.environ.get(name, "") for name in OUTPUT_SETTINGS],
+        repr(reference_version)
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class ContentIndex(object):
+    def __init__(self, path: str, max_entries: int = 10000):
+        """
+        Keeps the key of the last successful conversion of every file name, so a file dropped again with the same
+        contents as the last converted version of it is not converted. A file equal to an older version is converted,
+        because its output differs from the one the consumers got last.
+
+        The index is a JSON file shared by the worker processes. It is updated under an exclusive lock
+        and replaced atomically. Only the `max_entries` latest files are kept.
+
+        :param path: The path to the index file.
+        :param max_entries: The maximum number of the files in the index.
+        """
+        self.path: str = path
+        self.max_entries: int = max_entries
+
+    def _load(self) -> OrderedDict:
+        if not os.path.exists(self.path):
+            return OrderedDict()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError) as exception:
+            logger.warning(f"Failed to read the content index {self.path}: {exception}")
+            return OrderedDict()
+
+    def get(self, file_path: str) -> Optional[dict]:
+        """
+        Returns the entry of the last conversion of the file name.
+        :param file_path: The path to the file.
+        :return: The entry (the key and the date of the conversion) or None.
+        """
+        entry = self._load().get(os.path.basename(file_path))
+        return entry if isinstance(entry, dict) and "key" in entry else None
+
+    def _update(self, file_path: str, entry: Optional[dict]) -> None:
+        folder: str = os.path.dirname(self.path) or "."
+        try:
+            with open(f"{self.path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                entries: OrderedDict = self._load()
+                name: str = os.path.basename(file_path)
+                if entries.pop(name, None) is None and entry is None:
+                    return
+                if entry is not None:
+                    entries[name] = entry
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, delete=False) as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(f.name, self.path)
+        except OSError as exception:
+            logger.warning(f"Failed to update the content index {self.path}: {exception}")
+
+    def add(self, key: str, file_path: str) -> None:
+        """
+        Stores the key of the converted file as the last one of its name.
+        :param key: The key from `get_content_key`.
+        :param file_path: The path to the converted file.
+        :return: None
+        """
+        self._update(file_path, {"key": key, "converted_on": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+
+    def discard(self, file_path: str) -> None:
+        """
+        Forgets the last conversion of the file name, e.g. after the file failed or was converted without a key.
+        :param file_path: The path to the file.
+        :return: None
+        """
+        self._update(file_path, None)
@@ -0,0 +1,300 @@
+import shutil
+import fnmatch
+import importlib
+import traceback
+from scripts.settings_dkp import *
+from scripts.app_logger import get_logger
+from scripts.scheduler import Scheduler
+from scripts.metrics import METRICS_PORT, metrics, start_http_server
+from scripts.content_index import ContentIndex, get_content_key, is_dedup_enabled
+from scripts.watcher import BaseWatcher, create_watcher
+from typing import Hashable, List, Optional, Tuple
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+FLAT_PATTERNS: Tuple[str, ...] = ("*.xls*", "*.XLS*", "*.xml")
+DKP_PATTERNS: Tuple[str, ...] = ("*.xls*",)
+POLL_INTERVAL: float = 1.0
+BUSY_POLL_INTERVAL: float = 0.1
+
+
+class Pipeline(object):
+    def __init__(
+        self,
+        name: str,
+        folder: str,
+        module: str,
+        class_name: str,
+        patterns: Tuple[str, ...] = FLAT_PATTERNS,
+        delay: int = 3
+    ):
+        """
+        Describes one input directory and the converter that handles its files.
+
+        :param name: The name of the pipeline (used in logs).
+        :param folder: The name of the input folder under XL_IDP_PATH_DATACORE.
+        :param module: The module with the converter class.
+        :param class_name: The name of the converter class. It must accept (input_file_path, output_folder)
+                           and expose a `main` method.
+        :param patterns: File name patterns that are picked up from the input folder.
+        :param delay: The debounce window: seconds the file must stay unchanged after the last write
+                      before it is considered fully uploaded.
+        """
+        self.name: str = name
+        self.folder: str = folder
+        self.module: str = module
+        self.class_name: str = class_name
+        self.patterns: Tuple[str, ...] = patterns
+        self.delay: int = delay
+        self.converter: Optional[type] = None
+
+    @property
+    def xls_path(self) -> str:
+        return os.path.join(get_my_env_var('XL_IDP_PATH_DATACORE'), self.folder)
+
+    @property
+    def done_path(self) -> str:
+        return os.path.join(self.xls_path, "done")
+
+    @property
+    def json_path(self) -> str:
+        return os.path.join(self.xls_path, "json")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.xls_path, ".content_index.json")
+
+    def load(self) -> None:
+        """
+        Imports the converter class once, so every file is processed in the already warmed up interpreter.
+        :return: None
+        """
+        self.converter = getattr(importlib.import_module(self.module), self.class_name)
+
+    def get_reference_version(self) -> Optional[Hashable]:
+        """
+        Returns the version of the reference the converter depends on (None if it doesn't use any).
+        :return: The version of the reference.
+        """
+        get_reference_version = getattr(self.converter, "get_reference_version", None)
+        return get_reference_version() if get_reference_version else None
+
+    def is_dedup_supported(self) -> bool:
+        """
+        Checks that the output of the converter depends only on the file, so identical files may be skipped.
+        :return: True if identical files may be skipped.
+        """
+        is_dedup_supported = getattr(self.converter, "is_dedup_supported", None)
+        return is_dedup_supported() if is_dedup_supported else True
+
+    def prepare_folders(self) -> None:
+        """
+        Creates the `done` and `json` folders next to the input files if they don't exist.
+        :return: None
+        """
+        for path in (self.done_path, self.json_path):
+            os.makedirs(path, exist_ok=True)
+
+    def is_suitable(self, filename: str) -> bool:
+        """
+        Checks that the file matches the patterns of the pipeline and is not a file that previously failed.
+        :param filename: The base name of the file.
+        :return: True if the file must be processed by this pipeline.
+        """
+        if "error_" in filename:
+            return False
+        return any(fnmatch.fnmatchcase(filename, pattern) for pattern in self.patterns)
+
+
+PIPELINES: List[Pipeline] = [
+    Pipeline("forecast", "flat_forecast", "scripts.forecast", "Forecast"),
+    Pipeline("margin_income_plan", "flat_margin_income_plan", "scripts.margin_income_plan", "MarginIncomePlan"),
+    Pipeline(
+        "volumes_orlovka_terminal",
+        "flat_volumes_orlovka_terminal",
+        "scripts.volumes_orlovka_terminal",
+        "VolumesOrlovkaTerminal"
+    ),
+    Pipeline(
+        "border_crossing_plans",
+        "flat_border_crossing_plans",
+        "scripts.border_crossing_plans",
+        "BorderCrossingPlans"
+    ),
+    Pipeline(
+        "terminals_plans_orlovka_manp",
+        "flat_terminals_plans_orlovka_manp",
+        "scripts.terminals_plans_orlovka_manp",
+        "TerminalsPlansOrlovkaManp"
+    ),
+    Pipeline(
+        "terminals_plans_p1-p4",
+        "flat_terminals_plans_p1-p4",
+        "scripts.terminals_plans_p1-p4",
+        "TerminalsPlansP1P4"
+    ),
+    Pipeline(
+        "sales_plan_pivot_table",
+        "flat_sales_plan_pivot_table",
+        "scripts.sales_plan_pivot_table",
+        "SalesPlanPivotTable"
+    ),
+    Pipeline("dkp", "dkp", "scripts.dkp", "DKP", patterns=DKP_PATTERNS, delay=30),
+]
+
+
+def convert_file(pipeline: Pipeline, file_path: str) -> int:
+    """
+    Runs the converter of the pipeline for the file in the current process.
+
+    Converters report errors with `sys.exit(<code>)`, so `SystemExit` is translated to the same exit code
+    the `python3` process would have returned. Any other exception is treated like an uncaught exception
+    in the script, i.e. exit code 1.
+
+    :param pipeline: The pipeline which owns the file.
+    :param file_path: The path to the file.
+    :return: The exit code of the conversion (0 on success).
+    """
+    logger.info(f"{os.path.basename(file_path)} has started processing by {pipeline.name}")
+    try:
+        pipeline.converter(file_path, pipeline.json_path).main()
+    except SystemExit as exception:
+        code = exception.code
+        if code is None:
+            return 0
+        return code if isinstance(code, int) else 1
+    except Exception:
+        logger.error(f"Unhandled exception in {pipeline.name}: {traceback.format_exc()}")
+        return 1
+    logger.info(f"{os.path.basename(file_path)} has finished processing by {pipeline.name}")
+    return 0
+
+
+def move_processed_file(pipeline: Pipeline, file_path: str, exit_code: int) -> Optional[str]:
+    """
+    Moves the file to `done` on success or renames it to `error_<name>` otherwise.
+    A failed move (e.g. the file was deleted or renamed during the conversion) is only logged.
+    :param pipeline: The pipeline which owns the file.
+    :param file_path: The path to the processed file.
+    :param exit_code: The exit code of the conversion.
+    :return: The new path of the file or None if it can't be moved.
+    """
+    basename: str = os.path.basename(file_path)
+    if exit_code == 0:
+        destination: str = os.path.join(pipeline.done_path, basename)
+    else:
+        logger.error(f"ERROR during convertion {file_path} to json! Exit code - {exit_code}")
+        destination = os.path.join(pipeline.xls_path, f"error_{basename}")
+    try:
+        shutil.move(file_path, destination)
+    except OSError as exception:
+        logger.error(f"Failed to move {file_path} to {destination}: {exception}")
+        return None
+    return destination
+
+
+def get_file_key(pipeline: Pipeline, file_path: str) -> Optional[str]:
+    """
+    Returns the content key of the file or None if deduplication is disabled (DATACORE_DEDUP=0), not supported
+    by the converter (e.g. DKP in the diff mode) or the key can't be calculated, e.g. the version of the reference
+    is unavailable.
+    :param pipeline: The pipeline which owns the file.
+    :param file_path: The path to the file.
+    :return: The key.
+    """
+    if not is_dedup_enabled() or not pipeline.is_dedup_supported():
+        return None
+    try:
+        return get_content_key(file_path, pipeline.get_reference_version())
+    except Exception as exception:
+        logger.warning(f"Failed to get the content key of {file_path}: {exception}. The file will be converted")
+        return None
+
+
+def process_file(pipeline: Pipeline, file_path: str) -> int:
+    """
+    Converts the file and moves it according to the result.
+
+    A file identical to the last converted version of the same name (the same contents, code and reference)
+    is moved to `done` without conversion, since its output would be the same as the previous one.
+    The metrics of the file are flushed right after it is processed.
+
+    :param pipeline: The pipeline which owns the file.
+    :param file_path: The path to the file.
+    :return: The exit code of the conversion.
+    """
+    try:
+        content_index: ContentIndex = ContentIndex(pipeline.index_path)
+        key: Optional[str] = get_file_key(pipeline, file_path)
+        if key and (entry := content_index.get(file_path)) and entry["key"] == key:
+            logger.info(
+                f"{os.path.basename(file_path)} is identical to the file converted on {entry['converted_on']}. "
+                f"Conversion is skipped"
+            )
+            metrics.inc("datacore_files_skipped_total", pipeline=pipeline.name)
+            move_processed_file(pipeline, file_path, 0)
+            return 0
+        started: float = time.monotonic()
+        exit_code: int = convert_file(pipeline, file_path)
+        metrics.observe("datacore_file_duration_seconds", time.monotonic() - started, pipeline=pipeline.name)
+        if key and exit_code == 0:
+            content_index.add(key, file_path)
+        else:
+            content_index.discard(file_path)
+        move_processed_file(pipeline, file_path, exit_code)
+        return exit_code
+    finally:
+        metrics.flush()
+
+
+def update_metrics(scheduler: Scheduler, finished: List[Tuple[Pipeline, str, int]]) -> None:
+    """
+    Counts the finished files by the exit code, updates the queues of the pipelines and flushes the metrics
+    at most once per DATACORE_METRICS_FLUSH_INTERVAL seconds.
+    :param scheduler: The scheduler of the files.
+    :param finished: The (pipeline, file_path, exit_code) tuples of the finished files.
+    :return: None
+    """
+    for pipeline, _, exit_code in finished:
+        metrics.inc("datacore_files_total", pipeline=pipeline.name, code=str(exit_code))
+    for name, (queued, running) in scheduler.get_load().items():
+        metrics.set("datacore_queue_depth", queued, pipeline=name)
+        metrics.set("datacore_running_files", running, pipeline=name)
+    metrics.flush(force=False)
+
+
+def main(pipelines: List[Pipeline] = None) -> None:
+    """
+    Watches the input folders forever and converts new files in the pool of worker processes.
+    Every worker imports the converters once at start.
+    With DATACORE_METRICS_PORT the metrics are served on http://DATACORE_METRICS_HOST:port/metrics.
+    The notifications suppressed in the workers are reported by the daemon at most once a minute.
+    :param pipelines: The pipelines to serve (all of them by default).
+    :return: None
+    """
+    pipelines = PIPELINES if pipelines is None else pipelines
+    watcher: BaseWatcher = create_watcher()
+    for pipeline in pipelines:
+        pipeline.prepare_folders()
+        watcher.add_folder(pipeline.xls_path, pipeline.delay, pipeline, pipeline.is_suitable)
+    scheduler: Scheduler = Scheduler(pipelines)
+    if METRICS_PORT:
+        start_http_server()
+    logger.info(
+        f"Daemon has started with {type(watcher).__name__} and {scheduler.workers} workers. "
+        f"Pipelines - {[pipeline.name for pipeline in pipelines]}. Limits - {scheduler.limits}"
+    )
+    try:
+        while True:
+            timeout: float = POLL_INTERVAL if scheduler.is_idle() else BUSY_POLL_INTERVAL
+            for pipeline, file_path in watcher.get_ready(timeout):
+                scheduler.submit(pipeline, file_path)
+            update_metrics(scheduler, scheduler.run_pending())
+            notifier.report_suppressed()
+    finally:
+        watcher.close()
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import re
 import sys
-import json
+import contextlib
+import openpyxl
+import itertools
 import numpy as np
 import pandas as pd
 from re import Match
@@ -8,19 +10,28 @@ from pandas import DataFrame
 from datetime import datetime
 from scripts.settings_dkp import *
 from scripts.app_logger import get_logger
-from clickhouse_connect import get_client
-from clickhouse_connect.driver import Client
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+from scripts.writers import ClickHouseWriter, JsonWriter, create_writer
+from scripts.profiler import FileProfile
+from scripts.records_diff import RecordsDiff
+from scripts.reference_cache import ReferenceCache
+from openpyxl.workbook.workbook import Workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 from clickhouse_connect.driver.query import Sequence
-from typing import List, Dict, Optional, Union, Hashable
+from typing import List, Dict, Optional, Tuple, Union, Hashable, Iterable, Iterator
 
 logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
 
 
-class JsonEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if hasattr(obj, '__dict__'):
-            return obj.__dict__
-        return json.JSONEncoder.default(self, obj)
+_INVALID_CELL: object = object()
+MONTH_BLOCKS: Tuple[str, ...] = ("natural_indicators_ktk", "natural_indicators_teus", "profit_plan", "costs_plan")
+MONTH_INDEXES: Dict[str, int] = {month_string: index for index, month_string in enumerate(MONTH_NAMES)}
+STREAMING_EXTENSIONS: Tuple[str, ...] = (".xlsx", ".xlsm")
+EMPTY_CELL_VALUES: frozenset = frozenset({*STR_NA_VALUES, *ERROR_CODES, "NaT"})
+DIFF_KEY_FIELDS: Tuple[str, ...] = (
+    "client", "description", "project", "cargo", "direction", "bay", "owner", "container_size", "month"
+)
 
 
 class DKP(object):
@@ -28,33 +39,13 @@ class DKP(object):
         self.filename: str = filename
         self.basename_filename: str = os.path.basename(filename)
         self.folder: str = folder
-        reference_dkp: Sequence = self._get_reference()
-        self.columns_names: dict = self._group_columns(
-            reference=reference_dkp,
-            group_index=3,
-            column_index=2,
-            filter_key=0,
-            filter_value="Наименования столбцов"
-        )
-
-        self.block_names: dict = self._group_columns(
-            reference=reference_dkp,
-            group_index=3,
-            column_index=2,
-            filter_key=0,
-            filter_value="Наименования блоков"
-        )
-
-        self.block_table_columns: dict = self._group_nested_columns(
-            reference=reference_dkp,
-            block_index=0,
-            group_index=3,
-            column_index=2,
-            filter_key=1,
-            filter_value="Столбцы таблиц в блоках",
-        )
-        self.sheets_name: list = [column[2] for column in reference_dkp if column[0] == "Наименования листов"]
-        self.dkp_names: dict = {column[2]: column[3] for column in reference_dkp if column[0] == "Наименования в файле"}
+        self.profile: FileProfile = FileProfile(type(self).__name__, self.basename_filename)
+        reference: dict = reference_cache.get()
+        self.columns_names: dict = reference["columns_names"]
+        self.block_names: dict = reference["block_names"]
+        self.block_table_columns: dict = reference["block_table_columns"]
+        self.sheets_name: list = reference["sheets_name"]
+        self.dkp_names: dict = reference["dkp_names"]
         self.floating_columns: list = [
             "description",
             *[
@@ -85,6 +76,14 @@ class DKP(object):
             "profit_plan": None,
             "costs_plan": None
         }
+        self.month_columns: List[List[Optional[str]]] = [
+            [
+                next((key for key, val in self.block_table_columns.get(block, {}).items() if month_string in val), None)
+                for block in MONTH_BLOCKS
+            ]
+            for month_string in MONTH_NAMES
+        ]
+        self.month_positions: np.ndarray = np.full((len(MONTH_NAMES), len(MONTH_BLOCKS)), -1, dtype=int)
 
     @staticmethod
     def _group_columns(
@@ -159,15 +158,75 @@ class DKP(object):
                     result[block_key][table_key] = (row[column_index],)
         return result
 
+    @classmethod
+    def _build_reference(cls, reference_dkp: Sequence) -> dict:
+        """
+        Groups the rows of the `reference_dkp` table into the structures used by the parser.
+
+        :param reference_dkp: The rows of the `reference_dkp` table.
+        :return: A dictionary with `columns_names`, `block_names`, `block_table_columns`, `sheets_name`
+                 and `dkp_names`.
+        """
+        return {
+            "columns_names": cls._group_columns(
+                reference=reference_dkp,
+                group_index=3,
+                column_index=2,
+                filter_key=0,
+                filter_value="Наименования столбцов"
+            ),
+            "block_names": cls._group_columns(
+                reference=reference_dkp,
+                group_index=3,
+                column_index=2,
+                filter_key=0,
+                filter_value="Наименования блоков"
+            ),
+            "block_table_columns": cls._group_nested_columns(
+                reference=reference_dkp,
+                block_index=0,
+                group_index=3,
+                column_index=2,
+                filter_key=1,
+                filter_value="Столбцы таблиц в блоках",
+            ),
+            "sheets_name": [column[2] for column in reference_dkp if column[0] == "Наименования листов"],
+            "dkp_names": {column[2]: column[3] for column in reference_dkp if column[0] == "Наименования в файле"}
+        }
+
     @staticmethod
     def _get_reference() -> Sequence:
-        client: Client = get_client(
-            host=get_my_env_var('HOST'),
-            database=get_my_env_var('DATABASE'),
-            username=get_my_env_var('USERNAME_DB'),
-            password=get_my_env_var('PASSWORD')
-        )
-        return client.query("SELECT * FROM reference_dkp").result_rows
+        with clickhouse_pool.acquire() as client:
+            return client.query("SELECT * FROM reference_dkp").result_rows
+
+    @staticmethod
+    def _get_reference_version() -> tuple:
+        """
+        Returns the row count and the checksum of the `reference_dkp` table.
+        It is much cheaper than reading the whole table and changes whenever any row changes.
+        :return: The version of the reference.
+        """
+        with clickhouse_pool.acquire() as client:
+            return tuple(client.query(REFERENCE_DKP_VERSION_QUERY).result_rows[0])
+
+    @staticmethod
+    def get_reference_version() -> tuple:
+        """
+        Returns the version of `reference_dkp` from the reference cache, so it is probed at most once
+        per DKP_REFERENCE_TTL seconds. The daemon adds it to the key of the converted files,
+        so an identical file is converted again after the reference has changed.
+        :return: The version of the reference.
+        """
+        return reference_cache.get_version()
+
+    @staticmethod
+    def is_dedup_supported() -> bool:
+        """
+        In the diff mode the output depends on the records of the previous file of the department and year
+        (possibly with another name), so the daemon converts every file instead of skipping identical ones.
+        :return: True if identical files may be skipped.
+        """
+        return not DKP_DIFF
 
     @staticmethod
     def _clean_number(value: str) -> Union[float, int]:
@@ -302,7 +361,8 @@ class DKP(object):
             print("2", file=sys.stderr)
             telegram(
                 f"Error code 2: {message}! Не были найдены следующие поля - {empty_columns}! "
-                f"Файл: {self.basename_filename}"
+                f"Файл: {self.basename_filename}",
+                self.basename_filename
             )
             sys.exit(2)
 
@@ -348,6 +408,23 @@ class DKP(object):
             dict_columns=dict_columns_position,
             message="Столбцы отсутствуют в файле или изменены"
         )
+        self.build_month_positions()
+
+    def build_month_positions(self) -> None:
+        """
+        Fills `month_positions` with the positions of the monthly columns of `MONTH_BLOCKS` in the row.
+
+        `month_positions[month, block]` is the position of the column of the month (0 for January)
+        in the block with the index in `MONTH_BLOCKS`, or -1 if the column is absent.
+        It is built once the header is resolved, so records are filled by indexing instead of
+        scanning `block_table_columns` for every row and month.
+
+        :return: None
+        """
+        for month, keys in enumerate(self.month_columns):
+            for block, key in enumerate(keys):
+                position: Optional[int] = self.dict_columns_position.get(key) if key else None
+                self.month_positions[month, block] = -1 if position is None else position
 
     def _is_table_starting(self, row: list) -> bool:
         """
@@ -366,28 +443,54 @@ class DKP(object):
         except TypeError:
             return False
 
-    def write_to_json(self, list_data: List[dict]) -> None:
+    def write_to_json(self, list_data: Iterable[dict]) -> None:
         """
-        Writes the given list of dictionaries to a JSON file.
+        Writes the given dictionaries to a JSON file.
 
-        This method takes a list of dictionaries and writes them to a JSON file.
+        This method takes an iterable of dictionaries and writes them to a JSON file as they come,
+        so a generator of records is never collected in memory.
         The file is written to the same folder as the given Excel file.
-        The filename is the same as the Excel file, but with a `.json` extension instead of `.xls`.
-        If the list of dictionaries is empty, it logs an error message with the error code 4,
+        The filename is the same as the Excel file, but with a `.json` extension instead of `.xls`
+        (`.ndjson` with one record per line if DATACORE_OUTPUT_FORMAT=ndjson).
+        With DATACORE_SINK=clickhouse the records are inserted into the `dkp` table instead.
+        With DKP_DIFF=1 only the records changed since the previous file of the same department and year
+        are written to the file, with the `change_type` field (see `RecordsDiff`).
+        The file appears only after all records are written. If there are no records or an error occurs,
+        no file is created. If there are no records, it logs an error message with the error code 4,
         prints the error code to stderr, sends a message to Telegram with the error code and the name of the file,
         and then exits with the error code.
 
-        :param list_data: The list of dictionaries to write to the JSON file.
+        :param list_data: The dictionaries to write to the JSON file.
         :return: None
         """
-        if not list_data:
-            logger.error("Error code 4: length list equals 0!")
-            print("4", file=sys.stderr)
-            telegram(f"Error code 4: В Файле отсутствуют данные! Файл: {self.basename_filename}")
-            sys.exit(4)
-        output_file_path = os.path.join(self.folder, f'{self.basename_filename}.json')
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(list_data, f, ensure_ascii=False, indent=4, cls=JsonEncoder)
+        records_diff: Optional[RecordsDiff] = self.create_records_diff() if DKP_DIFF else None
+        writer: Union[JsonWriter, ClickHouseWriter]
+        with self.profile.stage("write") as stage, records_diff or contextlib.nullcontext():
+            with create_writer(self.folder, self.basename_filename, table=None if records_diff else "dkp") as writer:
+                writer.write_many(records_diff.diff(list_data) if records_diff else list_data)
+                stage.add_rows(writer.count)
+                if not (records_diff.count if records_diff else writer.count):
+                    logger.error("Error code 4: length list equals 0!")
+                    print("4", file=sys.stderr)
+                    telegram(
+                        f"Error code 4: В Файле отсутствуют данные! Файл: {self.basename_filename}",
+                        self.basename_filename
+                    )
+                    sys.exit(4)
+
+    @staticmethod
+    def create_records_diff() -> RecordsDiff:
+        """
+        Creates the comparison of the records with the previous file of the same department and year.
+        The changes are written to the file only: the ClickHouse sink replaces all rows of a file.
+        :return: The comparison of the records.
+        """
+        return RecordsDiff(
+            DKP_DIFF_STATE,
+            key_fields=DIFF_KEY_FIELDS,
+            partition_fields=("department", "year"),
+            ignored_fields=("original_file_name", "original_file_parsed_on")
+        )
 
     def _extract_value(self, rows: list, column: str) -> Optional[str]:
         """
@@ -405,8 +508,11 @@ class DKP(object):
         :return: The extracted value as a string with whitespace removed,
         or None if the position is invalid or the value is None.
         """
-        position: int = self.dict_columns_position.get(column)
-        if position is None or position >= len(rows):
+        return self._extract_position(rows, self.dict_columns_position.get(column))
+
+    @staticmethod
+    def _extract_position(rows: list, position: Optional[int]) -> Optional[str]:
+        if position is None or position < 0 or position >= len(rows):
             return None
         value: str = rows[position]
         return value.strip() if value else None
@@ -489,6 +595,20 @@ class DKP(object):
         raw_value: Optional[str] = self._extract_value(rows, column)
         return self._convert_value(raw_value)
 
+    def _get_month_value(self, row: list, month: Optional[int], block: int) -> tuple:
+        """
+        Returns the parsed value of the monthly column and the name of the column.
+
+        :param row: The list of values in the current row.
+        :param month: The index of the month in `MONTH_NAMES` or None if the month is unknown.
+        :param block: The index of the block in `MONTH_BLOCKS`.
+        :return: A (value, column) tuple or (None, None) if the block has no column for the month.
+        """
+        if month is None or self.month_columns[month][block] is None:
+            return None, None
+        value: Optional[str] = self._extract_position(row, int(self.month_positions[month, block]))
+        return self._convert_value(value), self.month_columns[month][block]
+
     def get_content_in_table(
         self,
         index_month: int,
@@ -510,6 +630,7 @@ class DKP(object):
         :param metadata: Additional metadata extracted earlier in the process.
         :return: A dictionary containing parsed and processed data from the row.
         """
+        month: Optional[int] = MONTH_INDEXES.get(month_string)
         parsed_record: dict = {
             "client": self.parse_value(row, "client"),
             "description": self.parse_value(row, "description"),
@@ -523,30 +644,10 @@ class DKP(object):
             "month_string": month_string,
             "date": f"{metadata['year']}-{index_month:02d}-01",
 
-            "container_count": next((
-                self.parse_value(row, key)
-                for key, val in self.block_table_columns["natural_indicators_ktk"].items()
-                if month_string in val
-            ), None),
-            "teu": next((
-                self.parse_value(row, key)
-                for key, val in self.block_table_columns["natural_indicators_teus"].items()
-                if month_string in val
-            ), None),
-            "profit_plan_thousand_rub": self._check_numeric(
-                next((
-                    (self.parse_value(row, key), key)
-                    for key, val in self.block_table_columns["profit_plan"].items()
-                    if month_string in val
-                ), (None, None))
-            ),
-            "costs_plan_thousand_rub": self._check_numeric(
-                next((
-                    (self.parse_value(row, key), key)
-                    for key, val in self.block_table_columns["costs_plan"].items()
-                    if month_string in val
-                ), (None, None))
-            ),
+            "container_count": self._get_month_value(row, month, 0)[0],
+            "teu": self._get_month_value(row, month, 1)[0],
+            "profit_plan_thousand_rub": self._check_numeric(self._get_month_value(row, month, 2)),
+            "costs_plan_thousand_rub": self._check_numeric(self._get_month_value(row, month, 3)),
 
             "original_file_name": self.basename_filename,
             "original_file_parsed_on": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -612,87 +713,432 @@ class DKP(object):
         """
         error_message: str = f"{message} {self.basename_filename}"
         logger.error(error_message)
-        telegram(error_message)
+        telegram(error_message, self.basename_filename)
         sys.exit(error_code)
 
+    def _send_row_error(self, index: Union[int, Hashable], exception: Exception) -> None:
+        """
+        Reports an error in a row of the table and exits with the error code 5.
+
+        :param index: The index of the row in the sheet.
+        :param exception: The exception raised while processing the row.
+        :return: None
+        """
+        telegram(
+            f"Error code 5: Ошибка возникла в строке {index + 1}! "
+            f"Файл: {self.basename_filename}. Exception - {exception}",
+            self.basename_filename
+        )
+        logger.error(f"Error code 5: error processing in row {index + 1}! Exception - {exception}")
+        print(f"5_in_row_{index + 1}", file=sys.stderr)
+        sys.exit(5)
+
+    def _count_header_matches(self, values: np.ndarray, list_columns: List[str]) -> np.ndarray:
+        """
+        Counts for every row the number of cells that match the column names, like `_get_count_match_of_header`.
+
+        Cells are factorized, so every distinct value is cleaned and looked up only once,
+        and the counts are summed over the rows with NumPy.
+
+        :param values: The 2-D array of cells of the sheet.
+        :param list_columns: The list of column names to match with.
+        :return: A 1-D array with the count of matched columns for each row.
+        """
+        if not values.size:
+            return np.zeros(values.shape[0], dtype=int)
+        codes, uniques = pd.factorize(values.ravel())
+        columns: set = set(list_columns)
+        is_column: np.ndarray = np.array(
+            [self._remove_symbols_in_columns(value) in columns for value in uniques] + [False], dtype=bool
+        )
+        return is_column[codes].reshape(values.shape).sum(axis=1)
+
+    def _parse_column(self, rows: np.ndarray, column: str, cache: dict) -> list:
+        """
+        Parses all cells of the column at once, like `parse_value` does for a single row.
+
+        Parsed strings are memoized in `cache`, because values in the table repeat a lot.
+        If parsing a cell raises an exception, the cell is set to `_INVALID_CELL`,
+        so the row is later processed by `get_content_in_table`, which raises the same exception.
+
+        :param rows: The 2-D array of table rows.
+        :param column: The column name to parse.
+        :param cache: A dictionary of already parsed strings.
+        :return: A list with a parsed value for each row.
+        """
+        return self._parse_position(rows, self.dict_columns_position.get(column), cache)
+
+    def _parse_position(self, rows: np.ndarray, position: Optional[int], cache: dict) -> list:
+        if position is None or position < 0 or position >= rows.shape[1]:
+            return [None] * rows.shape[0]
+        parsed: list = []
+        for value in rows[:, position].tolist():
+            if isinstance(value, str):
+                if value not in cache:
+                    cache[value] = self._parse_cell(value)
+                parsed.append(cache[value])
+            else:
+                parsed.append(self._parse_cell(value))
+        return parsed
+
+    def _parse_cell(self, value: Optional[str]) -> Union[str, float, int, bool, None, object]:
+        try:
+            return self._convert_value(value.strip() if value else None)
+        except (IndexError, ValueError, TypeError, AttributeError):
+            return _INVALID_CELL
+
+    @staticmethod
+    def _to_numeric(values: list) -> list:
+        """
+        Converts the parsed values of a financial column to floats like `_check_numeric`.
+        Values that `_check_numeric` would reject are set to `_INVALID_CELL`.
+
+        :param values: The parsed values of the column.
+        :return: A list of floats.
+        """
+        numeric: list = []
+        for value in values:
+            try:
+                numeric.append(_INVALID_CELL if value is None or value is _INVALID_CELL else float(value))
+            except (ValueError, TypeError):
+                numeric.append(_INVALID_CELL)
+        return numeric
+
+    def _parse_table(self, rows: np.ndarray, indexes: list, metadata: dict, parsed_on: str) -> List[dict]:
+        """
+        Builds the monthly records for a block of table rows column by column.
+
+        Every needed column is parsed once for all rows instead of 12 times per row.
+        The records are the same as `get_content_in_table` returns. Rows with an invalid value, a non-numeric
+        financial value or inconsistent client/container size are passed to `get_content_in_table`,
+        so the error is reported exactly as before.
+
+        :param rows: The 2-D array of table rows.
+        :param indexes: The indexes of the rows in the sheet.
+        :param metadata: Metadata extracted from the filename.
+        :param parsed_on: The timestamp of parsing.
+        :return: A list of records, 12 records for each row.
+        """
+        count_rows: int = rows.shape[0]
+        cache: dict = {}
+        main_columns: List[str] = ["client", "description", "project", "cargo", "direction", "bay", "owner",
+                                   "container_size"]
+        main: Dict[str, list] = {column: self._parse_column(rows, column, cache) for column in main_columns}
+        tail_fields: List[str] = [
+            field
+            for block_key in self.block_table_columns if block_key not in NOT_COUNT_BLOCK
+            for field in self.block_table_columns[block_key]
+        ]
+        tail: Dict[str, list] = {field: self._parse_column(rows, field, cache) for field in tail_fields}
+        month_values: List[List[list]] = []
+        for month, keys in enumerate(self.month_columns):
+            month_values.append([])
+            for block, key in enumerate(keys):
+                if key is None:
+                    month_values[month].append([None] * count_rows)
+                    continue
+                column_position: int = int(self.month_positions[month, block])
+                values: list = tail[key] if key in tail else self._parse_position(rows, column_position, cache)
+                is_numeric: bool = MONTH_BLOCKS[block] in ("profit_plan", "costs_plan")
+                month_values[month].append(self._to_numeric(values) if is_numeric else values)
+
+        is_valid: np.ndarray = np.ones(count_rows, dtype=bool)
+        for values in [*main.values(), *tail.values(), *(column for blocks in month_values for column in blocks)]:
+            is_valid &= np.fromiter((value is not _INVALID_CELL for value in values), dtype=bool, count=count_rows)
+        for field in tail_fields:
+            for column in ("client", "container_size"):
+                if column in field:
+                    is_valid &= np.fromiter(
+                        ((val1 or None) == (val2 or None) for val1, val2 in zip(tail[field], main[column])),
+                        dtype=bool,
+                        count=count_rows
+                    )
+
+        list_data: List[dict] = []
+        for position in range(count_rows):
+            if not is_valid[position]:
+                try:
+                    list_data.extend(
+                        self.get_content_in_table(index_month, month_string, rows[position].tolist(), metadata)
+                        for index_month, month_string in enumerate(MONTH_NAMES, start=1)
+                    )
+                except (IndexError, ValueError, TypeError, AttributeError) as exception:
+                    self._send_row_error(indexes[position], exception)
+                continue
+            head: dict = {**metadata, **{column: main[column][position] for column in main_columns}}
+            fields: dict = {field: tail[field][position] for field in tail_fields}
+            for index_month, month_string in enumerate(MONTH_NAMES, start=1):
+                container_count, teu, profit_plan, costs_plan = (
+                    column[position] for column in month_values[index_month - 1]
+                )
+                list_data.append({
+                    **head,
+                    "month": index_month,
+                    "month_string": month_string,
+                    "date": f"{metadata['year']}-{index_month:02d}-01",
+                    "container_count": container_count,
+                    "teu": teu,
+                    "profit_plan_thousand_rub": profit_plan,
+                    "costs_plan_thousand_rub": costs_plan,
+                    "original_file_name": self.basename_filename,
+                    "original_file_parsed_on": parsed_on,
+                    "margin_plan_thousand_rub": (profit_plan or 0) - (costs_plan or 0),
+                    **fields
+                })
+        return list_data
+
     def parse_sheet(self, df: pd.DataFrame, max_df_columns: int, count_match_header: int = 7) -> None:
         """
         Parse a sheet of Excel file.
 
         This method takes a pandas DataFrame, representing a sheet of the Excel file,
-        and parses it, extracting metadata from the filename,
-        identifying the header and the table, and extracting content from the table.
+        and parses it with `parse_rows`.
+
+        :param df: The pandas DataFrame representing the sheet of the Excel file.
+        :param max_df_columns: The maximum number of columns in the DataFrame.
+        :param count_match_header: The coefficient to determine if a row is a header or not.
+        :return: None
+        """
+        self.parse_rows(zip(df.index.tolist(), df.to_numpy(dtype=object).tolist()), max_df_columns, count_match_header)
+
+    def parse_rows(
+        self,
+        rows: Iterable[Tuple[Hashable, list]],
+        max_df_columns: int,
+        count_match_header: int = 7
+    ) -> None:
+        """
+        Parse the rows of a sheet of Excel file.
+
+        This method takes the rows of the sheet, extracts metadata from the filename,
+        identifies the header and the table, and extracts content from the table.
         It then writes the extracted content to a JSON file.
 
+        Rows are consumed in chunks of `DKP_CHUNK_ROWS`, so the sheet is never held in memory at once,
+        and the records of every chunk are written to the file before the next chunk is read.
+        Rows are scanned one by one only to find the header and the blocks. Consecutive table rows
+        are collected and converted to records at once by `_parse_table`.
+
         If an error occurs during processing, it logs an error message with the error code 5,
         sends a message to Telegram with the error code and the filename,
         and then exits with the error code 5.
 
-        :param df: The pandas DataFrame representing the sheet of the Excel file.
-        :param max_df_columns: The maximum number of columns in the DataFrame.
+        :param rows: The (index, row) tuples of the sheet.
+        :param max_df_columns: The maximum number of columns in the sheet.
         :param count_match_header: The coefficient to determine if a row is a header or not.
         :return: None
         """
-        list_data: list = []
+        self.write_to_json(
+            self.profile.iterate("parse_sheet", self._iter_records(rows, max_df_columns, count_match_header))
+        )
+
+    def _iter_records(
+        self,
+        rows: Iterable[Tuple[Hashable, list]],
+        max_df_columns: int,
+        count_match_header: int
+    ) -> Iterator[dict]:
+        """
+        Yields the records of the table as soon as a chunk of its rows is parsed.
+        :param rows: The (index, row) tuples of the sheet.
+        :param max_df_columns: The maximum number of columns in the sheet.
+        :param count_match_header: The coefficient to determine if a row is a header or not.
+        :return: An iterator of records.
+        """
         metadata: dict = self.extract_metadata_from_filename()
+        parsed_on: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         list_columns: List[str] = self._get_list_columns()
-        index: Union[int, Hashable]
-        for index, row in df.iterrows():
-            row = list(row.to_dict().values())
-            if self._get_count_match_of_header(row, list_columns) >= count_match_header:
-                self.check_errors_in_header(row, max_df_columns)
-            elif not self.dict_columns_position["client"]:
-                self.get_columns_position(row, [0, len(row)], self.block_names, self.dict_block_position)
-            elif self._is_table_starting(row):
-                try:
-                    list_data.extend(
-                        self.get_content_in_table(index_month, month_string, row, metadata)
-                        for index_month, month_string in enumerate(MONTH_NAMES, start=1)
-                    )
-                except (IndexError, ValueError, TypeError, AttributeError) as exception:
-                    telegram(
-                        f"Error code 5: Ошибка возникла в строке {index + 1}! "
-                        f"Файл: {self.basename_filename}. Exception - {exception}"
-                    )
-                    logger.error(f"Error code 5: error processing in row {index + 1}! Exception - {exception}")
-                    print(f"5_in_row_{index + 1}", file=sys.stderr)
-                    sys.exit(5)
-        self.write_to_json(list_data)
+        table_rows: List[list] = []
+        table_indexes: list = []
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, DKP_CHUNK_ROWS)):
+            values: np.ndarray = np.array([row for _, row in chunk], dtype=object)
+            header_matches: np.ndarray = self._count_header_matches(values, list_columns)
+            for position, (index, row) in enumerate(chunk):
+                if header_matches[position] >= count_match_header:
+                    yield from self._parse_table_rows(table_rows, table_indexes, metadata, parsed_on)
+                    table_rows, table_indexes = [], []
+                    self.check_errors_in_header(row, max_df_columns)
+                elif not self.dict_columns_position["client"]:
+                    self.get_columns_position(row, [0, len(row)], self.block_names, self.dict_block_position)
+                elif self._is_table_starting(row):
+                    table_rows.append(row)
+                    table_indexes.append(index)
+            if len(table_rows) >= DKP_CHUNK_ROWS:
+                yield from self._parse_table_rows(table_rows, table_indexes, metadata, parsed_on)
+                table_rows, table_indexes = [], []
+        yield from self._parse_table_rows(table_rows, table_indexes, metadata, parsed_on)
+
+    def _parse_table_rows(self, rows: List[list], indexes: list, metadata: dict, parsed_on: str) -> List[dict]:
+        if not rows:
+            return []
+        return self._parse_table(np.array(rows, dtype=object), indexes, metadata, parsed_on)
 
-    def main(self) -> None:
+    @staticmethod
+    def _convert_cell(value: object) -> Optional[str]:
         """
-        The main method of the class.
+        Converts a cell read by openpyxl to the same string `pd.read_excel(dtype=str)` returns.
 
-        This method reads the Excel file given by the filename, extracts the needed sheets,
-        parses the sheet, and writes the extracted data to a JSON file.
+        Integral numbers lose the fractional part (1.0 -> "1"), while empty cells, Excel errors
+        and NA strings become None.
+
+        :param value: The value of the cell.
+        :return: The value as a string or None.
+        """
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return None if value in EMPTY_CELL_VALUES else value
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value)
+
+    @staticmethod
+    def _get_sheet_width(worksheet: ReadOnlyWorksheet) -> int:
+        """
+        Returns the number of columns up to the last non-empty cell, like the width of the DataFrame
+        returned by `pd.read_excel`. The sheet is streamed, so nothing but the width is kept.
+        It is a separate pass over the sheet: the widths are needed before the sheets are joined.
+
+        :param worksheet: The read-only worksheet.
+        :return: The width of the sheet.
+        """
+        width: int = 0
+        for values in worksheet.iter_rows(values_only=True):
+            for position in range(len(values), width, -1):
+                if values[position - 1] is not None and values[position - 1] != "":
+                    width = position
+                    break
+        return width
+
+    def _iter_sheet_rows(self, worksheet: ReadOnlyWorksheet, width: int) -> Iterator[Tuple[int, list]]:
+        """
+        Streams the non-empty rows of the sheet, padded to `width`.
+        :param worksheet: The read-only worksheet.
+        :param width: The width of the sheet.
+        :return: An iterator of (index, row) tuples, where index is the zero-based row number in the sheet.
+        """
+        for index, values in enumerate(worksheet.iter_rows(values_only=True)):
+            row: list = [self._convert_cell(value) for value in values[:width]]
+            if any(value is not None for value in row):
+                yield index, row + [None] * (width - len(row))
+
+    def _merge_sheet_rows(self, worksheets: List[Tuple[ReadOnlyWorksheet, int]]) -> Iterator[Tuple[int, list]]:
+        """
+        Joins the rows of the sheets side by side by the row number, like `pd.concat(axis=1)` does.
+        A sheet without the row contributes empty cells.
+
+        :param worksheets: The (worksheet, width) tuples in the order of the columns.
+        :return: An iterator of (index, row) tuples.
+        """
+        iterators: List[Iterator[Tuple[int, list]]] = [
+            self._iter_sheet_rows(worksheet, width) for worksheet, width in worksheets
+        ]
+        current: list = [next(iterator, None) for iterator in iterators]
+        while any(item is not None for item in current):
+            index: int = min(item[0] for item in current if item is not None)
+            row: list = []
+            for position, (item, (_, width)) in enumerate(zip(current, worksheets)):
+                if item is not None and item[0] == index:
+                    row.extend(item[1])
+                    current[position] = next(iterators[position], None)
+                else:
+                    row.extend([None] * width)
+            yield index, row
+
+    def parse_workbook(self) -> None:
+        """
+        Streams the needed sheets of the workbook with openpyxl in read-only mode and parses them.
+
+        Every sheet is read twice: the first pass finds its width, the second one feeds the rows
+        to `parse_rows`. Only the current rows are kept in memory, which matters for large workbooks,
+        but the second pass makes it slower than reading the sheets with pandas.
+        Reading the rows is measured as a part of the `parse_sheet` stage.
 
-        If an error occurs during processing, it logs an error message,
-        sends a message to Telegram with the error message,
-        and exits with the error code 6.
         :return: None
         """
+        with self.profile.stage("read_excel"):
+            workbook: Workbook = openpyxl.load_workbook(
+                self.filename, read_only=True, data_only=True, keep_links=False
+            )
         try:
-            sheets: list = pd.ExcelFile(self.filename).sheet_names
-            logger.info(f"Sheets is {sheets}")
-            needed_sheets: list = [sheet for sheet in sheets if sheet in self.sheets_name]
+            logger.info(f"Sheets is {workbook.sheetnames}")
+            needed_sheets: list = [sheet for sheet in workbook.sheetnames if sheet in self.sheets_name]
             if len(needed_sheets) > 3:
                 raise ValueError(f"Нужных листов из SHEETS_NAME больше нужного: {needed_sheets}")
-            replace_dict: dict = {np.nan: None, "NaT": None}
+            if not needed_sheets:
+                raise ValueError(f"Нужные листы из SHEETS_NAME не найдены: {workbook.sheetnames}")
+            worksheets: List[Tuple[ReadOnlyWorksheet, int]] = []
+            with self.profile.stage("read_excel"):
+                for sheet in needed_sheets:
+                    worksheet: ReadOnlyWorksheet = workbook[sheet]
+                    worksheet.reset_dimensions()
+                    worksheets.append((worksheet, self._get_sheet_width(worksheet)))
+            worksheets.sort(key=lambda item: item[1], reverse=True)  # Сортируем листы по количеству столбцов
+            self.parse_rows(self._merge_sheet_rows(worksheets), worksheets[0][1])
+        finally:
+            workbook.close()
+
+    def parse_dataframe(self) -> None:
+        """
+        Reads the needed sheets of the workbook with pandas and parses the merged DataFrame.
+        :return: None
+        """
+        replace_dict: dict = {np.nan: None, "NaT": None}
+        with self.profile.stage("read_excel"), pd.ExcelFile(self.filename) as xls:
+            logger.info(f"Sheets is {xls.sheet_names}")
+            needed_sheets: list = [sheet for sheet in xls.sheet_names if sheet in self.sheets_name]
+            if len(needed_sheets) > 3:
+                raise ValueError(f"Нужных листов из SHEETS_NAME больше нужного: {needed_sheets}")
+            sheets: Dict[str, DataFrame] = xls.parse(sheet_name=needed_sheets, dtype=str, header=None)
+        with self.profile.stage("merge_sheets") as stage:
             dfs: List[DataFrame] = [
-                pd.read_excel(self.filename, sheet_name=sheet, dtype=str, header=None)
-                .dropna(how="all")
-                .replace(replace_dict)
-                for sheet in needed_sheets
+                sheets[sheet].dropna(how="all").replace(replace_dict) for sheet in needed_sheets
             ]
             dfs.sort(key=lambda df: df.shape[1], reverse=True)  # Сортируем DataFrames по количеству столбцов (убывание)
             merged_df: DataFrame = pd.concat(dfs, axis=1).replace(replace_dict)
             merged_df.columns = range(merged_df.shape[1])  # Индексация столбцов для последовательности
-            self.parse_sheet(merged_df, dfs[0].shape[1])
-        except Exception as exception:
-            logger.error(f"Ошибка при чтении файла {self.basename_filename}: {exception}")
-            telegram(f'Error code 6: Ошибка при обработке файла! Файл: {self.basename_filename}! Ошибка: {exception}')
-            print("unknown", file=sys.stderr)
-            sys.exit(6)
+            stage.add_rows(len(merged_df))
+        self.parse_sheet(merged_df, dfs[0].shape[1])
+
+    def main(self) -> None:
+        """
+        The main method of the class.
+
+        This method reads the Excel file given by the filename, extracts the needed sheets,
+        parses the sheet, and writes the extracted data to a JSON file.
+        The workbook is opened and unzipped once, and only the sheets from `sheets_name` are read.
+        With DKP_READER=streaming `.xlsx` files are streamed row by row (see `parse_workbook`).
+        The time and memory of every stage are written to the log as one line (see `FileProfile`).
+
+        If an error occurs during processing, it logs an error message,
+        sends a message to Telegram with the error message,
+        and exits with the error code 6.
+        :return: None
+        """
+        with self.profile:
+            try:
+                if DKP_READER == "streaming" and self.filename.lower().endswith(STREAMING_EXTENSIONS):
+                    self.parse_workbook()
+                else:
+                    self.parse_dataframe()
+            except Exception as exception:
+                logger.error(f"Ошибка при чтении файла {self.basename_filename}: {exception}")
+                telegram(
+                    f'Error code 6: Ошибка при обработке файла! Файл: {self.basename_filename}! Ошибка: {exception}',
+                    self.basename_filename
+                )
+                print("unknown", file=sys.stderr)
+                sys.exit(6)
+
+
+reference_cache: ReferenceCache = ReferenceCache(
+    fetch=lambda: DKP._get_reference(),
+    probe=lambda: DKP._get_reference_version(),
+    build=lambda reference_dkp: DKP._build_reference(reference_dkp),
+    ttl=REFERENCE_DKP_TTL,
+    snapshot_path=REFERENCE_DKP_SNAPSHOT
+)
 
 
 if __name__ == "__main__":
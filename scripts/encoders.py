@@ -0,0 +1,99 @@
+import os
+import re
+import json
+import numpy as np
+from datetime import date, time
+from typing import Any, Dict, Optional, Type
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INDENT_PATTERN: re.Pattern = re.compile(r"\n( +)")
+
+
+def default(obj: Any) -> Any:
+    """
+    Converts the values which JSON can't represent: NumPy scalars, dates and times, objects with attributes.
+    :param obj: The value.
+    :return: The value JSON can represent.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibEncoder(object):
+    name: str = "json"
+
+    def __init__(self, indent: Optional[int] = None):
+        """
+        Encodes values with the standard `json` module, like `json.dumps(obj, ensure_ascii=False, indent=indent)`.
+        :param indent: The indent of the nested values (a compact line if None).
+        """
+        self.indent: Optional[int] = indent
+
+    def encode(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=self.indent, default=default)
+
+
+class OrjsonEncoder(StdlibEncoder):
+    """
+    Encodes values with orjson, which is an order of magnitude faster than the standard `json` module.
+
+    The layout is the same as the one of `StdlibEncoder`, except that the compact line has no spaces after separators,
+    some floats are written in another notation (`0.00001` instead of `1e-05`, `1e16` instead of `1e+16`) and NaN
+    is written as null.
+    Values orjson doesn't support (e.g. integers wider than 64 bits) are encoded by the standard `json` module.
+    """
+    name: str = "orjson"
+
+    def __init__(self, indent: Optional[int] = None):
+        super().__init__(indent)
+        self.option: int = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            self.option |= orjson.OPT_INDENT_2
+
+    def encode(self, obj: Any) -> str:
+        try:
+            encoded: str = orjson.dumps(obj, default=default, option=self.option).decode()
+        except orjson.JSONEncodeError:
+            return super().encode(obj)
+        if not self.indent or self.indent == 2:
+            return encoded
+        if "\n   " not in encoded:  # A flat object, all lines have the indent of the first level
+            return encoded.replace("\n  ", f"\n{' ' * self.indent}")
+        return INDENT_PATTERN.sub(lambda match: "\n" + " " * (len(match.group(1)) // 2 * self.indent), encoded)
+
+
+JSON_BACKENDS: Dict[str, Type[StdlibEncoder]] = {
+    "json": StdlibEncoder,
+    "orjson": OrjsonEncoder
+}
+
+
+def get_json_backend() -> str:
+    """
+    Returns the JSON library from DATACORE_JSON_BACKEND (orjson if it is installed by default).
+    :return: The name of the JSON library.
+    """
+    backend: str = os.environ.get("DATACORE_JSON_BACKEND") or ("orjson" if orjson is not None else "json")
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend {backend}. Available backends - {list(JSON_BACKENDS)}")
+    if backend == "orjson" and orjson is None:
+        raise ImportError("orjson is required for DATACORE_JSON_BACKEND=orjson")
+    return backend
+
+
+def create_encoder(indent: Optional[int] = None) -> StdlibEncoder:
+    """
+    Creates the encoder of the selected JSON library.
+    :param indent: The indent of the nested values (a compact line if None).
+    :return: The encoder.
+    """
+    return JSON_BACKENDS[get_json_backend()](indent)
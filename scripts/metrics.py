@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import fcntl
+import atexit
+import tempfile
+import threading
+import contextlib
+from bisect import bisect_left
+from scripts.app_logger import get_logger
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+METRICS_FILE: Optional[str] = os.environ.get("DATACORE_METRICS_FILE")
+METRICS_PORT: int = int(os.environ.get("DATACORE_METRICS_PORT") or 0)
+METRICS_HOST: str = os.environ.get("DATACORE_METRICS_HOST", "127.0.0.1")
+METRICS_STATE: str = os.environ.get(
+    "DATACORE_METRICS_STATE",
+    f"{os.environ.get('XL_IDP_ROOT_DATACORE', '.')}/cache/metrics.json"
+)
+METRICS_FLUSH_INTERVAL: float = float(os.environ.get("DATACORE_METRICS_FLUSH_INTERVAL", 15))
+BUCKETS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRICS: Dict[str, Tuple[str, str]] = {
+    "datacore_files_total": ("counter", "Files processed by the daemon by pipeline and exit code."),
+    "datacore_files_skipped_total": ("counter", "Files identical to the converted ones, moved without conversion."),
+    "datacore_file_duration_seconds": ("histogram", "Time of the conversion of a file by pipeline."),
+    "datacore_records_total": ("counter", "Records written by converter."),
+    "datacore_stage_duration_seconds": ("histogram", "Time of the converter stages without the nested stages."),
+    "datacore_queue_depth": ("gauge", "Files waiting for a worker by pipeline."),
+    "datacore_running_files": ("gauge", "Files being converted by pipeline."),
+    "datacore_reference_cache_total": ("counter", "Lookups of the reference_dkp cache by result."),
+}
+
+
+def is_metrics_enabled() -> bool:
+    return bool(METRICS_FILE or METRICS_PORT)
+
+
+def get_labels_key(labels: Dict[str, str]) -> str:
+    return json.dumps(labels, ensure_ascii=False, sort_keys=True)
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(key: str, **extra: str) -> str:
+    labels: Dict[str, str] = {**json.loads(key), **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+def create_state() -> dict:
+    return {"counter": {}, "gauge": {}, "histogram": {}}
+
+
+class MetricsRegistry(object):
+    def __init__(self, state_path: str = METRICS_STATE):
+        """
+        Collects the metrics of the process and adds them to the state shared by the daemon and its workers.
+
+        The changes are kept in memory and added to the JSON state file by `flush` (after every file and
+        periodically in the daemon) under an exclusive lock. After that the state is written in the Prometheus
+        text format to DATACORE_METRICS_FILE (for the textfile collector of node_exporter). The daemon also serves
+        the state on DATACORE_METRICS_PORT. The metrics are collected only if one of them is set.
+
+        :param state_path: The path to the state file.
+        """
+        self.state_path: str = state_path
+        self.lock: threading.Lock = threading.Lock()
+        self.pending: dict = create_state()
+        self.flushed_at: float = time.monotonic()
+        self.pid: int = os.getpid()
+
+    def _reset_after_fork(self) -> None:
+        if self.pid != os.getpid():  # The changes of the parent process are flushed by the parent
+            self.lock = threading.Lock()
+            self.pending = create_state()
+            self.pid = os.getpid()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increases the counter.
+        :param name: The name of the counter.
+        :param value: The increment.
+        :param labels: The labels of the counter.
+        :return: None
+        """
+        if not is_metrics_enabled():
+            return
+        self._reset_after_fork()
+        key: str = get_labels_key(labels)
+        with self.lock:
+            counters: dict = self.pending["counter"].setdefault(name, {})
+            counters[key] = counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        Sets the value of the gauge.
+        :param name: The name of the gauge.
+        :param value: The value.
+        :param labels: The labels of the gauge.
+        :return: None
+        """
+        if not is_metrics_enabled():
+            return
+        self._reset_after_fork()
+        key: str = get_labels_key(labels)
+        with self.lock:
+            self.pending["gauge"].setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Adds the value to the histogram.
+        :param name: The name of the histogram.
+        :param value: The observed value (e.g. seconds).
+        :param labels: The labels of the histogram.
+        :return: None
+        """
+        if not is_metrics_enabled():
+            return
+        self._reset_after_fork()
+        key: str = get_labels_key(labels)
+        with self.lock:
+            histogram: dict = self.pending["histogram"].setdefault(name, {}).setdefault(
+                key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+            )
+            histogram["buckets"][bisect_left(BUCKETS, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def load(self) -> dict:
+        """
+        Returns the shared state of the metrics.
+        :return: The state.
+        """
+        with contextlib.suppress(OSError, ValueError):
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        return create_state()
+
+    @staticmethod
+    def _merge(state: dict, pending: dict) -> None:
+        for name, series in pending["counter"].items():
+            counters: dict = state["counter"].setdefault(name, {})
+            for key, value in series.items():
+                counters[key] = counters.get(key, 0) + value
+        for name, series in pending["gauge"].items():
+            state["gauge"].setdefault(name, {}).update(series)
+        for name, series in pending["histogram"].items():
+            histograms: dict = state["histogram"].setdefault(name, {})
+            for key, histogram in series.items():
+                total: dict = histograms.setdefault(
+                    key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+                )
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+                total["sum"] += histogram["sum"]
+                total["count"] += histogram["count"]
+
+    def flush(self, force: bool = True) -> None:
+        """
+        Adds the changes of the process to the shared state and rewrites DATACORE_METRICS_FILE.
+        :param force: Flush even if less than DATACORE_METRICS_FLUSH_INTERVAL seconds passed since the last flush.
+        :return: None
+        """
+        if not is_metrics_enabled() or not force and time.monotonic() - self.flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        self._reset_after_fork()
+        with self.lock:
+            pending, self.pending = self.pending, create_state()
+        self.flushed_at = time.monotonic()
+        folder: str = os.path.dirname(self.state_path) or "."
+        try:
+            os.makedirs(folder, exist_ok=True)
+            with open(f"{self.state_path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                state: dict = self.load()
+                self._merge(state, pending)
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, delete=False) as f:
+                    json.dump(state, f, ensure_ascii=False)
+                os.replace(f.name, self.state_path)
+                if METRICS_FILE:
+                    write_textfile(METRICS_FILE, render(state))
+        except OSError as exception:
+            logger.warning(f"Failed to write the metrics {self.state_path}: {exception}")
+
+
+def render(state: dict) -> str:
+    """
+    Returns the metrics in the Prometheus text format.
+    :param state: The state of the metrics.
+    :return: The text of the metrics.
+    """
+    lines: list = []
+    for name, (metric_type, description) in METRICS.items():
+        series: dict = state[metric_type].get(name)
+        if not series:
+            continue
+        lines.extend([f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"])
+        for key, value in sorted(series.items()):
+            if metric_type != "histogram":
+                lines.append(f"{name}{format_labels(key)} {value}")
+                continue
+            cumulative: int = 0
+            for bound, count in zip([*map(str, BUCKETS), "+Inf"], value["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(key, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(key)} {round(value['sum'], 6)}")
+            lines.append(f"{name}_count{format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, text: str) -> None:
+    folder: str = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, suffix=".tmp", delete=False) as f:
+        f.write(text)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        metrics.flush()
+        body: bytes = render(metrics.load()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_http_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """
+    Serves the metrics on http://host:port/metrics in a background thread.
+    :param host: The address to listen on (only the local one by default).
+    :param port: The port.
+    :return: The server.
+    """
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics are served on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+metrics: MetricsRegistry = MetricsRegistry()
+atexit.register(metrics.flush)
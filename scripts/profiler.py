@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import time
+import fcntl
+import resource
+import tempfile
+import contextlib
+from scripts.metrics import metrics
+from scripts.app_logger import get_logger
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+T = TypeVar("T")
+PEAK_RSS_PATTERN: re.Pattern = re.compile(r"VmHWM:\s+(\d+) kB")
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak resident memory of the process in kB since the last `reset_peak_rss`
+    (since the start of the process if the peak can't be reset).
+    :return: The peak resident memory in kB.
+    """
+    with contextlib.suppress(OSError, AttributeError):
+        with open("/proc/self/status") as f:
+            return int(PEAK_RSS_PATTERN.search(f.read()).group(1))
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss() -> None:
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+class Stage(object):
+    def __init__(self, name: str):
+        """
+        The totals of a stage of the file processing. A stage may be entered several times (e.g. for every sheet),
+        its totals are summed.
+        :param name: The name of the stage.
+        """
+        self.name: str = name
+        self.calls: int = 0
+        self.wall: float = 0.0
+        self.cpu: float = 0.0
+        self.children_wall: float = 0.0
+        self.children_cpu: float = 0.0
+        self.rows: Optional[int] = None
+        self.peak_rss: Optional[int] = None
+
+    def add_rows(self, rows: int) -> None:
+        self.rows = (self.rows or 0) + rows
+
+    def to_dict(self) -> dict:
+        """
+        Returns the totals of the stage. The time of the nested stages is not included.
+        :return: A dictionary with the number of calls, the wall and CPU seconds, the rows and the peak memory in MiB.
+        """
+        return {
+            "calls": self.calls,
+            "wall": round(self.wall - self.children_wall, 4),
+            "cpu": round(self.cpu - self.children_cpu, 4),
+            "rows": self.rows,
+            "peak_rss_mb": None if self.peak_rss is None else round(self.peak_rss / 1024, 1)
+        }
+
+
+class FileProfile(object):
+    def __init__(self, converter: str, file_name: str):
+        """
+        Measures the stages of the processing of a file: the wall time, the CPU time, the rows processed
+        and the peak resident memory.
+
+        The profile is used as a context manager around the whole processing of the file. On exit it writes
+        one JSON line with the totals of the file and of every stage to the log and, if DATACORE_PROFILE_STATS
+        is set, adds them to the statistics of all runs in that file.
+
+        :param converter: The name of the converter.
+        :param file_name: The name of the processed file.
+        """
+        self.converter: str = converter
+        self.file_name: str = file_name
+        self.stages: Dict[str, Stage] = {}
+        self.stack: List[Stage] = []
+        self.total: Stage = Stage("total")
+
+    def __enter__(self) -> "FileProfile":
+        self.stack = []
+        self.started: Tuple[float, float] = self._start()
+        self.stack.append(self.total)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stack.pop()
+        self._stop(self.total, *self.started)
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, SystemExit):
+            status = f"exit {exc_val.code}"
+        else:
+            status = exc_type.__name__
+        profile: dict = self.to_dict(status)
+        logger.info(f"Profile: {json.dumps(profile, ensure_ascii=False)}")
+        self.add_to_metrics(profile)
+        if path := os.environ.get("DATACORE_PROFILE_STATS"):
+            add_to_statistics(path, profile)
+
+    def add_to_metrics(self, profile: dict) -> None:
+        """
+        Adds the time of the stages and the number of the written records to the metrics.
+        :param profile: The profile from `to_dict`.
+        :return: None
+        """
+        for name, stage in profile["stages"].items():
+            metrics.observe("datacore_stage_duration_seconds", stage["wall"], converter=self.converter, stage=name)
+        if written := profile["stages"].get("write", {}).get("rows"):
+            metrics.inc("datacore_records_total", written, converter=self.converter)
+
+    def _fold_peak_rss(self, stages: List[Stage]) -> None:
+        peak_rss: int = get_peak_rss()
+        for stage in stages:
+            stage.peak_rss = max(stage.peak_rss or 0, peak_rss)
+
+    def _start(self) -> Tuple[float, float]:
+        self._fold_peak_rss(self.stack)
+        reset_peak_rss()
+        return time.perf_counter(), time.process_time()
+
+    def _stop(self, stage: Stage, wall_started: float, cpu_started: float) -> None:
+        wall: float = time.perf_counter() - wall_started
+        cpu: float = time.process_time() - cpu_started
+        self._fold_peak_rss([*self.stack, stage])
+        stage.calls += 1
+        self._add_time(stage, wall, cpu)
+
+    def _add_time(self, stage: Stage, wall: float, cpu: float) -> None:
+        stage.wall += wall
+        stage.cpu += cpu
+        if self.stack:
+            self.stack[-1].children_wall += wall
+            self.stack[-1].children_cpu += cpu
+
+    def get_stage(self, name: str) -> Stage:
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Stage]:
+        """
+        Measures the block as the stage. The time of the nested stages is counted only in them.
+        :param name: The name of the stage.
+        :param rows: The number of the processed rows (can also be added to the yielded stage).
+        :return: The stage.
+        """
+        stage: Stage = self.get_stage(name)
+        if rows is not None:
+            stage.add_rows(rows)
+        started: Tuple[float, float] = self._start()
+        self.stack.append(stage)
+        try:
+            yield stage
+        finally:
+            self.stack.pop()
+            self._stop(stage, *started)
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Measures producing the items of a lazy iterable (e.g. the records parsed while they are written)
+        as the stage, excluding the time the consumer spends between the items. Every item counts as a row.
+        The peak memory is not measured for such a stage.
+        :param name: The name of the stage.
+        :param iterable: The iterable.
+        :return: The iterator over the same items.
+        """
+        stage: Stage = self.get_stage(name)
+        stage.rows = stage.rows or 0
+        stage.calls += 1
+        iterator: Iterator[T] = iter(iterable)
+        while True:
+            wall_started: float = time.perf_counter()
+            cpu_started: float = time.process_time()
+            try:
+                item: T = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._add_time(stage, time.perf_counter() - wall_started, time.process_time() - cpu_started)
+            stage.rows += 1
+            yield item
+
+    def to_dict(self, status: str) -> dict:
+        """
+        Returns the totals of the file and of its stages.
+        :param status: The result of the processing.
+        :return: A dictionary ready to be written as JSON.
+        """
+        return {
+            "converter": self.converter,
+            "file": self.file_name,
+            "status": status,
+            "wall": round(self.total.wall, 4),
+            "cpu": round(self.total.cpu, 4),
+            "peak_rss_mb": round(self.total.peak_rss / 1024, 1),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()}
+        }
+
+
+def add_to_statistics(path: str, profile: dict) -> None:
+    """
+    Adds the profile of a file to the statistics of all runs: the number of files and the totals
+    and maximums of every stage by converter. The statistics file is shared by the worker processes,
+    it is updated under an exclusive lock and replaced atomically.
+    :param path: The path to the statistics file.
+    :param profile: The profile from `FileProfile.to_dict`.
+    :return: None
+    """
+    folder: str = os.path.dirname(path) or "."
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            statistics: dict = {}
+            with contextlib.suppress(OSError, ValueError):
+                with open(path, encoding="utf-8") as f:
+                    statistics = json.load(f)
+            converter: dict = statistics.setdefault(profile["converter"], {"files": 0, "errors": 0, "stages": {}})
+            converter["files"] += 1
+            converter["errors"] += profile["status"] != "ok"
+            for name, stage in {"total": profile, **profile["stages"]}.items():
+                totals: dict = converter["stages"].setdefault(
+                    name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "rows": 0, "max_wall": 0.0, "max_peak_rss_mb": 0.0}
+                )
+                totals["calls"] += stage.get("calls", 1)
+                totals["wall"] = round(totals["wall"] + stage["wall"], 4)
+                totals["cpu"] = round(totals["cpu"] + stage["cpu"], 4)
+                totals["rows"] += stage.get("rows") or 0
+                totals["max_wall"] = max(totals["max_wall"], stage["wall"])
+                totals["max_peak_rss_mb"] = max(totals["max_peak_rss_mb"], stage["peak_rss_mb"] or 0.0)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, delete=False) as f:
+                json.dump(statistics, f, ensure_ascii=False, indent=4)
+            os.replace(f.name, path)
+    except OSError as exception:
+        logger.warning(f"Failed to update the profile statistics {path}: {exception}")
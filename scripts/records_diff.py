@@ -0,0 +1,120 @@
+import re
+import fcntl
+import pickle
+import tempfile
+from scripts.settings_dkp import *
+from scripts.app_logger import get_logger
+from typing import Dict, IO, Iterable, Iterator, Optional, Tuple
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+CHANGE_INSERT: str = "insert"
+CHANGE_UPDATE: str = "update"
+CHANGE_DELETE: str = "delete"
+PARTITION_NAME_PATTERN: re.Pattern = re.compile(r"[^\w.-]")
+
+
+class RecordsDiff(object):
+    def __init__(
+        self,
+        folder: str,
+        key_fields: Tuple[str, ...],
+        partition_fields: Tuple[str, ...],
+        ignored_fields: Tuple[str, ...] = ()
+    ):
+        """
+        Compares the records of a file with the records of the previous file of the same partition
+        (e.g. the department and the year of a DKP file) and yields only the changes.
+
+        Every yielded record has the `change_type` field: "insert" and "update" records are the new ones,
+        "delete" records are the previous ones which are absent in the new file. Records with the same key
+        are matched in the order they appear in the files.
+
+        The records of the partition are kept in `folder` and replaced only when the context is left without
+        an error, i.e. after the changes are written. Files of the same partition are compared one at a time.
+
+        :param folder: The folder with the records of the previous files.
+        :param key_fields: The fields which identify a record.
+        :param partition_fields: The fields whose values are the same in all records of a file.
+        :param ignored_fields: The fields which don't count as a change (e.g. the name of the file).
+        """
+        self.folder: str = folder
+        self.key_fields: Tuple[str, ...] = key_fields
+        self.partition_fields: Tuple[str, ...] = partition_fields
+        self.ignored_fields: Tuple[str, ...] = ignored_fields
+        self.path: Optional[str] = None
+        self.lock: Optional[IO] = None
+        self.records: Dict[tuple, dict] = {}
+        self.count: int = 0
+        self.changes: Dict[str, int] = {CHANGE_INSERT: 0, CHANGE_UPDATE: 0, CHANGE_DELETE: 0}
+
+    def __enter__(self) -> "RecordsDiff":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if exc_type is None and self.path:
+                self.save()
+        finally:
+            if self.lock:
+                self.lock.close()
+                self.lock = None
+
+    def get_path(self, record: dict) -> str:
+        partition: str = "_".join(str(record.get(field)) for field in self.partition_fields)
+        return os.path.join(self.folder, f"{PARTITION_NAME_PATTERN.sub('_', partition)}.pickle")
+
+    def _load(self) -> Dict[tuple, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except Exception as exception:
+            logger.warning(f"Failed to read the previous records {self.path}: {exception}. All records are new")
+            return {}
+
+    def _get_content(self, record: dict) -> dict:
+        return {field: value for field, value in record.items() if field not in self.ignored_fields}
+
+    def diff(self, records: Iterable[dict]) -> Iterator[dict]:
+        """
+        Yields the changes between the previous records of the partition and the given ones.
+        :param records: The records of the new file.
+        :return: An iterator over the changed records.
+        """
+        previous: Dict[tuple, dict] = {}
+        occurrences: Dict[tuple, int] = {}
+        for record in records:
+            if self.path is None:
+                self.path = self.get_path(record)
+                os.makedirs(self.folder, exist_ok=True)
+                self.lock = open(f"{self.path}.lock", "w")
+                fcntl.flock(self.lock, fcntl.LOCK_EX)
+                previous = self._load()
+            key: tuple = tuple(record.get(field) for field in self.key_fields)
+            occurrences[key] = occurrences.get(key, -1) + 1
+            key += (occurrences[key],)
+            self.records[key] = record
+            self.count += 1
+            previous_record: Optional[dict] = previous.pop(key, None)
+            if previous_record is None:
+                yield self._mark(record, CHANGE_INSERT)
+            elif self._get_content(previous_record) != self._get_content(record):
+                yield self._mark(record, CHANGE_UPDATE)
+        for previous_record in previous.values():
+            yield self._mark(previous_record, CHANGE_DELETE)
+
+    def _mark(self, record: dict, change_type: str) -> dict:
+        self.changes[change_type] += 1
+        return {**record, "change_type": change_type}
+
+    def save(self) -> None:
+        """
+        Replaces the previous records of the partition with the new ones atomically.
+        :return: None
+        """
+        with tempfile.NamedTemporaryFile("wb", dir=self.folder, delete=False) as f:
+            pickle.dump(self.records, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self.path)
+        logger.info(f"{self.count} records are compared with {self.path}. Changes - {self.changes}")
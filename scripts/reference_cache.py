@@ -0,0 +1,136 @@
+import time
+import pickle
+import tempfile
+from scripts.settings_dkp import *
+from scripts.metrics import metrics
+from scripts.app_logger import get_logger
+from typing import Any, Callable, Hashable, Optional, Sequence, Tuple
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+
+class ReferenceCache(object):
+    def __init__(
+        self,
+        fetch: Callable[[], Sequence],
+        probe: Callable[[], Hashable],
+        build: Callable[[Sequence], Any],
+        ttl: float,
+        snapshot_path: Optional[str] = None
+    ):
+        """
+        Keeps a reference table built once and reloads it only when the table changes.
+
+        The cheap `probe` (e.g. the row count and checksum of the table) is called at most once per `ttl` seconds,
+        both for `get` and for `get_version`.
+        The full `fetch` and `build` are called only when the probe returns a new version.
+        The built reference is also stored in `snapshot_path`, so a freshly started process
+        doesn't fetch the table if it hasn't changed since the snapshot was written.
+
+        :param fetch: Returns all rows of the reference table.
+        :param probe: Returns the version of the reference table.
+        :param build: Builds the structures used by the parser from the rows.
+        :param ttl: Seconds during which the cached reference is used without probing.
+        :param snapshot_path: The path to the on-disk snapshot (disabled if None).
+        """
+        self.fetch: Callable[[], Sequence] = fetch
+        self.probe: Callable[[], Hashable] = probe
+        self.build: Callable[[Sequence], Any] = build
+        self.ttl: float = ttl
+        self.snapshot_path: Optional[str] = snapshot_path
+        self.entry: Optional[Tuple[Hashable, Any]] = None
+        self.probed: Optional[Hashable] = None
+        self.checked_at: Optional[float] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def version(self) -> Optional[Hashable]:
+        return self.entry[0] if self.entry else None
+
+    def _is_fresh(self, now: float) -> bool:
+        return self.probed is not None and self.checked_at is not None and now - self.checked_at < self.ttl
+
+    def get_version(self) -> Hashable:
+        """
+        Returns the version of the reference table, probing it at most once per `ttl` seconds.
+        :return: The version of the reference table.
+        """
+        now: float = time.monotonic()
+        if not self._is_fresh(now):
+            self.probed = self.probe()
+            self.checked_at = now
+        return self.probed
+
+    def get(self) -> Any:
+        """
+        Returns the built reference, reloading it if the reference table has changed.
+
+        If the version can't be probed, the reference is fetched and built without caching,
+        because it is unknown whether the cached one is still valid.
+
+        :return: The built reference.
+        """
+        now: float = time.monotonic()
+        if self._is_fresh(now):
+            version: Hashable = self.probed
+            if self.entry and self.entry[0] == version:
+                self.hits += 1
+                metrics.inc("datacore_reference_cache_total", result="hit")
+                return self.entry[1]
+        else:
+            try:
+                version = self.get_version()
+            except Exception as exception:
+                logger.warning(f"Failed to get the version of the reference: {exception}. The cache is bypassed")
+                self.misses += 1
+                metrics.inc("datacore_reference_cache_total", result="bypass")
+                return self.build(self.fetch())
+        if self.entry and self.entry[0] == version:
+            self.hits += 1
+            metrics.inc("datacore_reference_cache_total", result="probe_hit")
+            return self.entry[1]
+        if (snapshot := self._load_snapshot()) and snapshot[0] == version:
+            logger.info(f"Reference is loaded from the snapshot {self.snapshot_path}. Version - {version}")
+            self.hits += 1
+            metrics.inc("datacore_reference_cache_total", result="snapshot")
+            self.entry = snapshot
+            return snapshot[1]
+        logger.info(f"Reference has changed. Version - {version}")
+        self.misses += 1
+        metrics.inc("datacore_reference_cache_total", result="miss")
+        self.entry = (version, self.build(self.fetch()))
+        self._save_snapshot(self.entry)
+        return self.entry[1]
+
+    def invalidate(self) -> None:
+        self.entry = None
+        self.probed = None
+        self.checked_at = None
+
+    def _load_snapshot(self) -> Optional[Tuple[Hashable, Any]]:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as exception:
+            logger.warning(f"Failed to read the snapshot {self.snapshot_path}: {exception}")
+            return None
+
+    def _save_snapshot(self, entry: Tuple[Hashable, Any]) -> None:
+        """
+        Writes the snapshot atomically, so concurrent workers never read a partially written file.
+        :param entry: The version and the built reference.
+        :return: None
+        """
+        if not self.snapshot_path:
+            return
+        try:
+            folder: str = os.path.dirname(self.snapshot_path) or "."
+            os.makedirs(folder, exist_ok=True)
+            with tempfile.NamedTemporaryFile("wb", dir=folder, delete=False) as f:
+                pickle.dump(entry, f)
+            os.replace(f.name, self.snapshot_path)
+        except OSError as exception:
+            logger.warning(f"Failed to write the snapshot {self.snapshot_path}: {exception}")
@@ -0,0 +1,180 @@
+import collections
+from scripts.settings_dkp import *
+from scripts.app_logger import get_logger
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from scripts.daemon import Pipeline
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+_worker_pipelines: Dict[str, "Pipeline"] = {}
+
+
+def get_workers_count() -> int:
+    """
+    Returns the number of worker processes from DATACORE_WORKERS (the number of CPU cores by default).
+    :return: The number of worker processes.
+    """
+    return max(1, int(os.environ.get("DATACORE_WORKERS") or os.cpu_count() or 1))
+
+
+def get_pipeline_limits(workers: int, names: List[str]) -> Dict[str, int]:
+    """
+    Returns the maximum number of files processed concurrently for each pipeline.
+
+    By default one pipeline may occupy all workers but one, so a burst of files in one folder
+    (e.g. month-end DKP files) always leaves a worker for the other feeds.
+    The limits can be overridden by DATACORE_PIPELINE_LIMITS, e.g. "dkp=2,forecast=1".
+
+    :param workers: The total number of worker processes.
+    :param names: The names of the pipelines.
+    :return: A dictionary with the limit for each pipeline.
+    """
+    limits: Dict[str, int] = {name: max(1, workers - 1) for name in names}
+    for item in filter(None, os.environ.get("DATACORE_PIPELINE_LIMITS", "").split(",")):
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = max(1, int(limit))
+    return limits
+
+
+def _init_worker(pipelines: List["Pipeline"]) -> None:
+    """
+    Imports the converters once per worker process.
+    :param pipelines: The pipelines served by the worker.
+    :return: None
+    """
+    for pipeline in pipelines:
+        pipeline.load()
+        _worker_pipelines[pipeline.name] = pipeline
+
+
+def _process_in_worker(pipeline_name: str, file_path: str) -> int:
+    from scripts.daemon import process_file
+    return process_file(_worker_pipelines[pipeline_name], file_path)
+
+
+class Scheduler(object):
+    def __init__(self, pipelines: List["Pipeline"], workers: Optional[int] = None):
+        """
+        Distributes files between worker processes.
+
+        Every pipeline has its own queue. Free workers are given to the pipelines in round-robin order,
+        and a pipeline never runs more files at once than its limit, so no feed can starve the others.
+
+        :param pipelines: The pipelines whose files are scheduled.
+        :param workers: The number of worker processes (DATACORE_WORKERS by default).
+        """
+        self.pipelines: List["Pipeline"] = pipelines
+        self.workers: int = workers or get_workers_count()
+        self.limits: Dict[str, int] = get_pipeline_limits(self.workers, [pipeline.name for pipeline in pipelines])
+        self.queues: Dict[str, Deque[str]] = {pipeline.name: collections.deque() for pipeline in pipelines}
+        self.running: Dict[Future, Tuple["Pipeline", str]] = {}
+        self.in_flight: Set[str] = set()
+        self.next_pipeline: int = 0
+        self.executor: ProcessPoolExecutor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.pipelines,))
+
+    def submit(self, pipeline: "Pipeline", file_path: str) -> None:
+        """
+        Puts the file in the queue of its pipeline. Files that are already queued or running are ignored.
+        :param pipeline: The pipeline which owns the file.
+        :param file_path: The path to the file.
+        :return: None
+        """
+        if file_path not in self.in_flight:
+            self.in_flight.add(file_path)
+            self.queues[pipeline.name].append(file_path)
+
+    def has_queued(self) -> bool:
+        return any(self.queues.values())
+
+    def _count_running(self, pipeline: "Pipeline") -> int:
+        return sum(running_pipeline is pipeline for running_pipeline, _ in self.running.values())
+
+    def _pick_next(self) -> Optional[Tuple["Pipeline", str]]:
+        """
+        Returns the next file in round-robin order over the pipelines that have queued files and free slots.
+        :return: A (pipeline, file_path) tuple or None if nothing can be started.
+        """
+        for shift in range(len(self.pipelines)):
+            index: int = (self.next_pipeline + shift) % len(self.pipelines)
+            pipeline: "Pipeline" = self.pipelines[index]
+            queue: Deque[str] = self.queues[pipeline.name]
+            if queue and self._count_running(pipeline) < self.limits[pipeline.name]:
+                self.next_pipeline = (index + 1) % len(self.pipelines)
+                return pipeline, queue.popleft()
+        return None
+
+    def dispatch(self) -> None:
+        """
+        Starts queued files while there are free workers.
+        :return: None
+        """
+        while len(self.running) < self.workers and (item := self._pick_next()):
+            pipeline, file_path = item
+            future: Future = self.executor.submit(_process_in_worker, pipeline.name, file_path)
+            self.running[future] = (pipeline, file_path)
+
+    def collect(self) -> List[Tuple["Pipeline", str, int]]:
+        """
+        Removes finished files from the running set.
+
+        If a worker process died (e.g. killed by OOM), the file is marked as failed and the pool is recreated.
+        Any other exception raised by the worker marks the file as failed too, so the daemon keeps running.
+
+        :return: A list of (pipeline, file_path, exit_code) tuples of the finished files.
+        """
+        from scripts.daemon import move_processed_file
+        finished: List[Tuple["Pipeline", str, int]] = []
+        broken: bool = False
+        for future in [future for future in self.running if future.done()]:
+            pipeline, file_path = self.running.pop(future)
+            self.in_flight.discard(file_path)
+            try:
+                exit_code: int = future.result()
+            except BrokenProcessPool as exception:
+                logger.error(f"Worker died while processing {file_path}: {exception}")
+                broken = True
+                exit_code = 1
+                if os.path.exists(file_path):
+                    move_processed_file(pipeline, file_path, exit_code)
+            except Exception as exception:
+                logger.error(f"Failed to process {file_path}: {exception!r}")
+                exit_code = 1
+                if os.path.exists(file_path):
+                    move_processed_file(pipeline, file_path, exit_code)
+            finished.append((pipeline, file_path, exit_code))
+        if broken:
+            self.executor.shutdown(wait=False)
+            self.executor = self._create_executor()
+        return finished
+
+    def run_pending(self) -> List[Tuple["Pipeline", str, int]]:
+        """
+        Collects finished files and starts the queued ones.
+        :return: A list of (pipeline, file_path, exit_code) tuples of the finished files.
+        """
+        finished: List[Tuple["Pipeline", str, int]] = self.collect()
+        self.dispatch()
+        return finished
+
+    def is_idle(self) -> bool:
+        return not self.running and not self.has_queued()
+
+    def get_load(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Returns the number of queued and running files of every pipeline.
+        :return: A dictionary with a (queued, running) tuple for each pipeline.
+        """
+        return {
+            pipeline.name: (len(self.queues[pipeline.name]), self._count_running(pipeline))
+            for pipeline in self.pipelines
+        }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
@@ -1,8 +1,23 @@
 import os
+import re
+import json
+import time
+import fcntl
+import queue
+import atexit
+import smtplib
 import requests
+import tempfile
+import threading
+import contextlib
 from requests import Response
+from multiprocessing import util
 from dotenv import load_dotenv
-from notifiers import get_notifier
+from email.message import EmailMessage
+from clickhouse_connect import get_client
+from clickhouse_connect.driver import Client
+from clickhouse_connect.driver.exceptions import OperationalError
+from typing import Dict, Iterator, List, Optional, Tuple
 
 load_dotenv()
 
@@ -39,36 +54,518 @@ DATE_FORMATS: list = [
 MONTH_NAMES: list = ["янв", "фев", "мар", "апр", "май", "июн", "июл", "авг", "сен", "окт", "ноя", "дек"]
 NUMBER_CLEANING_PATTERN: str = r'\s|,'
 
+REFERENCE_DKP_VERSION_QUERY: str = "SELECT count(), groupBitXor(cityHash64(*)) FROM reference_dkp"
+REFERENCE_DKP_TTL: float = float(os.environ.get("DKP_REFERENCE_TTL", 60))
+REFERENCE_DKP_SNAPSHOT: str = os.environ.get(
+    "DKP_REFERENCE_SNAPSHOT",
+    f"{os.environ.get('XL_IDP_ROOT_DATACORE', '.')}/cache/reference_dkp.pickle"
+)
+DKP_READER: str = os.environ.get("DKP_READER", "pandas")
+DKP_CHUNK_ROWS: int = int(os.environ.get("DKP_CHUNK_ROWS", 1000))
+DKP_DIFF: bool = os.environ.get("DKP_DIFF", "0") == "1"
+DKP_DIFF_STATE: str = os.environ.get(
+    "DKP_DIFF_STATE",
+    f"{os.environ.get('XL_IDP_ROOT_DATACORE', '.')}/cache/dkp_diff"
+)
+CLICKHOUSE_POOL_SIZE: int = int(os.environ.get("CLICKHOUSE_POOL_SIZE", 2))
+CLICKHOUSE_HEALTH_CHECK_INTERVAL: float = 30.0
+TELEGRAM_API_URL: str = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_MESSAGE_LENGTH: int = 4096
+SMTP_HOST: str = os.environ.get("SMTP_HOST", "smtp.mail.ru")
+SMTP_PORT: int = int(os.environ.get("SMTP_PORT", 587))
+SMTP_TLS: bool = os.environ.get("SMTP_TLS", "1") == "1"
+NOTIFY_BATCH_INTERVAL: float = float(os.environ.get("NOTIFY_BATCH_INTERVAL", 2))
+NOTIFY_FLUSH_TIMEOUT: float = float(os.environ.get("NOTIFY_FLUSH_TIMEOUT", 30))
+NOTIFY_TIMEOUT: float = 10.0
+NOTIFY_RATE: float = float(os.environ.get("NOTIFY_RATE", 20))
+NOTIFY_BURST: int = int(os.environ.get("NOTIFY_BURST", 10))
+NOTIFY_DEDUP_WINDOW: float = float(os.environ.get("NOTIFY_DEDUP_WINDOW", 600))
+NOTIFY_REPORT_INTERVAL: float = 60.0
+NOTIFY_STATE: str = os.environ.get(
+    "NOTIFY_STATE",
+    f"{os.environ.get('XL_IDP_ROOT_DATACORE', '.')}/cache/notifications.json"
+)
+ERROR_CODE_PATTERN: re.Pattern = re.compile(r"Error code (\d+)")
+MESSAGE_VALUES_PATTERN: re.Pattern = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:[.,]\d+)?")
 
-def send_email_notifiers(message: str, subject: str = "Уведомление от системы DataCore"):
+
+class ClickHouseClientPool(object):
+    def __init__(
+        self,
+        max_size: int = CLICKHOUSE_POOL_SIZE,
+        health_check_interval: float = CLICKHOUSE_HEALTH_CHECK_INTERVAL
+    ):
+        """
+        A lazily filled pool of ClickHouse clients shared by the whole process.
+
+        The connection is created on the first request and reused afterwards. A client that stayed idle
+        longer than `health_check_interval` seconds is pinged before reuse and reconnected if the ping fails.
+        A client that raised `OperationalError` (e.g. the connection was dropped) is closed instead of being
+        returned to the pool. After a fork the child process opens its own connections.
+
+        :param max_size: The maximum number of clients opened at the same time.
+        :param health_check_interval: Seconds of inactivity after which the client is pinged before reuse.
+        """
+        self.max_size: int = max_size
+        self.health_check_interval: float = health_check_interval
+        self.condition: threading.Condition = threading.Condition()
+        self.idle: List[Tuple[Client, float]] = []
+        self.size: int = 0
+        self.pid: int = os.getpid()
+
+    @staticmethod
+    def _create_client() -> Client:
+        return get_client(
+            host=get_my_env_var('HOST'),
+            database=get_my_env_var('DATABASE'),
+            username=get_my_env_var('USERNAME_DB'),
+            password=get_my_env_var('PASSWORD')
+        )
+
+    def _reset_after_fork(self) -> None:
+        if self.pid != os.getpid():
+            self.condition = threading.Condition()
+            self.idle = []
+            self.size = 0
+            self.pid = os.getpid()
+
+    def _checkout(self) -> Client:
+        self._reset_after_fork()
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                self.condition.wait()
+            if not self.idle:
+                self.size += 1
+                client = None
+            else:
+                client, last_used = self.idle.pop()
+        if client is None:
+            return self._connect()
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(client):
+            with contextlib.suppress(Exception):
+                client.close()
+            return self._connect()
+        return client
+
+    def _connect(self) -> Client:
+        try:
+            return self._create_client()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    @staticmethod
+    def _is_healthy(client: Client) -> bool:
+        try:
+            return bool(client.ping())
+        except Exception:
+            return False
+
+    def _release(self, client: Client) -> None:
+        with self.condition:
+            self.idle.append((client, time.monotonic()))
+            self.condition.notify()
+
+    def _discard(self, client: Client) -> None:
+        with contextlib.suppress(Exception):
+            client.close()
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[Client]:
+        """
+        Gives a client for exclusive use inside the `with` block.
+        :return: The ClickHouse client.
+        """
+        client: Client = self._checkout()
+        try:
+            yield client
+        except OperationalError:
+            self._discard(client)
+            raise
+        except BaseException:
+            self._release(client)
+            raise
+        else:
+            self._release(client)
+
+    def close(self) -> None:
+        """
+        Closes all idle clients.
+        :return: None
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for client, _ in idle:
+            self._discard(client)
+
+
+clickhouse_pool: ClickHouseClientPool = ClickHouseClientPool()
+
+
+class NotificationLimiter(object):
+    def __init__(
+        self,
+        rate: float = NOTIFY_RATE,
+        burst: int = NOTIFY_BURST,
+        dedup_window: float = NOTIFY_DEDUP_WINDOW,
+        state_path: str = NOTIFY_STATE
+    ):
+        """
+        Decides which notifications are sent, so a bad batch of files doesn't flood Telegram and the mailbox.
+
+        A message is suppressed if a message with the same fingerprint (the error code, the file and the text
+        with the numbers and quoted values replaced) was sent within `dedup_window` seconds, or if the token bucket
+        is empty: it holds `burst` tokens and gets `rate` tokens per minute. The suppressed messages are counted
+        by the error code until they are reported.
+
+        The bucket, the sent fingerprints and the suppressed counts are kept in a JSON file shared by the daemon
+        and its worker processes, so the limits apply to all of them together. The file is updated under
+        an exclusive lock and replaced atomically.
+
+        :param rate: The number of messages per minute sent after the burst.
+        :param burst: The number of messages sent at once.
+        :param dedup_window: Seconds during which a repeated message is suppressed.
+        :param state_path: The path to the state file.
+        """
+        self.rate: float = rate
+        self.burst: int = burst
+        self.dedup_window: float = dedup_window
+        self.state_path: str = state_path
+
+    @staticmethod
+    def get_fingerprint(message: str, file_name: Optional[str] = None) -> tuple:
+        """
+        Returns the fingerprint of the message: the error code, the file and the template of the text.
+        :param message: The text of the message.
+        :param file_name: The name of the file the message is about.
+        :return: The fingerprint.
+        """
+        error_code: Optional[re.Match] = ERROR_CODE_PATTERN.search(message)
+        if file_name:
+            message = message.replace(file_name, "")
+        return error_code and error_code.group(1), file_name, MESSAGE_VALUES_PATTERN.sub("#", message)
+
+    @staticmethod
+    def is_valid_state(state: object) -> bool:
+        return (
+            isinstance(state, dict)
+            and all(isinstance(state.get(name), (int, float)) for name in ("tokens", "updated"))
+            and all(isinstance(state.get(name), dict) for name in ("sent", "suppressed"))
+        )
+
+    def load(self) -> dict:
+        """
+        Returns the shared state of the limiter. A missing, broken or unknown state is replaced with a new one.
+        :return: The tokens left, the time they were counted, the sent fingerprints and the suppressed counts.
+        """
+        with contextlib.suppress(OSError, ValueError):
+            with open(self.state_path, encoding="utf-8") as f:
+                state: dict = json.load(f)
+            if self.is_valid_state(state):
+                return state
+        return {"tokens": float(self.burst), "updated": time.time(), "sent": {}, "suppressed": {}}
+
+    @contextlib.contextmanager
+    def update(self) -> Iterator[dict]:
+        """
+        Gives the shared state for changing inside the `with` block, other processes wait until it is saved.
+        :return: The state.
+        """
+        folder: str = os.path.dirname(self.state_path) or "."
+        os.makedirs(folder, exist_ok=True)
+        with open(f"{self.state_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state: dict = self.load()
+            yield state
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, delete=False) as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(f.name, self.state_path)
+
+    def allow(self, message: str, file_name: Optional[str] = None) -> bool:
+        """
+        Checks whether the message may be sent now and counts it as suppressed otherwise.
+        If the state file is unavailable, the message is sent.
+        :param message: The text of the message.
+        :param file_name: The name of the file the message is about.
+        :return: True if the message may be sent.
+        """
+        fingerprint: tuple = self.get_fingerprint(message, file_name)
+        key: str = json.dumps(fingerprint, ensure_ascii=False)
+        try:
+            with self.update() as state:
+                now: float = time.time()
+                state["tokens"] = min(self.burst, state["tokens"] + max(0.0, now - state["updated"]) * self.rate / 60)
+                state["updated"] = now
+                state["sent"] = {
+                    sent_key: sent_on for sent_key, sent_on in state["sent"].items()
+                    if now - sent_on < self.dedup_window
+                }
+                if key in state["sent"] or state["tokens"] < 1:
+                    label: str = f"Error code {fingerprint[0]}" if fingerprint[0] else "Без кода"
+                    state["suppressed"][label] = state["suppressed"].get(label, 0) + 1
+                    return False
+                state["tokens"] -= 1
+                state["sent"][key] = now
+                return True
+        except (OSError, KeyError, TypeError) as exception:
+            print(f"Ошибка при обновлении состояния уведомлений {self.state_path}: {exception}")
+            return True
+
+    def has_suppressed(self) -> bool:
+        return bool(self.load()["suppressed"])
+
+    def pop_suppressed(self) -> Dict[str, int]:
+        """
+        Returns the numbers of the suppressed messages by the error code since the previous call in any process.
+        :return: A dictionary with the number of the suppressed messages for each error code.
+        """
+        try:
+            with self.update() as state:
+                suppressed, state["suppressed"] = state["suppressed"], {}
+                return suppressed
+        except (OSError, KeyError, TypeError) as exception:
+            print(f"Ошибка при обновлении состояния уведомлений {self.state_path}: {exception}")
+            return {}
+
+
+class NotificationDispatcher(object):
+    def __init__(
+        self,
+        batch_interval: float = NOTIFY_BATCH_INTERVAL,
+        flush_timeout: float = NOTIFY_FLUSH_TIMEOUT,
+        health_check_interval: float = CLICKHOUSE_HEALTH_CHECK_INTERVAL,
+        limiter: Optional[NotificationLimiter] = None
+    ):
+        """
+        Sends the notifications to Telegram and by email in a background thread, so an error report
+        never delays the processing of files.
+
+        The messages queued within `batch_interval` seconds after the first one are joined into one digest.
+        The HTTP session and the SMTP connection are reused between the digests; the SMTP connection that stayed
+        idle longer than `health_check_interval` seconds is checked with NOOP and reopened if it was dropped.
+        The queued messages are sent before the process exits (at most `flush_timeout` seconds).
+        Repeated messages and messages over the rate limit are dropped by `limiter`, their number is reported
+        in the next digest of any process or by `report_suppressed`.
+        After a fork the child process starts its own thread and opens its own connections. Worker processes
+        exit without running the atexit handlers, so there the queued messages are sent by a multiprocessing
+        finalizer.
+
+        :param batch_interval: Seconds to wait for more messages before the digest is sent.
+        :param flush_timeout: Seconds to wait for the queued messages to be sent on exit.
+        :param health_check_interval: Seconds of inactivity after which the SMTP connection is checked before reuse.
+        :param limiter: The rate limiter of the messages.
+        """
+        self.limiter: NotificationLimiter = limiter or NotificationLimiter()
+        self.batch_interval: float = batch_interval
+        self.flush_timeout: float = flush_timeout
+        self.health_check_interval: float = health_check_interval
+        self.main_pid: int = os.getpid()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.queue: queue.Queue = queue.Queue()
+        self.condition: threading.Condition = threading.Condition()
+        self.pending: int = 0
+        self.thread: Optional[threading.Thread] = None
+        self.session: Optional[requests.Session] = None
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.smtp_lock: threading.Lock = threading.Lock()
+        self.smtp_last_used: float = 0.0
+        self.reported_at: float = time.monotonic()
+        self.pid: int = os.getpid()
+
+    def notify(self, message: str, file_name: Optional[str] = None) -> None:
+        """
+        Queues the message for sending to Telegram and by email unless it is suppressed by the limiter.
+        :param message: The text of the message.
+        :param file_name: The name of the file the message is about.
+        :return: None
+        """
+        if self.pid != os.getpid():
+            self._reset()
+        if self.limiter.allow(message, file_name):
+            self._put(message)
+
+    def report_suppressed(self, interval: float = NOTIFY_REPORT_INTERVAL) -> None:
+        """
+        Queues the report of the suppressed messages if nothing reported them within `interval` seconds.
+        It is called periodically by the daemon, so the messages suppressed in the workers are reported
+        even when no other message follows.
+        :param interval: Seconds between the checks of the suppressed messages.
+        :return: None
+        """
+        if self.pid != os.getpid():
+            self._reset()
+        if time.monotonic() - self.reported_at < interval:
+            return
+        self.reported_at = time.monotonic()
+        if self.limiter.has_suppressed():
+            self._put(None)
+
+    def _put(self, message: Optional[str]) -> None:
+        with self.condition:
+            self.pending += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+                self.thread.start()
+                if os.getpid() != self.main_pid:
+                    util.Finalize(None, self.close, exitpriority=1)
+        self.queue.put(message)
+
+    def _collect(self) -> List[Optional[str]]:
+        messages: List[Optional[str]] = [self.queue.get()]
+        deadline: float = time.monotonic() + self.batch_interval
+        while (timeout := deadline - time.monotonic()) > 0:
+            try:
+                messages.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return messages
+
+    @staticmethod
+    def get_digest(messages: List[str], suppressed: Optional[Dict[str, int]] = None) -> str:
+        """
+        Joins the messages into one.
+        :param messages: The messages.
+        :param suppressed: The numbers of the suppressed messages by the error code.
+        :return: The message itself if it is the only one, otherwise the numbered list of the messages.
+        """
+        parts: List[str] = messages if len(messages) <= 1 else [
+            f"Уведомлений: {len(messages)}", *(f"{i}. {m}" for i, m in enumerate(messages, 1))
+        ]
+        if suppressed:
+            counts: str = ", ".join(f"{label} - {count}" for label, count in suppressed.items())
+            parts = [*parts, f"Подавлено повторных уведомлений: {sum(suppressed.values())} ({counts})"]
+        return "\n\n".join(parts)
+
+    def _run(self) -> None:
+        while True:
+            messages: List[Optional[str]] = self._collect()
+            try:
+                self._send_digest([message for message in messages if message is not None])
+            except Exception as exception:
+                print(f"Ошибка при подготовке уведомления: {exception}")
+            finally:
+                with self.condition:
+                    self.pending -= len(messages)
+                    self.condition.notify_all()
+
+    def _send_digest(self, messages: List[str]) -> None:
+        suppressed: Dict[str, int] = self.limiter.pop_suppressed()
+        if not messages and not suppressed:
+            return
+        digest: str = self.get_digest(messages, suppressed)
+        for send in (self.send_telegram, self.send_email):
+            try:
+                send(digest)
+            except Exception as exception:
+                print(f"Ошибка при отправке уведомления ({send.__name__}): {exception}")
+
+    def send_telegram(self, message: str) -> None:
+        """
+        Sends the message to the Telegram topic, split into parts if it is longer than Telegram allows.
+        :param message: The text of the message.
+        :return: None
+        """
+        if self.session is None:
+            self.session = requests.Session()
+        url: str = f"{TELEGRAM_API_URL}/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
+        for start in range(0, len(message), TELEGRAM_MESSAGE_LENGTH):
+            params: dict = {
+                "chat_id": f"{get_my_env_var('CHAT_ID')}/{get_my_env_var('TOPIC')}",
+                "text": message[start:start + TELEGRAM_MESSAGE_LENGTH],
+                "reply_to_message_id": get_my_env_var('ID')
+            }
+            response: Response = self.session.get(url, params=params, timeout=NOTIFY_TIMEOUT)
+            response.raise_for_status()
+
+    def _connect_smtp(self) -> smtplib.SMTP:
+        if self.smtp is not None:
+            if time.monotonic() - self.smtp_last_used <= self.health_check_interval:
+                return self.smtp
+            with contextlib.suppress(smtplib.SMTPException, OSError):
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            self._close_smtp()
+        smtp: smtplib.SMTP = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=NOTIFY_TIMEOUT)
+        try:
+            if SMTP_TLS:
+                smtp.starttls()
+            smtp.login(get_my_env_var('EMAIL_USER'), get_my_env_var('EMAIL_PASSWORD'))
+        except BaseException:
+            smtp.close()
+            raise
+        self.smtp = smtp
+        return smtp
+
+    def _close_smtp(self) -> None:
+        if self.smtp is not None:
+            with contextlib.suppress(smtplib.SMTPException, OSError):
+                self.smtp.quit()
+            self.smtp = None
+
+    def send_email(self, message: str, subject: str = "Уведомление от системы DataCore") -> None:
+        """
+        Sends the message by email through the reused SMTP connection.
+        :param message: The text of the message.
+        :param subject: The subject of the email.
+        :return: None
+        """
+        email: EmailMessage = EmailMessage()
+        email["Subject"] = subject
+        email["From"] = get_my_env_var('EMAIL_USER')
+        email["To"] = get_my_env_var('RECIPIENT_EMAIL')
+        email.set_content(message)
+        with self.smtp_lock:
+            try:
+                self._connect_smtp().send_message(email)
+            except smtplib.SMTPServerDisconnected:
+                self._close_smtp()
+                self._connect_smtp().send_message(email)
+            self.smtp_last_used = time.monotonic()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until the queued messages are sent.
+        :param timeout: The maximum number of seconds to wait (`flush_timeout` by default).
+        :return: True if all messages are sent.
+        """
+        if self.pid != os.getpid():
+            return True
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.pending == 0,
+                self.flush_timeout if timeout is None else timeout
+            )
+
+    def close(self) -> None:
+        """
+        Sends the queued messages and closes the connections.
+        :return: None
+        """
+        if not self.flush():
+            print(f"Не отправлено уведомлений: {self.pending}")
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        with self.smtp_lock:
+            self._close_smtp()
+
+
+notifier: NotificationDispatcher = NotificationDispatcher()
+atexit.register(notifier.close)
+
+
+def telegram(message: str, file_name: Optional[str] = None) -> None:
     """
-    Отправка email через Mail.ru
+    Queues the message for Telegram and email, it is sent in the background (see `NotificationDispatcher`).
+    :param message: The text of the message.
+    :param file_name: The name of the file the message is about (repeated messages about it are suppressed).
+    :return: None
     """
-    try:
-        email = get_notifier('email')
-        email.notify(
-            to=get_my_env_var('RECIPIENT_EMAIL'),
-            subject=subject,
-            message=message,
-            from_=get_my_env_var('EMAIL_USER'),
-            host='smtp.mail.ru',
-            port=587,
-            username=get_my_env_var('EMAIL_USER'),
-            password=get_my_env_var('EMAIL_PASSWORD'),
-            tls=True
-        )
-        print(f"Email успешно отправлен на {get_my_env_var('RECIPIENT_EMAIL')}")
-    except Exception as e:
-        print(f"Ошибка при отправке email: {e}")
-
-
-def telegram(message) -> int:
-    url: str = f"https://api.telegram.org/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
-    params: dict = {
-        "chat_id": f"{get_my_env_var('CHAT_ID')}/{get_my_env_var('TOPIC')}",
-        "text": message,
-        "reply_to_message_id": get_my_env_var('ID')
-    }
-    response: Response = requests.get(url, params=params)
-    send_email_notifiers(params.get('text'))
-    return response.status_code
+    notifier.notify(message, file_name)
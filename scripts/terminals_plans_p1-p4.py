@@ -1,12 +1,9 @@
 import re
 import os
 import sys
-import json
 import contextlib
-import numpy as np
-import pandas as pd
 from pandas import DataFrame
-from datetime import datetime
+from scripts.base_converter import BaseFlatConverter
 
 headers_eng: dict = {
     "ЦФО расходов": "department",
@@ -38,13 +35,14 @@ month_mapping: dict = {
 }
 
 
-date_formats: tuple = ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S")
+class TerminalsPlansP1P4(BaseFlatConverter):
+    headers_eng: dict = headers_eng
+    dict_types: dict = dict_types
+    round_columns: tuple = ("rate", "amount_thousand_rubles")
+    table: str = "terminals_plans_p1_p4"
 
-
-class TerminalsPlansP1P4(object):
-    def __init__(self, input_file_path: str, output_folder: str):
-        self.input_file_path: str = input_file_path
-        self.output_folder: str = output_folder
+    def add_columns_from_filename(self, df: DataFrame) -> None:
+        self.get_year_in_filename(df)
 
     def get_year_in_filename(self, df: DataFrame):
         """
@@ -55,48 +53,21 @@ class TerminalsPlansP1P4(object):
         else:
             raise AssertionError('Year not found in file name!')
 
-    @staticmethod
-    def change_type_and_values(df: DataFrame) -> None:
-        """
-        Change data types or changing values.
-        """
-        with contextlib.suppress(Exception):
-            df['rate'] = df['rate'].round(2)
-            df['month'] = df['month'].map(month_mapping)
-            df['amount_thousand_rubles'] = df['amount_thousand_rubles'].round(2)
-
-    def add_new_columns(self, df: DataFrame) -> None:
+    def add_derived_columns(self, df: DataFrame) -> None:
         """
-        Add new columns.
+        Add TEU calculated from the container size and count.
         """
-        df['original_file_name'] = os.path.basename(self.input_file_path)
-        df['original_file_parsed_on'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         df['teu'] = None  # Инициализируем столбец
         df.loc[df['container_size'] == 20, 'teu'] = df['container_count'] * 1
         df.loc[df['container_size'] == 40, 'teu'] = df['container_count'] * 2
 
-    def write_to_json(self, parsed_data: list) -> None:
+    def change_type_and_values(self, df: DataFrame) -> None:
         """
-        Write data to json.
-        """
-        basename: str = os.path.basename(self.input_file_path)
-        output_file_path: str = os.path.join(self.output_folder, f'{basename}.json')
-        with open(f"{output_file_path}", 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-
-    def main(self) -> None:
-        """
-        The main function where we read the Excel file and write the file to json.
+        Change data types or changing values.
         """
-        df: DataFrame = pd.read_excel(self.input_file_path, dtype=dict_types)
-        df = df.dropna(axis=0, how='all')
-        df = df.rename(columns=headers_eng)
-        df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-        self.get_year_in_filename(df)
-        self.add_new_columns(df)
-        self.change_type_and_values(df)
-        df = df.replace({np.nan: None, "NaT": None})
-        self.write_to_json(df.to_dict('records'))
+        super().change_type_and_values(df)
+        with contextlib.suppress(Exception):
+            df['month'] = df['month'].map(month_mapping)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,8 @@
 import sys
-import json
-import contextlib
-import numpy as np
 import pandas as pd
-from __init__ import *
-from typing import Optional
+from scripts import *
 from pandas import DataFrame
-from datetime import datetime
+from scripts.base_converter import BaseFlatConverter
 
 headers_eng: dict = {
     "Контейнеры гружёные":
@@ -61,73 +57,38 @@ dict_types: dict = {
     "Ставка ПРР выдача": int
 }
 
-logger: logging.getLogger = get_logger(f"data_extractor {str(datetime.now().date())}")
-date_formats: tuple = ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S")
+logger: logging.getLogger = get_logger(os.path.basename(__file__).replace(".py", ""))
 
 
-class VolumesOrlovkaTerminal(object):
-    def __init__(self, input_file_path: str, output_folder: str):
-        self.input_file_path: str = input_file_path
-        self.output_folder: str = output_folder
+class VolumesOrlovkaTerminal(BaseFlatConverter):
+    dict_types: dict = dict_types
+    date_columns: tuple = ('date_registration', 'date_arrival', 'date_departure')
 
-    @staticmethod
-    def convert_format_date(date: str) -> Optional[str]:
+    def write_to_json(self, df: DataFrame, sheet: str) -> None:
         """
-        Convert to a date type.
-        """
-        for date_format in date_formats:
-            with contextlib.suppress(ValueError):
-                return str(datetime.strptime(date, date_format).date())
-        return None
-
-    def change_type_and_values(self, df: DataFrame) -> None:
-        """
-        Change data types or changing values.
-        """
-        # Список столбцов для обработки
-        date_columns = ['date_registration', 'date_arrival', 'date_departure']
-        for column in date_columns:
-            if column in df.columns:
-                with contextlib.suppress(Exception):
-                    df[column] = df[column].apply(lambda x: self.convert_format_date(str(x)))
-
-    def add_new_columns(self, df: DataFrame) -> None:
-        """
-        Add new columns.
-        """
-        df['original_file_name'] = os.path.basename(self.input_file_path)
-        df['original_file_parsed_on'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
-    def write_to_json(self, parsed_data: list, sheet: str) -> None:
-        """
-        Write data to json.
+        Write data to json (or another format selected by DATACORE_OUTPUT_FORMAT).
         """
         basename: str = os.path.basename(self.input_file_path)
-        output_file_path: str = os.path.join(self.output_folder, f'{basename}_{sheet}.json')
-        with open(f"{output_file_path}", 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+        super().write_to_json(df, f'{basename}_{sheet}')
 
     def main(self) -> None:
         """
         The main function where we read the Excel file and write the file to json.
         """
-        logger.info(f"{os.path.basename(self.input_file_path)} has started processing")
-        try:
-            sheets = pd.ExcelFile(self.input_file_path).sheet_names
-            logger.info(f"Sheets is {sheets}")
-            for sheet in sheets:
-                if headers_eng.get(sheet):
-                    df: DataFrame = pd.read_excel(self.input_file_path, sheet_name=sheet, dtype=dict_types)
-                    df = df.dropna(axis=0, how='all')
-                    df = df.rename(columns=headers_eng.get(sheet))
-                    df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-                    self.add_new_columns(df)
-                    self.change_type_and_values(df)
-                    df = df.replace({np.nan: None, "NaT": None})
-                    self.write_to_json(df.to_dict('records'), sheet)
-        except Exception as ex:
-            logger.error(f"Ошибка при чтении файла {self.input_file_path}: {ex}")
-        logger.info(f"{os.path.basename(self.input_file_path)} has finished processing")
+        with self.profile:
+            logger.info(f"{os.path.basename(self.input_file_path)} has started processing")
+            try:
+                with pd.ExcelFile(self.input_file_path) as xls:
+                    sheets = xls.sheet_names
+                    logger.info(f"Sheets is {sheets}")
+                    for sheet in sheets:
+                        if headers_eng.get(sheet):
+                            df: DataFrame = self.read_excel(xls, sheet_name=sheet)
+                            df = self.transform(df, headers_eng.get(sheet))
+                            self.write_to_json(df, sheet)
+            except Exception as ex:
+                logger.error(f"Ошибка при чтении файла {self.input_file_path}: {ex}")
+            logger.info(f"{os.path.basename(self.input_file_path)} has finished processing")
 
 
 if __name__ == '__main__':
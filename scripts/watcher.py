@@ -0,0 +1,233 @@
+import time
+import errno
+import ctypes
+import select
+import struct
+import ctypes.util
+from scripts.settings_dkp import *
+from scripts.app_logger import get_logger
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+IN_MODIFY: int = 0x00000002
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_DELETE: int = 0x00000200
+IN_Q_OVERFLOW: int = 0x00004000
+IN_ISDIR: int = 0x40000000
+IN_NONBLOCK: int = 0o4000
+IN_CLOEXEC: int = 0o2000000
+
+WATCH_MASK: int = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER: struct.Struct = struct.Struct("iIII")
+READ_BUFFER_SIZE: int = 64 * 1024
+
+
+class WatchedFolder(object):
+    def __init__(self, path: str, debounce: float, tag: Any, accept: Callable[[str], bool]):
+        """
+        A folder registered in the watcher.
+
+        :param path: The path to the folder.
+        :param debounce: Seconds the file must stay unchanged before it is handed out.
+        :param tag: Any object returned together with the ready file (e.g. the pipeline).
+        :param accept: A predicate for the base name of the file.
+        """
+        self.path: str = path
+        self.debounce: float = debounce
+        self.tag: Any = tag
+        self.accept: Callable[[str], bool] = accept
+
+
+class BaseWatcher(object):
+    """
+    Collects files appearing in the watched folders and hands them out once they are stable:
+    the file was not modified during the debounce window of its folder.
+    """
+    def __init__(self):
+        self.folders: Dict[str, WatchedFolder] = {}
+        self.pending: Dict[str, Tuple[WatchedFolder, float]] = {}
+
+    def add_folder(self, path: str, debounce: float, tag: Any, accept: Callable[[str], bool] = lambda name: True):
+        """
+        Starts watching the folder. Files that already lie in the folder are scheduled by their modification time.
+        :param path: The path to the folder.
+        :param debounce: Seconds the file must stay unchanged before it is handed out.
+        :param tag: Any object returned together with the ready file.
+        :param accept: A predicate for the base name of the file.
+        :return: None
+        """
+        folder: WatchedFolder = WatchedFolder(path, debounce, tag, accept)
+        self.folders[path] = folder
+        self._scan_folder(folder)
+
+    def _scan_folder(self, folder: WatchedFolder) -> None:
+        with os.scandir(folder.path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and folder.accept(entry.name):
+                    self._schedule(folder, entry.path, entry.stat().st_mtime)
+
+    def _schedule(self, folder: WatchedFolder, path: str, changed_at: float) -> None:
+        self.pending[path] = (folder, changed_at + folder.debounce)
+
+    def _forget(self, path: str) -> None:
+        self.pending.pop(path, None)
+
+    def _is_being_written(self, path: str) -> bool:
+        return False
+
+    def _pop_ready(self, now: float) -> List[Tuple[Any, str]]:
+        """
+        Returns the pending files whose debounce window has expired and which were not touched meanwhile.
+        :param now: The current timestamp.
+        :return: A list of (tag, path) tuples.
+        """
+        ready: List[Tuple[Any, str]] = []
+        for path, (folder, deadline) in sorted(self.pending.items(), key=lambda item: item[1][1]):
+            if deadline > now or self._is_being_written(path):
+                continue
+            try:
+                modified: float = os.stat(path).st_mtime
+            except FileNotFoundError:
+                self._forget(path)
+                continue
+            if modified + folder.debounce > now:
+                self._schedule(folder, path, modified)
+                continue
+            self._forget(path)
+            ready.append((folder.tag, path))
+        return ready
+
+    def _get_timeout(self, now: float, timeout: float) -> float:
+        deadlines: List[float] = [
+            deadline for path, (_, deadline) in self.pending.items() if not self._is_being_written(path)
+        ]
+        if not deadlines:
+            return timeout
+        return max(0.0, min(timeout, min(deadlines) - now))
+
+    def get_ready(self, timeout: float) -> List[Tuple[Any, str]]:
+        """
+        Waits up to `timeout` seconds for changes and returns the files that are ready to be processed.
+        :param timeout: The maximum number of seconds to wait.
+        :return: A list of (tag, path) tuples.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Linux inotify watcher. The kernel reports only changes of the watched folders themselves,
+    so the `done/` and `json/` neighbours are never rescanned.
+    """
+    def __init__(self):
+        super().__init__()
+        self.libc: ctypes.CDLL = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd: int = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, WatchedFolder] = {}
+        self.writing: Set[str] = set()
+
+    def add_folder(self, path: str, debounce: float, tag: Any, accept: Callable[[str], bool] = lambda name: True):
+        wd: int = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        super().add_folder(path, debounce, tag, accept)
+        self.watches[wd] = self.folders[path]
+
+    def _is_being_written(self, path: str) -> bool:
+        return path in self.writing
+
+    def _forget(self, path: str) -> None:
+        super()._forget(path)
+        self.writing.discard(path)
+
+    def _handle_event(self, folder: WatchedFolder, mask: int, name: str, now: float) -> None:
+        path: str = os.path.join(folder.path, name)
+        if mask & (IN_MOVED_FROM | IN_DELETE):
+            self._forget(path)
+        elif folder.accept(name):
+            if mask & (IN_CREATE | IN_MODIFY):
+                self.writing.add(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.writing.discard(path)
+            self._schedule(folder, path, now)
+
+    def _read_events(self) -> None:
+        try:
+            buffer: bytes = os.read(self.fd, READ_BUFFER_SIZE)
+        except OSError as exception:
+            if exception.errno == errno.EAGAIN:
+                return
+            raise
+        now: float = time.time()
+        offset: int = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name: str = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Inotify queue overflowed. Rescanning all folders")
+                for folder in self.folders.values():
+                    self._scan_folder(folder)
+            elif not mask & IN_ISDIR and (folder := self.watches.get(wd)) and name:
+                self._handle_event(folder, mask, name, now)
+
+    def get_ready(self, timeout: float) -> List[Tuple[Any, str]]:
+        readable, _, _ = select.select([self.fd], [], [], self._get_timeout(time.time(), timeout))
+        if readable:
+            self._read_events()
+        return self._pop_ready(time.time())
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Pure Python fallback for systems without inotify: rescans only the watched folders (not their subfolders).
+    """
+    def __init__(self, interval: float = 1.0):
+        super().__init__()
+        self.interval: float = interval
+        self.seen: Dict[str, Tuple[int, float]] = {}
+
+    def _scan_folder(self, folder: WatchedFolder) -> None:
+        with os.scandir(folder.path) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False) or not folder.accept(entry.name):
+                    continue
+                stat: os.stat_result = entry.stat()
+                signature: Tuple[int, float] = (stat.st_size, stat.st_mtime)
+                if self.seen.get(entry.path) != signature:
+                    self.seen[entry.path] = signature
+                    self._schedule(folder, entry.path, stat.st_mtime)
+
+    def get_ready(self, timeout: float) -> List[Tuple[Any, str]]:
+        time.sleep(self._get_timeout(time.time(), min(timeout, self.interval)))
+        for folder in self.folders.values():
+            self._scan_folder(folder)
+        self.seen = {path: signature for path, signature in self.seen.items() if os.path.exists(path)}
+        return self._pop_ready(time.time())
+
+
+def create_watcher() -> BaseWatcher:
+    """
+    Creates the inotify watcher and falls back to polling if inotify is not available
+    or DATACORE_WATCHER=polling is set.
+    :return: The watcher.
+    """
+    if os.environ.get("DATACORE_WATCHER", "inotify") != "polling":
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError, TypeError) as exception:
+            logger.warning(f"Inotify is not available ({exception}). Falling back to polling")
+    return PollingWatcher()
@@ -0,0 +1,378 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scripts.app_logger import get_logger
+from scripts.encoders import StdlibEncoder, create_encoder
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Type, Union
+
+UMASK: int = os.umask(0)
+os.umask(UMASK)
+
+logger: get_logger = get_logger(os.path.basename(__file__).replace(".py", ""))
+
+
+def column_to_values(column: pd.Series) -> list:
+    """
+    Converts the column to Python values, replacing missing values (and "NaT" strings) with None.
+    :param column: The column.
+    :return: A list of values.
+    """
+    values: list = column.tolist()
+    is_missing: np.ndarray = column.isna().to_numpy()
+    if column.dtype == object:
+        values = [value.item() if isinstance(value, np.generic) else value for value in values]
+        is_missing |= (column == "NaT").to_numpy()
+    if is_missing.any():
+        values = [None if missing else value for value, missing in zip(values, is_missing)]
+    return values
+
+
+def iter_frame_records(df: DataFrame, chunk_size: int = 10000) -> Iterator[dict]:
+    """
+    Yields the rows of the DataFrame as records, replacing missing values with None.
+
+    The records are built from the column arrays chunk by chunk, so unlike `df.replace(...).to_dict('records')`
+    neither an object copy of the whole DataFrame nor the list of all records is kept in memory.
+
+    :param df: The DataFrame.
+    :param chunk_size: The number of rows converted at once.
+    :return: An iterator over the records.
+    """
+    names: list = list(df.columns)
+    for start in range(0, len(df), chunk_size):
+        chunk: DataFrame = df.iloc[start:start + chunk_size]
+        columns: List[list] = [column_to_values(chunk.iloc[:, index]) for index in range(len(names))]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
+
+class JsonWriter(object):
+    extension: str = "json"
+    mode: str = "w"
+    indent: Optional[int] = 4
+
+    def __init__(self, path: str, encoder: Optional[StdlibEncoder] = None):
+        """
+        Writes records to a JSON array one by one, so they don't have to be collected in memory.
+
+        The output is the same as `json.dump(records, f, ensure_ascii=False, indent=4)`
+        (with orjson some floats are written in another notation, see `OrjsonEncoder`).
+        Records are written to a temporary file next to `path`, which replaces `path` only when
+        the writer is closed without an error, so loaders never see a partially written file.
+
+        :param path: The path to the output file.
+        :param encoder: The encoder of the records (the one of DATACORE_JSON_BACKEND by default).
+        """
+        self.path: str = path
+        self.encoder: StdlibEncoder = encoder or create_encoder(self.indent)
+        self.count: int = 0
+        self.file: Optional[IO] = None
+
+    def __enter__(self) -> "JsonWriter":
+        self.open()
+        return self
+
+    def open(self) -> None:
+        self.file = tempfile.NamedTemporaryFile(
+            self.mode,
+            encoding=None if "b" in self.mode else "utf-8",
+            dir=os.path.dirname(self.path) or ".",
+            prefix=f".{os.path.basename(self.path)}.",
+            suffix=".tmp",
+            delete=False
+        )
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(self, record: dict) -> None:
+        """
+        Appends the record to the array.
+        :param record: The record to write.
+        :return: None
+        """
+        encoded: str = self.encoder.encode(record).replace("\n", "\n    ")
+        self.file.write(("," if self.count else "[") + "\n    " + encoded)
+        self.count += 1
+
+    def write_many(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.write(record)
+
+    def write_frame(self, df: DataFrame) -> None:
+        """
+        Writes the rows of the DataFrame produced by a converter.
+        :param df: The DataFrame.
+        :return: None
+        """
+        self.write_many(iter_frame_records(df))
+
+    def write_footer(self) -> None:
+        self.file.write("\n]" if self.count else "[]")
+
+    def commit(self) -> None:
+        """
+        Closes the array and atomically moves the temporary file to the output path.
+        :return: None
+        """
+        if self.file.closed:
+            return
+        self.write_footer()
+        self.file.close()
+        os.chmod(self.file.name, 0o666 & ~UMASK)  # NamedTemporaryFile is created with 0600
+        os.replace(self.file.name, self.path)
+
+    def abort(self) -> None:
+        """
+        Removes the temporary file, leaving the output path untouched.
+        :return: None
+        """
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+
+class NdjsonWriter(JsonWriter):
+    """
+    Writes one compact JSON object per line (JSON Lines), which can be loaded line by line,
+    e.g. by ClickHouse `JSONEachRow`. No records give an empty file.
+    """
+    extension: str = "ndjson"
+    indent: Optional[int] = None
+
+    def write(self, record: dict) -> None:
+        self.file.write(self.encoder.encode(record))
+        self.file.write("\n")
+        self.count += 1
+
+    def write_footer(self) -> None:
+        pass
+
+
+class ClickHouseWriter(object):
+    def __init__(self, table: str, fallback: JsonWriter, batch_size: int = 10000):
+        """
+        Inserts records straight into the ClickHouse table instead of writing a file for a separate loader.
+
+        Records are inserted column by column in batches of `batch_size`. Before the first batch the rows
+        previously loaded from the same file (`original_file_name`) are deleted, so a re-uploaded file replaces
+        its data instead of duplicating it. If an error occurs after some batches were inserted, the rows
+        of the file are deleted again. If ClickHouse is unreachable before the first insert,
+        the records are written by the `fallback` file writer.
+
+        :param table: The name of the table in the DATABASE.
+        :param fallback: The file writer used if ClickHouse is unreachable.
+        :param batch_size: The number of records inserted at once.
+        """
+        self.table: str = table
+        self.fallback: JsonWriter = fallback
+        self.batch_size: int = batch_size
+        self.batch: List[dict] = []
+        self.count: int = 0
+        self.inserted: int = 0
+        self.original_file_name: Optional[str] = None
+        self.use_fallback: bool = False
+
+    def __enter__(self) -> "ClickHouseWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(self, record: dict) -> None:
+        self.count += 1
+        if self.use_fallback:
+            self.fallback.write(record)
+            return
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.write(record)
+
+    def write_frame(self, df: DataFrame) -> None:
+        self.write_many(iter_frame_records(df))
+
+    def flush(self) -> None:
+        """
+        Inserts the collected records. The first call deletes the previously loaded rows of the file
+        or switches to the fallback writer if ClickHouse is unreachable.
+        :return: None
+        """
+        if not self.batch or self.use_fallback:
+            return
+        from scripts.settings_dkp import clickhouse_pool, MissingEnvironmentVariable, OperationalError
+        try:
+            with clickhouse_pool.acquire() as client:
+                if self.original_file_name is None:
+                    self.original_file_name = self.batch[0].get("original_file_name")
+                    self._delete_file_rows(client)
+                column_names: List[str] = list(self.batch[0])
+                client.insert(
+                    self.table,
+                    [[record.get(column) for record in self.batch] for column in column_names],
+                    column_names=column_names,
+                    column_oriented=True
+                )
+        except (OperationalError, MissingEnvironmentVariable) as exception:
+            if self.inserted:
+                raise
+            logger.warning(f"ClickHouse is unreachable ({exception}). Records are written to {self.fallback.path}")
+            self.use_fallback = True
+            self.fallback.open()
+            self.fallback.write_many(self.batch)
+        else:
+            self.inserted += len(self.batch)
+        self.batch = []
+
+    def _delete_file_rows(self, client) -> None:
+        if self.original_file_name is not None:
+            client.command(
+                f"ALTER TABLE {self.table} DELETE WHERE original_file_name = %(original_file_name)s",
+                parameters={"original_file_name": self.original_file_name},
+                settings={"mutations_sync": 2}
+            )
+
+    def commit(self) -> None:
+        self.flush()
+        if self.use_fallback:
+            self.fallback.commit()
+        logger.info(f"{self.inserted} records are inserted into {self.table}")
+
+    def abort(self) -> None:
+        """
+        Deletes the rows of the file inserted so far (or removes the temporary file of the fallback writer).
+        :return: None
+        """
+        self.batch = []
+        if self.use_fallback:
+            self.fallback.abort()
+        elif self.inserted:
+            from scripts.settings_dkp import clickhouse_pool
+            try:
+                with clickhouse_pool.acquire() as client:
+                    self._delete_file_rows(client)
+            except Exception as exception:
+                logger.error(f"Failed to delete {self.inserted} inserted records from {self.table}: {exception}")
+
+
+class ParquetWriter(JsonWriter):
+    """
+    Writes a Parquet file, so readers get typed columns and skip JSON parsing. Requires pyarrow.
+
+    DataFrames are converted with their dtypes (e.g. the `dict_types` of the converter), records are collected
+    by columns. A column with values of different types (e.g. numbers and strings) is written as strings.
+    The whole table is written when the writer is closed.
+    """
+    extension: str = "parquet"
+    mode: str = "wb"
+
+    def __init__(self, path: str, encoder: Optional[StdlibEncoder] = None):
+        super().__init__(path, encoder)
+        self.columns: Dict[str, list] = {}
+        self.tables: list = []
+
+    def open(self) -> None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as exception:
+            raise ImportError("pyarrow is required for DATACORE_OUTPUT_FORMAT=parquet") from exception
+        super().open()
+
+    def write(self, record: dict) -> None:
+        for key in record:
+            if key not in self.columns:
+                self.columns[key] = [None] * self.count
+        for key, values in self.columns.items():
+            values.append(record.get(key))
+        self.count += 1
+
+    def write_frame(self, df: DataFrame) -> None:
+        import pyarrow as pa
+        df = df.replace({"NaT": None})
+        self.flush_columns()
+        self.tables.append(pa.Table.from_arrays(
+            [self._to_arrow_array(df[column]) for column in df.columns],
+            names=[str(column) for column in df.columns]
+        ))
+        self.count += len(df)
+
+    def flush_columns(self) -> None:
+        import pyarrow as pa
+        if self.columns:
+            self.tables.append(pa.Table.from_arrays(
+                [self._to_arrow_array(values) for values in self.columns.values()],
+                names=list(self.columns)
+            ))
+            self.columns = {}
+
+    @staticmethod
+    def _to_arrow_array(values: Any) -> Any:
+        import pyarrow as pa
+        try:
+            return pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.array([None if pd.isna(value) else str(value) for value in values])
+
+    def write_footer(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.flush_columns()
+        table = pa.concat_tables(self.tables) if self.tables else pa.table({})
+        pq.write_table(table, self.file)
+
+
+OUTPUT_FORMATS: Dict[str, Type[JsonWriter]] = {
+    "json": JsonWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter
+}
+
+
+def get_output_format() -> str:
+    """
+    Returns the output format from DATACORE_OUTPUT_FORMAT ("json" by default).
+    :return: The name of the output format.
+    """
+    output_format: str = os.environ.get("DATACORE_OUTPUT_FORMAT", "json").lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format}. Available formats - {list(OUTPUT_FORMATS)}")
+    return output_format
+
+
+def create_writer(
+    output_folder: str,
+    name: str,
+    table: Optional[str] = None
+) -> Union[JsonWriter, ClickHouseWriter]:
+    """
+    Creates the writer of the selected output format.
+
+    If DATACORE_SINK=clickhouse and the converter has a table, records are inserted into the table
+    (renamed by DATACORE_TABLE_<TABLE>, e.g. DATACORE_TABLE_DKP) and the file is written only
+    if ClickHouse is unreachable.
+
+    :param output_folder: The folder for the output file.
+    :param name: The name of the output file without the extension.
+    :param table: The ClickHouse table for the records of the converter.
+    :return: The writer. The file is named `<name>.<extension of the format>`.
+    """
+    writer_class: Type[JsonWriter] = OUTPUT_FORMATS[get_output_format()]
+    writer: JsonWriter = writer_class(os.path.join(output_folder, f"{name}.{writer_class.extension}"))
+    if table and os.environ.get("DATACORE_SINK", "file") == "clickhouse":
+        return ClickHouseWriter(
+            os.environ.get(f"DATACORE_TABLE_{table.upper()}", table),
+            writer,
+            int(os.environ.get("DATACORE_CLICKHOUSE_BATCH", 10000))
+        )
+    return writer
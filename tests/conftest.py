@@ -0,0 +1,19 @@
+import pytest
+from pathlib import PosixPath
+from scripts.metrics import metrics
+from scripts.settings_dkp import notifier
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Keeps the shared state of the notifications and the metrics in the temporary folder of the test
+    and replaces sending of the notifications reported by the converters with a no-op.
+    """
+    monkeypatch.setattr(notifier.limiter, "state_path", str(tmp_path / "notifications.json"))
+    monkeypatch.setattr(notifier, "batch_interval", 0)
+    monkeypatch.setattr(notifier, "send_telegram", lambda message: None)
+    monkeypatch.setattr(notifier, "send_email", lambda message, subject=None: None)
+    monkeypatch.setattr(metrics, "state_path", str(tmp_path / "metrics.json"))
+    yield
+    notifier.flush()
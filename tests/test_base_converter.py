@@ -0,0 +1,91 @@
+import json
+import pytest
+import importlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from pathlib import PosixPath
+from scripts.base_converter import BaseFlatConverter
+
+terminals_plans_p1_p4 = importlib.import_module("scripts.terminals_plans_p1-p4")
+
+
+class Plan(BaseFlatConverter):
+    headers_eng: dict = {"Клиент": "client", "Сумма": "amount", "Дата": "date"}
+    round_columns: tuple = ("amount", "missing")
+    date_columns: tuple = ("date", "missing_date")
+
+
+def test_transform(tmp_path: PosixPath) -> None:
+    """
+    Tests that the stages described by the class attributes are applied to the DataFrame.
+    """
+    df: pd.DataFrame = pd.DataFrame({
+        "Клиент": ["  РУСКОН ", np.nan, "ТРАНС"],
+        "Сумма": [1.239, np.nan, 2.0],
+        "Дата": [datetime(2024, 5, 1), np.nan, "05.03.2024"]
+    })
+    df = Plan(str(tmp_path / "plan.xlsx"), str(tmp_path)).transform(df)
+
+    assert list(df.columns) == ["client", "amount", "date", "original_file_name", "original_file_parsed_on"]
+    assert df["client"].tolist() == ["РУСКОН", "ТРАНС"]
+    assert df["amount"].tolist() == [1.24, 2.0]
+    assert df["date"].tolist() == ["2024-05-01", "2024-03-05"]
+    assert df["original_file_name"].unique().tolist() == ["plan.xlsx"]
+
+
+def test_strip_values() -> None:
+    """
+    Tests that only strings are stripped and values of other types keep their types.
+    """
+    df: pd.DataFrame = pd.DataFrame({
+        "repeated": [" Шанхай ", "Нинбо", None, " Шанхай ", " Шанхай ", np.nan],
+        "unique": [" a", "b ", " c ", "d", None, "e"],
+        "mixed": [" 1 ", 1, 1.0, True, datetime(2024, 5, 1), None],
+        "numbers": [1.5, 2.0, np.nan, 3.0, 4.0, 5.0],
+        "empty": [None] * 6,
+        "dates": pd.to_datetime(["2024-05-01"] * 6)
+    })
+
+    pd.testing.assert_frame_equal(
+        BaseFlatConverter.strip_values(df),
+        df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    )
+    assert df.loc[0, "repeated"] == " Шанхай "
+
+
+@pytest.mark.parametrize("values", [
+    pd.Series([datetime(2024, 5, 1), datetime(2024, 5, 1, 10, 5), datetime(2024, 5, 1, 0, 0, 0, 500), pd.NaT]),
+    pd.Series(["05.03.2024", "5.3.2024", "31.02.2024", "2024-05-01", "01.05.2024", None, "bad", "05.03.2024"]),
+    pd.Series(["2024-05-01", "2024-5-1", "0001-01-01", "2024-05-01 10:05:00", "20240501", np.nan, "2024-05-01T00:00"]),
+    pd.Series([datetime(2024, 5, 1), "05.03.2024", 45000, pd.NaT, None]),
+    pd.Series([None, np.nan], dtype=object),
+    pd.Series([], dtype=object),
+])
+def test_convert_format_dates(values: pd.Series) -> None:
+    """
+    Tests that the column is converted like every value by `convert_format_date`.
+    """
+    expected: list = [BaseFlatConverter.convert_format_date(str(value)) for value in values]
+    assert BaseFlatConverter.convert_format_dates(values).tolist() == expected
+
+
+def test_terminals_plans_p1_p4(tmp_path: PosixPath) -> None:
+    """
+    Tests the columns taken from the file name and derived from other columns in a converter.
+    """
+    input_file_path: str = str(tmp_path / "plan 2024.xlsx")
+    pd.DataFrame({
+        "разм": [20, 40, 45],
+        "месяц": ["янв", "фев", "дек"],
+        "кол-во конт": [1, 2, 3],
+        "ставка": [1.005, 2.0, 3.0]
+    }).to_excel(input_file_path, index=False)
+
+    terminals_plans_p1_p4.TerminalsPlansP1P4(input_file_path, str(tmp_path)).main()
+
+    with open(tmp_path / "plan 2024.xlsx.json", encoding="utf-8") as f:
+        records: list = json.load(f)
+    assert [record["year"] for record in records] == [2024, 2024, 2024]
+    assert [record["month"] for record in records] == [1, 2, 12]
+    assert [record["teu"] for record in records] == [1, 4, None]
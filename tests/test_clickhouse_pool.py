@@ -0,0 +1,74 @@
+import pytest
+from typing import List
+from scripts.settings_dkp import ClickHouseClientPool
+from clickhouse_connect.driver.exceptions import OperationalError, DatabaseError
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.healthy: bool = True
+        self.closed: bool = False
+
+    def ping(self) -> bool:
+        return self.healthy
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def clients(mocker) -> List[FakeClient]:
+    """
+    Replaces the connection to ClickHouse with fake clients and returns the list of created clients.
+    """
+    created: List[FakeClient] = []
+
+    def create_client() -> FakeClient:
+        created.append(FakeClient())
+        return created[-1]
+
+    mocker.patch("scripts.settings_dkp.ClickHouseClientPool._create_client", side_effect=create_client)
+    return created
+
+
+def test_client_is_reused(clients: List[FakeClient]) -> None:
+    """
+    A batch of files makes one connection instead of one connection per file.
+    """
+    pool: ClickHouseClientPool = ClickHouseClientPool()
+    for _ in range(50):
+        with pool.acquire() as client:
+            assert client is clients[0]
+    assert len(clients) == 1
+
+
+def test_concurrent_acquire_opens_new_client(clients: List[FakeClient]) -> None:
+    pool: ClickHouseClientPool = ClickHouseClientPool(max_size=2)
+    with pool.acquire() as first, pool.acquire() as second:
+        assert first is not second
+    assert pool.size == 2
+
+
+def test_unhealthy_client_is_reconnected(clients: List[FakeClient]) -> None:
+    pool: ClickHouseClientPool = ClickHouseClientPool(health_check_interval=0)
+    with pool.acquire():
+        pass
+    clients[0].healthy = False
+    with pool.acquire() as client:
+        assert client is clients[1]
+    assert clients[0].closed
+    assert pool.size == 1
+
+
+def test_client_is_discarded_after_operational_error(clients: List[FakeClient]) -> None:
+    pool: ClickHouseClientPool = ClickHouseClientPool()
+    with pytest.raises(OperationalError):
+        with pool.acquire():
+            raise OperationalError("connection reset")
+    assert clients[0].closed
+    with pytest.raises(DatabaseError):
+        with pool.acquire():
+            raise DatabaseError("syntax error")
+    with pool.acquire() as client:
+        assert client is clients[1]
+    assert len(clients) == 2
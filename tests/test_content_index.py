@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import pytest
+from pathlib import PosixPath
+from scripts.content_index import ContentIndex, get_content_key, hash_file
+
+
+@pytest.fixture
+def workbook(tmp_path: PosixPath) -> str:
+    path: str = str(tmp_path / "plan.xlsx")
+    with open(path, "wb") as f:
+        f.write(b"workbook" * 1000)
+    return path
+
+
+def test_hash_file(workbook: str) -> None:
+    assert hash_file(workbook) == hashlib.sha256(b"workbook" * 1000).hexdigest()
+
+
+def test_get_content_key(workbook: str, tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Tests that the key changes with everything the output depends on.
+    """
+    monkeypatch.delenv("DATACORE_OUTPUT_FORMAT", raising=False)
+    key: str = get_content_key(workbook, (10, 123))
+    assert get_content_key(workbook, (10, 123)) == key
+    assert get_content_key(workbook, (11, 123)) != key
+
+    copy: str = str(tmp_path / "copy.xlsx")
+    with open(workbook, "rb") as source, open(copy, "wb") as destination:
+        destination.write(source.read())
+    assert get_content_key(copy, (10, 123)) != key
+
+    monkeypatch.setenv("DATACORE_OUTPUT_FORMAT", "ndjson")
+    assert get_content_key(workbook, (10, 123)) != key
+
+    monkeypatch.delenv("DATACORE_OUTPUT_FORMAT")
+    monkeypatch.setenv("DKP_DIFF", "1")
+    assert get_content_key(workbook, (10, 123)) != key
+
+    monkeypatch.delenv("DKP_DIFF")
+    with open(workbook, "ab") as f:
+        f.write(b"changed row")
+    assert get_content_key(workbook, (10, 123)) != key
+
+
+def test_content_index(tmp_path: PosixPath, workbook: str) -> None:
+    """
+    Tests that the index keeps the last key of every file name between instances and only the latest files.
+    """
+    path: str = str(tmp_path / ".content_index.json")
+    ContentIndex(path).add("a", workbook)
+    index: ContentIndex = ContentIndex(path, max_entries=2)
+    assert index.get(workbook)["key"] == "a"
+    assert index.get(str(tmp_path / "other.xlsx")) is None
+
+    index.add("b", workbook)
+    assert index.get(workbook)["key"] == "b"
+    index.add("c", str(tmp_path / "other.xlsx"))
+    index.add("d", str(tmp_path / "third.xlsx"))
+    assert index.get(workbook) is None
+    with open(path) as f:
+        assert list(json.load(f)) == ["other.xlsx", "third.xlsx"]
+    assert sorted(os.listdir(tmp_path)) == [".content_index.json", ".content_index.json.lock", "plan.xlsx"]
+
+    index.discard(str(tmp_path / "other.xlsx"))
+    assert index.get(str(tmp_path / "other.xlsx")) is None
+
+
+def test_content_index_ignores_broken_file(tmp_path: PosixPath, workbook: str) -> None:
+    path: str = str(tmp_path / ".content_index.json")
+    with open(path, "w") as f:
+        f.write("{broken")
+    index: ContentIndex = ContentIndex(path)
+    assert index.get(workbook) is None
+    index.add("a", workbook)
+    assert index.get(workbook)["key"] == "a"
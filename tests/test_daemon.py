@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import pytest
+from pathlib import PosixPath
+from scripts.metrics import MetricsRegistry
+from scripts.daemon import Pipeline, process_file, convert_file, update_metrics
+
+
+class DummyConverter(object):
+    """
+    Converter which behaves like the real scripts: writes a json file or exits with an error code.
+    """
+    def __init__(self, input_file_path: str, output_folder: str):
+        self.input_file_path: str = input_file_path
+        self.output_folder: str = output_folder
+
+    def main(self) -> None:
+        basename: str = os.path.basename(self.input_file_path)
+        if basename.startswith("exit"):
+            print("4", file=sys.stderr)
+            sys.exit(int(basename[4]))
+        if basename.startswith("raise"):
+            raise ValueError("broken file")
+        if basename.startswith("delete"):
+            os.remove(self.input_file_path)
+        with open(os.path.join(self.output_folder, f"{basename}.json"), "w") as f:
+            f.write("[]")
+
+
+@pytest.fixture
+def pipeline(tmp_path: PosixPath, monkeypatch) -> Pipeline:
+    """
+    A fixture that provides a pipeline with the dummy converter and prepared folders.
+    :return: An instance of the Pipeline class.
+    """
+    monkeypatch.setenv("XL_IDP_PATH_DATACORE", str(tmp_path))
+    pipeline: Pipeline = Pipeline("dummy", "flat_dummy", __name__, "DummyConverter")
+    os.makedirs(pipeline.xls_path)
+    pipeline.converter = DummyConverter
+    pipeline.prepare_folders()
+    return pipeline
+
+
+def create_file(pipeline: Pipeline, name: str, age: float = 60) -> str:
+    path: str = os.path.join(pipeline.xls_path, name)
+    with open(path, "w") as f:
+        f.write("data")
+    os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("plan.xlsx", True),
+    ("PLAN.XLSX", True),
+    ("plan.xml", True),
+    ("plan.csv", False),
+    ("error_plan.xlsx", False),
+])
+def test_is_suitable(pipeline: Pipeline, filename: str, expected: bool) -> None:
+    assert pipeline.is_suitable(filename) is expected
+
+
+@pytest.mark.parametrize("filename, expected_code", [
+    ("plan.xlsx", 0),
+    ("exit4.xlsx", 4),
+    ("exit6.xlsx", 6),
+    ("raise.xlsx", 1),
+])
+def test_convert_file_exit_codes(pipeline: Pipeline, filename: str, expected_code: int) -> None:
+    assert convert_file(pipeline, create_file(pipeline, filename)) == expected_code
+
+
+def test_process_file_moves_files(pipeline: Pipeline) -> None:
+    """
+    Successful files go to `done`, failed ones are renamed to `error_<name>` like in the bash scripts.
+    """
+    assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    assert os.path.exists(os.path.join(pipeline.done_path, "plan.xlsx"))
+    assert os.path.exists(os.path.join(pipeline.json_path, "plan.xlsx.json"))
+
+    assert process_file(pipeline, create_file(pipeline, "exit5.xlsx")) == 5
+    assert os.path.exists(os.path.join(pipeline.xls_path, "error_exit5.xlsx"))
+    assert not os.path.exists(os.path.join(pipeline.xls_path, "exit5.xlsx"))
+
+
+def test_process_file_deleted_during_conversion(pipeline: Pipeline) -> None:
+    """
+    A file deleted during the conversion can't be moved, the failure is logged instead of raised.
+    """
+    assert process_file(pipeline, create_file(pipeline, "delete.xlsx")) == 0
+    assert os.listdir(pipeline.done_path) == []
+
+
+def test_process_file_skips_identical_file(pipeline: Pipeline, mocker, monkeypatch) -> None:
+    """
+    An identical file dropped again is moved to `done` without conversion, unless the reference has changed.
+    """
+    assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    main = mocker.spy(DummyConverter, "main")
+
+    assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    assert main.call_count == 0
+    assert os.path.exists(os.path.join(pipeline.done_path, "plan.xlsx"))
+    assert not os.path.exists(os.path.join(pipeline.xls_path, "plan.xlsx"))
+
+    assert process_file(pipeline, create_file(pipeline, "other.xlsx")) == 0
+    assert main.call_count == 1
+
+    DummyConverter.get_reference_version = staticmethod(lambda: (2, 1))
+    try:
+        assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    finally:
+        del DummyConverter.get_reference_version
+    assert main.call_count == 2
+
+    monkeypatch.setenv("DATACORE_DEDUP", "0")
+    assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    assert main.call_count == 3
+
+    monkeypatch.delenv("DATACORE_DEDUP")
+    assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    DummyConverter.is_dedup_supported = staticmethod(lambda: False)
+    try:
+        assert process_file(pipeline, create_file(pipeline, "plan.xlsx")) == 0
+    finally:
+        del DummyConverter.is_dedup_supported
+    assert main.call_count == 5
+
+
+def test_process_file_converts_reverted_file(pipeline: Pipeline, mocker) -> None:
+    """
+    A file reverted to an earlier version is converted, since the consumers last got the output of the other version.
+    """
+    main = mocker.spy(DummyConverter, "main")
+    for contents in ("A", "B", "A", "A"):
+        path: str = create_file(pipeline, "plan.xlsx")
+        with open(path, "w") as f:
+            f.write(contents)
+        assert process_file(pipeline, path) == 0
+    assert main.call_count == 3
+
+
+def test_process_file_doesnt_index_failed_file(pipeline: Pipeline, mocker) -> None:
+    main = mocker.spy(DummyConverter, "main")
+    assert process_file(pipeline, create_file(pipeline, "exit5.xlsx")) == 5
+    assert process_file(pipeline, create_file(pipeline, "exit5.xlsx")) == 5
+    assert main.call_count == 2
+
+
+def test_process_file_metrics(pipeline: Pipeline, tmp_path: PosixPath, mocker) -> None:
+    """
+    Tests that the files are counted by the exit code, the skipped files and the queues of the pipelines are tracked.
+    """
+    registry: MetricsRegistry = MetricsRegistry(str(tmp_path / "metrics.json"))
+    mocker.patch("scripts.metrics.METRICS_FILE", str(tmp_path / "datacore.prom"))
+    mocker.patch("scripts.daemon.metrics", registry)
+    finished: list = [
+        (pipeline, path, process_file(pipeline, path))
+        for path in [create_file(pipeline, "plan.xlsx"), create_file(pipeline, "exit5.xlsx")]
+    ]
+    process_file(pipeline, create_file(pipeline, "plan.xlsx"))
+    scheduler = mocker.Mock(get_load=lambda: {"dummy": (4, 1)})
+    update_metrics(scheduler, finished)
+    registry.flush()
+
+    with open(tmp_path / "datacore.prom", encoding="utf-8") as f:
+        text: str = f.read()
+    assert 'datacore_files_total{code="0",pipeline="dummy"} 1' in text
+    assert 'datacore_files_total{code="5",pipeline="dummy"} 1' in text
+    assert 'datacore_files_skipped_total{pipeline="dummy"} 1' in text
+    assert 'datacore_file_duration_seconds_count{pipeline="dummy"} 2' in text
+    assert 'datacore_queue_depth{pipeline="dummy"} 4' in text
+    assert 'datacore_running_files{pipeline="dummy"} 1' in text
@@ -1,7 +1,11 @@
 import os
 import json
 import pytest
+import datetime
+import openpyxl
+import numpy as np
 from scripts.dkp import DKP
+from scripts.settings_dkp import MONTH_NAMES
 from pathlib import PosixPath
 from typing import Optional, Union
 from _pytest.logging import LogCaptureFixture
@@ -619,6 +623,24 @@ def test_write_to_json(dkp_instance: DKP, tmp_path: PosixPath) -> None:
     assert first_entry["project"] == "Test Project"
 
 
+def test_write_to_json_without_records(dkp_instance: DKP, tmp_path: PosixPath, mocker) -> None:
+    """
+    Tests that no records are reported with the error code 4 and no file is created.
+
+    :param dkp_instance: An instance of the DKP class.
+    :param tmp_path: A temporary path to write the JSON file.
+    :return: None
+    """
+    telegram = mocker.patch("scripts.dkp.telegram")
+    dkp_instance.folder = tmp_path
+    with pytest.raises(SystemExit) as excinfo:
+        dkp_instance.write_to_json(iter([]))
+
+    assert excinfo.value.code == 4
+    assert telegram.call_args[0][0].startswith("Error code 4")
+    assert os.listdir(tmp_path) == []
+
+
 def validate_record_fields(record: dict, expected_values: dict) -> None:
     """
     Validates that the given record contains the expected values in its fields.
@@ -723,3 +745,167 @@ def test_get_content_in_table(
 
     record: dict = dkp_instance.get_content_in_table(1, month_string, row, metadata)
     validate_record_fields(record, expected_values)
+
+
+@pytest.mark.parametrize("rows, columns_positions", [
+    (
+        [
+            ["1", "РУСКОН ООО", "Новые клиенты", "Без проекта", "Китай", "импорт", "АЧБ",
+             None, "20", "Новые клиенты", "20", "Новые клиенты", "20"],
+            ["2", "РУСКОН ООО", None, "Без проекта", "Китай", "импорт", "АЧБ",
+             None, "40", 0, "40", 0, "40"],
+            ["3", "РУСКОН ООО", "Клиент", "да", " 1 234 ", "нет", "1,5",
+             "SOC", "20", "Клиент", "20.0", "Клиент", "20"],
+        ],
+        {
+            "client": 2,
+            "project": 3,
+            "cargo": 4,
+            "direction": 5,
+            "bay": 6,
+            "owner": 7,
+            "container_size": 8,
+            "profit_plan_client": 9,
+            "profit_plan_container_size": 10,
+            "costs_plan_client": 11,
+            "costs_plan_container_size": 12,
+        },
+    ),
+])
+def test_parse_table(dkp_instance: DKP, rows: list, columns_positions: dict) -> None:
+    """
+    Tests that the column-wise `_parse_table` builds the same records as `get_content_in_table` row by row.
+
+    :param dkp_instance: An instance of the DKP class.
+    :param rows: The rows of the table.
+    :param columns_positions: A dictionary mapping column names to their positions.
+    :return: None
+    """
+    metadata: dict = dkp_instance.extract_metadata_from_filename()
+    for column, position in columns_positions.items():
+        dkp_instance.dict_columns_position[column] = position
+
+    records: list = dkp_instance._parse_table(
+        np.array(rows, dtype=object), list(range(len(rows))), metadata, "2024-01-01 00:00:00"
+    )
+    expected: list = [
+        {
+            **dkp_instance.get_content_in_table(index_month, month_string, row, metadata),
+            "original_file_parsed_on": "2024-01-01 00:00:00"
+        }
+        for row in rows
+        for index_month, month_string in enumerate(MONTH_NAMES, start=1)
+    ]
+    assert json.dumps(records, ensure_ascii=False) == json.dumps(expected, ensure_ascii=False)
+
+
+def test_parse_table_reports_row_error(dkp_instance: DKP, mocker) -> None:
+    """
+    Tests that a row with inconsistent client is reported with the error code 5 and its row number.
+
+    :param dkp_instance: An instance of the DKP class.
+    :return: None
+    """
+    telegram = mocker.patch("scripts.dkp.telegram")
+    metadata: dict = dkp_instance.extract_metadata_from_filename()
+    dkp_instance.dict_columns_position.update({"client": 0, "profit_plan_client": 1, "costs_plan_client": 2})
+    rows: np.ndarray = np.array([["Клиент", "Клиент", "Клиент"], ["Клиент", "Другой", "Клиент"]], dtype=object)
+
+    with pytest.raises(SystemExit) as excinfo:
+        dkp_instance._parse_table(rows, [10, 11], metadata, "2024-01-01 00:00:00")
+
+    assert excinfo.value.code == 5
+    assert telegram.call_args[0][0].startswith("Error code 5: Ошибка возникла в строке 12!")
+    assert "client: 'Клиент' not equal to profit_plan_client: 'Другой'" in telegram.call_args[0][0]
+
+
+def test_build_month_positions(dkp_instance: DKP) -> None:
+    """
+    Tests that the monthly columns are found by indexing `month_positions` once the positions are known.
+
+    :param dkp_instance: An instance of the DKP class.
+    :return: None
+    """
+    metadata: dict = dkp_instance.extract_metadata_from_filename()
+    assert dkp_instance.month_columns[1][0] == "natural_indicators_ktk_feb"
+    assert (dkp_instance.month_positions == -1).all()
+
+    dkp_instance.dict_columns_position.update({
+        "natural_indicators_ktk_feb": 1, "natural_indicators_teus_feb": 2
+    })
+    dkp_instance.build_month_positions()
+    assert dkp_instance.month_positions[1].tolist() == [1, 2, -1, -1]
+    assert dkp_instance.month_positions[0].tolist() == [-1, -1, -1, -1]
+
+    row: list = ["1", "5", "10"]
+    record: dict = dkp_instance.get_content_in_table(2, "фев", row, metadata)
+    validate_record_fields(record, {
+        "container_count": 5,
+        "teu": 10,
+        "profit_plan_thousand_rub": None,
+        "costs_plan_thousand_rub": None,
+    })
+
+
+def test_parse_workbook_reads_like_pandas(dkp_instance: DKP, tmp_path: PosixPath, mocker) -> None:
+    """
+    Tests that the streaming reader passes the same rows to `parse_rows` as the DataFrame one.
+
+    :param dkp_instance: An instance of the DKP class.
+    :param tmp_path: A temporary path to write the workbook.
+    :return: None
+    """
+    workbook: openpyxl.Workbook = openpyxl.Workbook()
+    narrow = workbook.active
+    narrow.title = "ПЛАН ПРОДАЖ"
+    wide = workbook.create_sheet("ПЛАН_ПРОДАЖ")
+    workbook.create_sheet("Прочее")["A1"] = "ignored"
+    narrow.append(["клиент", None, 1.0])
+    narrow.append([None])
+    narrow.append(["#N/A", "NULL", 2.5, None, None])
+    wide.append([" РУСКОН ", 20, 40.0, 1e-05, True, datetime.datetime(2024, 1, 31), "NaT", None])
+    wide.append([])
+    wide.append([None, None, "x"])
+    wide.append([None])
+    wide.append(["Итого", None, None, None, None, None, None, 5])
+    wide["B5"].value = "#DIV/0!"
+    workbook.save(tmp_path / "plan.xlsx")
+    dkp_instance.filename = str(tmp_path / "plan.xlsx")
+
+    parsed: list = []
+    mocker.patch.object(
+        DKP, "parse_rows", side_effect=lambda rows, max_df_columns, *args: parsed.append((list(rows), max_df_columns))
+    )
+    dkp_instance.parse_dataframe()
+    dkp_instance.parse_workbook()
+
+    assert parsed[0] == parsed[1]
+    assert parsed[1][1] == 8
+    assert parsed[1][0][0] == (0, [" РУСКОН ", "20", "40", "1e-05", "True", "2024-01-31 00:00:00", None, None,
+                                   "клиент", None, "1"])
+
+
+def test_write_to_json_diff(dkp_instance: DKP, tmp_path: PosixPath, mocker) -> None:
+    """
+    Tests that with DKP_DIFF only the changes since the previous file of the department and year are written.
+
+    :param dkp_instance: An instance of the DKP class.
+    :param tmp_path: A temporary path to write the JSON file.
+    :return: None
+    """
+    mocker.patch("scripts.dkp.DKP_DIFF", True)
+    mocker.patch("scripts.dkp.DKP_DIFF_STATE", str(tmp_path / "diff"))
+    assert not DKP.is_dedup_supported()
+    dkp_instance.folder = tmp_path
+    output_file: PosixPath = tmp_path / f"{dkp_instance.basename_filename}.json"
+    data: list = [
+        {"client": "A", "month": 1, "teu": 1.0, "department": "ДКП", "year": 2024},
+        {"client": "B", "month": 1, "teu": 2.0, "department": "ДКП", "year": 2024}
+    ]
+    dkp_instance.write_to_json(iter(data))
+    with open(output_file, encoding="utf-8") as f:
+        assert [record["change_type"] for record in json.load(f)] == ["insert", "insert"]
+
+    dkp_instance.write_to_json(iter([data[0], {**data[1], "teu": 3.0}]))
+    with open(output_file, encoding="utf-8") as f:
+        assert json.load(f) == [{**data[1], "teu": 3.0, "change_type": "update"}]
@@ -0,0 +1,85 @@
+import json
+import pytest
+import numpy as np
+import pandas as pd
+from pathlib import PosixPath
+from datetime import date, datetime
+from scripts.writers import JsonWriter, NdjsonWriter
+from scripts.encoders import OrjsonEncoder, StdlibEncoder, create_encoder, default
+
+orjson = pytest.importorskip("orjson")
+
+records: list = [
+    {"client": "РУСКОН ООО", "month": 1, "teu": None, "flag": True, "rate": 1e-05, "amount": 1e16},
+    {"client": "A\nB \"C\" \t\u2028", "month": 12, "teu": 2.5, "flag": False, "rate": 0.1, "amount": -3.0},
+    {"client": "C", "nested": {"months": [1, 2, {"a": []}], "empty": {}}, "big": 2 ** 70},
+    {},
+]
+
+
+@pytest.mark.parametrize("indent", [None, 2, 4])
+def test_orjson_encoder_is_equivalent(indent: int) -> None:
+    """
+    Tests that orjson gives the same values and the same layout (up to the notation of floats) as the standard json.
+    """
+    for record in records:
+        encoded: str = OrjsonEncoder(indent).encode(record)
+        expected: str = StdlibEncoder(indent).encode(record)
+        assert json.loads(encoded) == json.loads(expected)
+        if indent:
+            assert [len(line) - len(line.lstrip()) for line in encoded.split("\n")] == \
+                   [len(line) - len(line.lstrip()) for line in expected.split("\n")]
+
+
+@pytest.mark.parametrize("writer_class", [JsonWriter, NdjsonWriter])
+def test_writers_are_equivalent(tmp_path: PosixPath, writer_class: type) -> None:
+    """
+    Tests that the files written with both backends contain the same records.
+    """
+    contents: list = []
+    for encoder_class in (StdlibEncoder, OrjsonEncoder):
+        path: PosixPath = tmp_path / f"{encoder_class.name}.{writer_class.extension}"
+        with writer_class(str(path), encoder_class(writer_class.indent)) as writer:
+            writer.write_many(records)
+        contents.append(path.read_text(encoding="utf-8"))
+
+    if writer_class is JsonWriter:
+        assert json.loads(contents[0]) == json.loads(contents[1]) == records
+    else:
+        assert [json.loads(line) for line in contents[1].split("\n")[:-1]] == records
+
+
+def test_default() -> None:
+    """
+    Tests that NumPy scalars and dates are encoded natively by both backends.
+    """
+    record: dict = {
+        "count": np.int64(3),
+        "rate": np.float32(0.5),
+        "flag": np.bool_(True),
+        "date": date(2024, 5, 1),
+        "parsed_on": datetime(2024, 5, 1, 10, 5),
+        "timestamp": pd.Timestamp("2024-05-01 10:05")
+    }
+    expected: dict = {
+        "count": 3,
+        "rate": 0.5,
+        "flag": True,
+        "date": "2024-05-01",
+        "parsed_on": "2024-05-01T10:05:00",
+        "timestamp": "2024-05-01T10:05:00"
+    }
+    assert json.loads(StdlibEncoder().encode(record)) == expected
+    assert json.loads(OrjsonEncoder().encode(record)) == expected
+    with pytest.raises(TypeError):
+        default(object())
+
+
+def test_create_encoder(monkeypatch) -> None:
+    monkeypatch.delenv("DATACORE_JSON_BACKEND", raising=False)
+    assert isinstance(create_encoder(), OrjsonEncoder)
+    monkeypatch.setenv("DATACORE_JSON_BACKEND", "json")
+    assert type(create_encoder(4)) is StdlibEncoder
+    monkeypatch.setenv("DATACORE_JSON_BACKEND", "ujson")
+    with pytest.raises(ValueError):
+        create_encoder()
@@ -0,0 +1,58 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from pathlib import PosixPath
+from typing import List
+from scripts import AsyncHandler, get_logger
+
+
+class ThreadRecorder(logging.Handler):
+    """
+    Records the messages and the threads which wrote them.
+    """
+    def __init__(self):
+        super().__init__()
+        self.records: List[tuple] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append((record.getMessage(), threading.current_thread().name))
+
+
+def test_records_are_written_in_background() -> None:
+    """
+    Tests that the records are handled outside the logging thread and the handler level is respected.
+    """
+    recorder: ThreadRecorder = ThreadRecorder()
+    recorder.setLevel(logging.WARNING)
+    logger: logging.Logger = logging.getLogger("test_async_handler")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(AsyncHandler([recorder]))
+    logger.info("skipped")
+    logger.warning("value %s is not a number", "abc")
+
+    deadline: float = time.monotonic() + 5
+    while not recorder.records and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recorder.records == [("value abc is not a number", recorder.records[0][1])]
+    assert recorder.records[0][1] != threading.current_thread().name
+
+
+def log_in_child(name: str) -> None:
+    get_logger(name).info("written by the worker")
+
+
+def test_records_of_worker_process_are_written(tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Tests that a forked worker process writes the queued records before it exits.
+    """
+    monkeypatch.setenv("XL_IDP_ROOT_DATACORE", str(tmp_path))
+    get_logger("test_worker").info("written by the parent")
+    process = multiprocessing.get_context("fork").Process(target=log_in_child, args=("test_worker",))
+    process.start()
+    process.join(10)
+
+    assert process.exitcode == 0
+    with open(os.path.join(tmp_path, "logging", "test_worker.log"), encoding="utf-8") as f:
+        assert "written by the worker" in f.read()
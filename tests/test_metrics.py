@@ -0,0 +1,111 @@
+import os
+import pytest
+import requests
+from pathlib import PosixPath
+from scripts.profiler import FileProfile
+from scripts.metrics import MetricsRegistry, render, start_http_server
+
+
+@pytest.fixture
+def textfile(tmp_path: PosixPath, mocker) -> str:
+    """
+    Enables the metrics with the textfile in the temporary folder and returns the path to it.
+    """
+    path: str = str(tmp_path / "datacore.prom")
+    mocker.patch("scripts.metrics.METRICS_FILE", path)
+    return path
+
+
+def test_flush_writes_textfile(textfile: str, tmp_path: PosixPath) -> None:
+    """
+    Tests that the counters, gauges and histograms are written in the Prometheus text format.
+    """
+    registry: MetricsRegistry = MetricsRegistry(str(tmp_path / "state.json"))
+    registry.inc("datacore_files_total", pipeline="dkp", code="0")
+    registry.inc("datacore_files_total", pipeline="dkp", code="0")
+    registry.inc("datacore_files_total", pipeline="dkp", code="5")
+    registry.set("datacore_queue_depth", 3, pipeline='fore"cast')
+    registry.observe("datacore_file_duration_seconds", 0.3, pipeline="dkp")
+    registry.observe("datacore_file_duration_seconds", 400, pipeline="dkp")
+    registry.flush()
+
+    with open(textfile, encoding="utf-8") as f:
+        lines: list = f.read().splitlines()
+    assert lines[:4] == [
+        "# HELP datacore_files_total Files processed by the daemon by pipeline and exit code.",
+        "# TYPE datacore_files_total counter",
+        'datacore_files_total{code="0",pipeline="dkp"} 2',
+        'datacore_files_total{code="5",pipeline="dkp"} 1',
+    ]
+    assert 'datacore_file_duration_seconds_bucket{pipeline="dkp",le="0.25"} 0' in lines
+    assert 'datacore_file_duration_seconds_bucket{pipeline="dkp",le="0.5"} 1' in lines
+    assert 'datacore_file_duration_seconds_bucket{pipeline="dkp",le="300"} 1' in lines
+    assert 'datacore_file_duration_seconds_bucket{pipeline="dkp",le="+Inf"} 2' in lines
+    assert 'datacore_file_duration_seconds_sum{pipeline="dkp"} 400.3' in lines
+    assert 'datacore_file_duration_seconds_count{pipeline="dkp"} 2' in lines
+    assert 'datacore_queue_depth{pipeline="fore\\"cast"} 3' in lines
+    assert sorted(os.listdir(tmp_path)) == ["datacore.prom", "state.json", "state.json.lock"]
+
+
+def test_flush_adds_changes_of_processes(textfile: str, tmp_path: PosixPath) -> None:
+    """
+    Tests that the changes of several processes (e.g. the workers) are added up and the gauges are replaced.
+    """
+    state_path: str = str(tmp_path / "state.json")
+    first, second = MetricsRegistry(state_path), MetricsRegistry(state_path)
+    first.inc("datacore_records_total", 100, converter="DKP")
+    first.set("datacore_queue_depth", 5, pipeline="dkp")
+    first.flush()
+    second.inc("datacore_records_total", 20, converter="DKP")
+    second.set("datacore_queue_depth", 0, pipeline="dkp")
+    second.flush()
+    first.flush()
+
+    state: dict = first.load()
+    assert state["counter"]["datacore_records_total"] == {'{"converter": "DKP"}': 120}
+    assert state["gauge"]["datacore_queue_depth"] == {'{"pipeline": "dkp"}': 0}
+
+
+def test_metrics_are_disabled_by_default(tmp_path: PosixPath) -> None:
+    registry: MetricsRegistry = MetricsRegistry(str(tmp_path / "state.json"))
+    registry.inc("datacore_files_total", pipeline="dkp", code="0")
+    registry.flush()
+    assert registry.pending["counter"] == {}
+    assert os.listdir(tmp_path) == []
+
+
+def test_profile_adds_stages_to_metrics(textfile: str, tmp_path: PosixPath, mocker) -> None:
+    """
+    Tests that the stages of a file and its written records get to the metrics.
+    """
+    registry: MetricsRegistry = MetricsRegistry(str(tmp_path / "state.json"))
+    mocker.patch("scripts.profiler.metrics", registry)
+    with FileProfile("Forecast", "plan.xlsx") as profile:
+        with profile.stage("read_excel", rows=10):
+            pass
+        with profile.stage("write", rows=8):
+            pass
+    registry.flush()
+
+    text: str = render(registry.load())
+    assert 'datacore_records_total{converter="Forecast"} 8' in text
+    assert 'datacore_stage_duration_seconds_count{converter="Forecast",stage="read_excel"} 1' in text
+    assert 'datacore_stage_duration_seconds_count{converter="Forecast",stage="write"} 1' in text
+
+
+def test_http_server(tmp_path: PosixPath, mocker) -> None:
+    registry: MetricsRegistry = MetricsRegistry(str(tmp_path / "state.json"))
+    mocker.patch("scripts.metrics.METRICS_PORT", 1)
+    mocker.patch("scripts.metrics.metrics", registry)
+    registry.inc("datacore_reference_cache_total", result="hit")
+    server = start_http_server("127.0.0.1", 0)
+    try:
+        response: requests.Response = requests.get(f"http://127.0.0.1:{server.server_port}/metrics", timeout=5)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'datacore_reference_cache_total{result="hit"} 1' in response.text
+        assert requests.get(f"http://127.0.0.1:{server.server_port}/", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert registry.load()["counter"]
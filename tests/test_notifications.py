@@ -0,0 +1,274 @@
+import time
+import pytest
+import threading
+import multiprocessing
+from pathlib import PosixPath
+from typing import List
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scripts.settings_dkp import NotificationDispatcher, NotificationLimiter, notifier
+
+
+class TelegramStub(BaseHTTPRequestHandler):
+    """
+    Answers like the Telegram Bot API and records the sent messages.
+    """
+    messages: List[dict] = []
+    delay: float = 0.0
+
+    def do_GET(self) -> None:
+        time.sleep(self.delay)
+        url = urlparse(self.path)
+        self.messages.append({"path": url.path, **{key: value[0] for key, value in parse_qs(url.query).items()}})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeSMTP(object):
+    """
+    Records the connections and the sent emails instead of talking to the mail server.
+    """
+    connections: List["FakeSMTP"] = []
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.address: tuple = (host, port)
+        self.sent: list = []
+        self.connections.append(self)
+
+    def starttls(self) -> None:
+        pass
+
+    def login(self, user: str, password: str) -> None:
+        pass
+
+    def noop(self) -> tuple:
+        return 250, b"OK"
+
+    def send_message(self, email) -> None:
+        self.sent.append(email)
+
+    def quit(self) -> None:
+        pass
+
+
+@pytest.fixture
+def limiter(tmp_path: PosixPath) -> NotificationLimiter:
+    """
+    A fixture that provides a limiter with its own state file.
+    :return: An instance of the NotificationLimiter class.
+    """
+    return NotificationLimiter(state_path=str(tmp_path / "notifications.json"))
+
+
+@pytest.fixture
+def telegram_stub(monkeypatch, mocker) -> List[dict]:
+    """
+    Starts a local Telegram stub, replaces the SMTP connection with a fake one and returns the sent messages.
+    The messages queued by other tests are sent before, so they don't get to the stub.
+    """
+    notifier.flush()
+    server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    mocker.patch("scripts.settings_dkp.TELEGRAM_API_URL", f"http://127.0.0.1:{server.server_port}")
+    mocker.patch("scripts.settings_dkp.smtplib.SMTP", FakeSMTP)
+    for name, value in {
+        "TOKEN_TELEGRAM": "token", "CHAT_ID": "-100", "TOPIC": "7", "ID": "1",
+        "EMAIL_USER": "datacore@mail.ru", "EMAIL_PASSWORD": "password", "RECIPIENT_EMAIL": "admin@mail.ru"
+    }.items():
+        monkeypatch.setenv(name, value)
+    mocker.patch.object(TelegramStub, "messages", [])
+    mocker.patch.object(TelegramStub, "delay", 0.0)
+    mocker.patch.object(FakeSMTP, "connections", [])
+    yield TelegramStub.messages
+    server.shutdown()
+    server.server_close()
+
+
+def test_notify_doesnt_wait_for_sending(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    """
+    Tests that a slow Telegram doesn't delay the caller and the message is delivered in the background.
+    """
+    TelegramStub.delay = 0.5
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    started: float = time.monotonic()
+    dispatcher.notify("Error code 4: В Файле отсутствуют данные! Файл: plan.xlsx")
+    assert time.monotonic() - started < 0.1
+
+    assert dispatcher.flush(5)
+    assert telegram_stub == [{
+        "path": "/bottoken/sendMessage",
+        "chat_id": "-100/7",
+        "text": "Error code 4: В Файле отсутствуют данные! Файл: plan.xlsx",
+        "reply_to_message_id": "1"
+    }]
+    assert FakeSMTP.connections[0].sent[0]["To"] == "admin@mail.ru"
+
+
+def test_notify_sends_digest(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    """
+    Tests that a burst of messages is sent as one digest and the connections are reused between the digests.
+    """
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0.3, limiter=limiter)
+    for number in range(3):
+        dispatcher.notify(f"Error code 5: файл {number}", f"{number}.xlsx")
+    assert dispatcher.flush(5)
+    dispatcher.notify("Error code 6: файл 3")
+    dispatcher.close()
+
+    assert [message["text"] for message in telegram_stub] == [
+        "Уведомлений: 3\n\n1. Error code 5: файл 0\n\n2. Error code 5: файл 1\n\n3. Error code 5: файл 2",
+        "Error code 6: файл 3"
+    ]
+    assert len(FakeSMTP.connections) == 1
+    assert len(FakeSMTP.connections[0].sent) == 2
+    assert dispatcher.session is None and dispatcher.smtp is None
+
+
+def test_long_message_is_split(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    dispatcher.notify("x" * 5000)
+    assert dispatcher.flush(5)
+    assert [len(message["text"]) for message in telegram_stub] == [4096, 904]
+    assert len(FakeSMTP.connections[0].sent) == 1
+
+
+def test_failed_sending_doesnt_stop_dispatcher(telegram_stub: List[dict], limiter: NotificationLimiter, monkeypatch) -> None:
+    """
+    Tests that an error of one channel neither loses the other channel nor the next messages.
+    """
+    monkeypatch.delenv("TOKEN_TELEGRAM")
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    dispatcher.notify("first")
+    assert dispatcher.flush(5)
+    monkeypatch.setenv("TOKEN_TELEGRAM", "token")
+    dispatcher.notify("second")
+    assert dispatcher.flush(5)
+
+    assert [message["text"] for message in telegram_stub] == ["second"]
+    assert [email.get_content().strip() for email in FakeSMTP.connections[0].sent] == ["first", "second"]
+
+
+def test_limiter_suppresses_repeated_messages(tmp_path: PosixPath) -> None:
+    """
+    Tests that a message with the same error code, file and text template is sent once within the window.
+    """
+    limiter: NotificationLimiter = NotificationLimiter(dedup_window=0.2, state_path=str(tmp_path / "state.json"))
+    assert limiter.allow("Error code 5: Ошибка возникла в строке 12! Файл: plan_1.xlsx. Exception - 'a'", "plan_1.xlsx")
+    assert not limiter.allow(
+        "Error code 5: Ошибка возникла в строке 13! Файл: plan_1.xlsx. Exception - 'b'", "plan_1.xlsx"
+    )
+    assert limiter.allow("Error code 5: Ошибка возникла в строке 12! Файл: plan_2.xlsx. Exception - 'a'", "plan_2.xlsx")
+    assert limiter.allow("Error code 6: Ошибка при обработке файла! Файл: plan_1.xlsx! Ошибка: 'a'", "plan_1.xlsx")
+    assert limiter.pop_suppressed() == {"Error code 5": 1}
+    assert limiter.pop_suppressed() == {}
+
+    time.sleep(0.25)
+    assert limiter.allow("Error code 5: Ошибка возникла в строке 14! Файл: plan_1.xlsx. Exception - 'c'", "plan_1.xlsx")
+
+
+def test_limiter_token_bucket(tmp_path: PosixPath) -> None:
+    """
+    Tests that only `burst` different messages are sent at once and the rest wait for new tokens.
+    """
+    limiter: NotificationLimiter = NotificationLimiter(rate=600, burst=2, state_path=str(tmp_path / "state.json"))
+    assert [limiter.allow(f"Error code 2: file {name}", f"{name}.xlsx") for name in "abc"] == [True, True, False]
+    assert not limiter.allow("Ошибка без кода")
+    assert limiter.pop_suppressed() == {"Error code 2": 1, "Без кода": 1}
+
+    time.sleep(0.15)
+    assert limiter.allow("Error code 2: file d", "d.xlsx")
+
+
+def test_suppressed_messages_are_reported_in_next_digest(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    dispatcher.notify("Error code 4: В Файле отсутствуют данные! Файл: plan.xlsx", "plan.xlsx")
+    assert dispatcher.flush(5)
+    dispatcher.notify("Error code 4: В Файле отсутствуют данные! Файл: plan.xlsx", "plan.xlsx")
+    dispatcher.notify("Error code 6: Ошибка при обработке файла! Файл: plan.xlsx! Ошибка: 'x'", "plan.xlsx")
+    assert dispatcher.flush(5)
+
+    assert [message["text"] for message in telegram_stub] == [
+        "Error code 4: В Файле отсутствуют данные! Файл: plan.xlsx",
+        "Error code 6: Ошибка при обработке файла! Файл: plan.xlsx! Ошибка: 'x'\n\n"
+        "Подавлено повторных уведомлений: 1 (Error code 4 - 1)"
+    ]
+
+
+def allow_in_process(limiter: NotificationLimiter, names: str, results: multiprocessing.Queue) -> None:
+    results.put([limiter.allow(f"Error code 5: file {name}", f"{name}.xlsx") for name in names])
+
+
+def test_limiter_is_shared_by_processes(tmp_path: PosixPath) -> None:
+    """
+    Tests that the worker processes share one token bucket and one table of the sent messages.
+    """
+    limiter: NotificationLimiter = NotificationLimiter(rate=0, burst=3, state_path=str(tmp_path / "state.json"))
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    for names in ("ab", "ac"):
+        process = multiprocessing.get_context("fork").Process(target=allow_in_process, args=(limiter, names, results))
+        process.start()
+        process.join()
+    assert [results.get(), results.get()] == [[True, True], [False, True]]
+    assert not limiter.allow("Error code 5: file d", "d.xlsx")
+    assert limiter.pop_suppressed() == {"Error code 5": 2}
+
+
+def test_report_suppressed(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    """
+    Tests that the messages suppressed in another process are reported without waiting for a new message.
+    """
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    assert limiter.allow("Error code 4: файл plan.xlsx", "plan.xlsx")
+    assert not limiter.allow("Error code 4: файл plan.xlsx", "plan.xlsx")
+    dispatcher.report_suppressed(interval=60)
+    assert dispatcher.flush(5)
+    assert telegram_stub == []
+
+    dispatcher.report_suppressed(interval=0)
+    dispatcher.report_suppressed(interval=0)
+    assert dispatcher.flush(5)
+    assert [message["text"] for message in telegram_stub] == ["Подавлено повторных уведомлений: 1 (Error code 4 - 1)"]
+
+
+def test_failed_digest_doesnt_stop_dispatcher(telegram_stub: List[dict], limiter: NotificationLimiter, mocker) -> None:
+    """
+    Tests that an error while the digest is prepared neither blocks `flush` nor stops sending the next messages.
+    """
+    mocker.patch.object(limiter, "pop_suppressed", side_effect=[KeyError("suppressed"), {}])
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0, limiter=limiter)
+    dispatcher.notify("first")
+    assert dispatcher.flush(5)
+    dispatcher.notify("second")
+    assert dispatcher.flush(5)
+    assert [message["text"] for message in telegram_stub] == ["second"]
+
+
+def test_worker_sends_queued_messages_on_exit(telegram_stub: List[dict], limiter: NotificationLimiter) -> None:
+    """
+    Tests that a worker process, which exits without the atexit handlers, sends the queued digest before exiting.
+    """
+    dispatcher: NotificationDispatcher = NotificationDispatcher(batch_interval=0.5, limiter=limiter)
+    process = multiprocessing.get_context("fork").Process(target=dispatcher.notify, args=("Error code 6: worker",))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+    assert [message["text"] for message in telegram_stub] == ["Error code 6: worker"]
+
+
+@pytest.mark.parametrize("state", ["{}", '{"tokens": "5", "updated": 0, "sent": [], "suppressed": {}}', "[]", "{broken"])
+def test_limiter_replaces_unknown_state(tmp_path: PosixPath, state: str) -> None:
+    """
+    Tests that a state file of another layout is replaced with a new state instead of breaking the callers.
+    """
+    path: PosixPath = tmp_path / "state.json"
+    path.write_text(state, encoding="utf-8")
+    limiter: NotificationLimiter = NotificationLimiter(state_path=str(path))
+    assert not limiter.has_suppressed()
+    assert limiter.allow("Error code 4: файл plan.xlsx", "plan.xlsx")
+    assert not limiter.allow("Error code 4: файл plan.xlsx", "plan.xlsx")
+    assert limiter.pop_suppressed() == {"Error code 4": 1}
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import pytest
+from pathlib import PosixPath
+from typing import Iterator
+from scripts.profiler import FileProfile, add_to_statistics
+
+
+def slow_records(count: int, delay: float) -> Iterator[dict]:
+    for number in range(count):
+        time.sleep(delay)
+        yield {"number": number}
+
+
+def test_profile_stages(mocker) -> None:
+    """
+    Tests that a nested stage and the items of a lazy iterable are excluded from the time of the outer stage.
+    """
+    info = mocker.patch("scripts.profiler.logger.info")
+    with FileProfile("DKP", "plan.xlsx") as profile:
+        with profile.stage("read_excel", rows=10):
+            time.sleep(0.05)
+        with profile.stage("write") as stage:
+            for _ in profile.iterate("parse_sheet", slow_records(5, 0.02)):
+                time.sleep(0.01)
+            with profile.stage("encode"):
+                time.sleep(0.03)
+            stage.add_rows(5)
+
+    line: str = info.call_args[0][0]
+    assert line.startswith("Profile: ")
+    result: dict = json.loads(line[len("Profile: "):])
+    assert result["converter"] == "DKP" and result["file"] == "plan.xlsx" and result["status"] == "ok"
+    stages: dict = result["stages"]
+    assert list(stages) == ["read_excel", "write", "parse_sheet", "encode"]
+    assert stages["read_excel"]["wall"] == pytest.approx(0.05, abs=0.02)
+    assert stages["parse_sheet"]["wall"] == pytest.approx(0.1, abs=0.03)
+    assert stages["write"]["wall"] == pytest.approx(0.05, abs=0.03)
+    assert stages["encode"]["wall"] == pytest.approx(0.03, abs=0.02)
+    assert result["wall"] >= 0.23
+    assert [stages[name]["rows"] for name in stages] == [10, 5, 5, None]
+    assert stages["read_excel"]["peak_rss_mb"] > 0 and stages["parse_sheet"]["peak_rss_mb"] is None
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="The peak memory can't be reset")
+def test_profile_peak_rss_of_stage(mocker) -> None:
+    """
+    Tests that the peak memory of a stage is the one reached inside it, even after the memory is freed.
+    """
+    mocker.patch("scripts.profiler.logger.info")
+    with FileProfile("DKP", "plan.xlsx") as profile:
+        with profile.stage("allocate") as stage:
+            data: bytearray = bytearray(100 * 1024 * 1024)
+            data[::4096] = b"x" * len(data[::4096])
+            del data
+        with profile.stage("small") as small:
+            pass
+    assert stage.peak_rss - small.peak_rss > 90 * 1024
+
+
+def test_profile_of_failed_file(mocker, tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Tests that a failed file is profiled with its exit code and aggregated into the statistics of all runs.
+    """
+    mocker.patch("scripts.profiler.logger.info")
+    path: str = str(tmp_path / "stats" / "profile.json")
+    monkeypatch.setenv("DATACORE_PROFILE_STATS", path)
+    with pytest.raises(SystemExit):
+        with FileProfile("DKP", "bad.xlsx") as profile:
+            with profile.stage("read_excel", rows=3):
+                raise SystemExit(6)
+    with FileProfile("DKP", "good.xlsx") as profile:
+        with profile.stage("read_excel", rows=4):
+            pass
+
+    with open(path, encoding="utf-8") as f:
+        statistics: dict = json.load(f)
+    assert statistics["DKP"]["files"] == 2
+    assert statistics["DKP"]["errors"] == 1
+    assert statistics["DKP"]["stages"]["read_excel"]["calls"] == 2
+    assert statistics["DKP"]["stages"]["read_excel"]["rows"] == 7
+    assert statistics["DKP"]["stages"]["total"]["calls"] == 2
+
+
+def test_add_to_statistics_keeps_other_converters(tmp_path: PosixPath) -> None:
+    path: str = str(tmp_path / "profile.json")
+    profile: dict = {"converter": "Forecast", "status": "exit 6", "wall": 1.0, "cpu": 0.5, "peak_rss_mb": 100.0,
+                     "stages": {}}
+    add_to_statistics(path, profile)
+    add_to_statistics(path, {**profile, "converter": "DKP", "status": "ok", "wall": 2.0})
+    with open(path, encoding="utf-8") as f:
+        statistics: dict = json.load(f)
+    assert sorted(statistics) == ["DKP", "Forecast"]
+    assert statistics["Forecast"]["stages"]["total"] == {
+        "calls": 1, "wall": 1.0, "cpu": 0.5, "rows": 0, "max_wall": 1.0, "max_peak_rss_mb": 100.0
+    }
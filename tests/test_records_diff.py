@@ -0,0 +1,81 @@
+import os
+import pytest
+from pathlib import PosixPath
+from typing import List
+from scripts.records_diff import RecordsDiff
+
+
+def create_records_diff(folder: str) -> RecordsDiff:
+    return RecordsDiff(folder, ("client", "month"), ("department", "year"), ("original_file_name",))
+
+
+def record(client: str, month: int, teu: float, file_name: str = "plan.xlsx") -> dict:
+    return {
+        "client": client, "month": month, "teu": teu,
+        "department": "Отдел продаж", "year": 2024, "original_file_name": file_name
+    }
+
+
+def compare(folder: str, records: List[dict]) -> List[dict]:
+    with create_records_diff(folder) as records_diff:
+        return list(records_diff.diff(records))
+
+
+def test_diff(tmp_path: PosixPath) -> None:
+    """
+    Tests that the first file is inserted completely and the next one yields only the changed records.
+    """
+    folder: str = str(tmp_path)
+    first: List[dict] = [record("A", 1, 10), record("A", 2, 20), record("B", 1, 5)]
+    assert [change["change_type"] for change in compare(folder, first)] == ["insert"] * 3
+
+    second: List[dict] = [
+        record("A", 1, 10, "plan_v2.xlsx"), record("A", 2, 25, "plan_v2.xlsx"), record("C", 1, 1, "plan_v2.xlsx")
+    ]
+    assert compare(folder, second) == [
+        {**record("A", 2, 25, "plan_v2.xlsx"), "change_type": "update"},
+        {**record("C", 1, 1, "plan_v2.xlsx"), "change_type": "insert"},
+        {**record("B", 1, 5), "change_type": "delete"},
+    ]
+    assert compare(folder, second) == []
+    assert sorted(os.listdir(tmp_path)) == ["Отдел_продаж_2024.pickle", "Отдел_продаж_2024.pickle.lock"]
+
+
+def test_diff_duplicate_keys(tmp_path: PosixPath) -> None:
+    """
+    Tests that records with the same key are matched in the order they appear in the file.
+    """
+    folder: str = str(tmp_path)
+    compare(folder, [record("A", 1, 10), record("A", 1, 20)])
+    with create_records_diff(folder) as records_diff:
+        changes: List[dict] = list(records_diff.diff([record("A", 1, 10), record("A", 1, 30)]))
+
+    assert changes == [{**record("A", 1, 30), "change_type": "update"}]
+    assert records_diff.count == 2
+    assert records_diff.changes == {"insert": 0, "update": 1, "delete": 0}
+
+
+def test_diff_keeps_previous_records_on_error(tmp_path: PosixPath) -> None:
+    """
+    Tests that the records of a failed file are not saved, so the next file is compared with the last written one.
+    """
+    folder: str = str(tmp_path)
+    compare(folder, [record("A", 1, 10)])
+    with pytest.raises(SystemExit):
+        with create_records_diff(folder) as records_diff:
+            list(records_diff.diff([record("A", 1, 99)]))
+            raise SystemExit(4)
+
+    assert compare(folder, [record("A", 1, 10)]) == []
+
+
+def test_diff_partitions(tmp_path: PosixPath) -> None:
+    """
+    Tests that the files of other departments and years are compared separately.
+    """
+    folder: str = str(tmp_path)
+    compare(folder, [record("A", 1, 10)])
+    other_year: dict = {**record("A", 1, 10), "year": 2025}
+    assert compare(folder, [other_year]) == [{**other_year, "change_type": "insert"}]
+    assert create_records_diff(folder).get_path({"department": "ДКП/Отдел 1", "year": 2024}) == \
+        os.path.join(folder, "ДКП_Отдел_1_2024.pickle")
@@ -0,0 +1,97 @@
+import pytest
+from pathlib import PosixPath
+from typing import List
+from scripts.reference_cache import ReferenceCache
+
+
+class FakeTable(object):
+    """
+    The reference table with counters of full reads and probes.
+    """
+    def __init__(self):
+        self.rows: List[tuple] = [("Наименования листов", "ПЛАН ПРОДАЖ", "ПЛАН_ПРОДАЖ", "ПЛАН_ПРОДАЖ")]
+        self.fetches: int = 0
+        self.probes: int = 0
+        self.available: bool = True
+
+    def fetch(self) -> List[tuple]:
+        self.fetches += 1
+        return list(self.rows)
+
+    def probe(self) -> tuple:
+        if not self.available:
+            raise ConnectionError("server is unreachable")
+        self.probes += 1
+        return len(self.rows), hash(tuple(self.rows))
+
+
+def create_cache(table: FakeTable, ttl: float = 0, snapshot_path: str = None) -> ReferenceCache:
+    return ReferenceCache(
+        fetch=table.fetch,
+        probe=table.probe,
+        build=lambda rows: {"sheets_name": [row[2] for row in rows]},
+        ttl=ttl,
+        snapshot_path=snapshot_path
+    )
+
+
+@pytest.fixture
+def table() -> FakeTable:
+    return FakeTable()
+
+
+def test_reference_is_fetched_only_when_changed(table: FakeTable) -> None:
+    cache: ReferenceCache = create_cache(table)
+    assert cache.get() == {"sheets_name": ["ПЛАН_ПРОДАЖ"]}
+    assert cache.get() == {"sheets_name": ["ПЛАН_ПРОДАЖ"]}
+    assert (table.fetches, table.probes) == (1, 2)
+
+    table.rows.append(("Наименования листов", "ПЛАН ПРОДАЖ", "ПЛАН ПРОДАЖ", "ПЛАН_ПРОДАЖ"))
+    assert cache.get() == {"sheets_name": ["ПЛАН_ПРОДАЖ", "ПЛАН ПРОДАЖ"]}
+    assert table.fetches == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_probe_is_skipped_within_ttl(table: FakeTable) -> None:
+    cache: ReferenceCache = create_cache(table, ttl=60)
+    for _ in range(5):
+        cache.get()
+    assert (table.fetches, table.probes) == (1, 1)
+
+
+def test_snapshot_is_used_on_cold_start(table: FakeTable, tmp_path: PosixPath) -> None:
+    snapshot_path: str = str(tmp_path / "cache" / "reference.pickle")
+    create_cache(table, snapshot_path=snapshot_path).get()
+    assert create_cache(table, snapshot_path=snapshot_path).get() == {"sheets_name": ["ПЛАН_ПРОДАЖ"]}
+    assert table.fetches == 1
+
+    table.rows.clear()
+    assert create_cache(table, snapshot_path=snapshot_path).get() == {"sheets_name": []}
+    assert table.fetches == 2
+
+
+def test_cache_is_bypassed_if_probe_fails(table: FakeTable) -> None:
+    cache: ReferenceCache = create_cache(table)
+    table.available = False
+    cache.get()
+    cache.get()
+    assert table.fetches == 2
+    assert cache.entry is None
+
+
+def test_version_shares_ttl_with_reference(table: FakeTable) -> None:
+    """
+    Tests that the version for the content key is probed once per TTL together with the reference,
+    and a new version seen by `get_version` reloads the reference.
+    """
+    cache: ReferenceCache = create_cache(table, ttl=60)
+    version: tuple = cache.get_version()
+    cache.get()
+    assert [cache.get_version() for _ in range(3)] == [version] * 3
+    assert (table.fetches, table.probes) == (1, 1)
+
+    table.rows.clear()
+    cache.checked_at -= 60
+    assert cache.get_version() != version
+    assert cache.get() == {"sheets_name": []}
+    assert (table.fetches, table.probes) == (2, 2)
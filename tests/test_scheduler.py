@@ -0,0 +1,107 @@
+import os
+import time
+import pytest
+from pathlib import PosixPath
+from typing import List, Tuple
+from concurrent.futures import Future
+from scripts.daemon import Pipeline
+from scripts.scheduler import Scheduler, get_pipeline_limits
+
+
+class SlowConverter(object):
+    """
+    Converter which records the moment it started and sleeps a little, like a heavy workbook.
+    """
+    def __init__(self, input_file_path: str, output_folder: str):
+        self.input_file_path: str = input_file_path
+        self.output_folder: str = output_folder
+
+    def main(self) -> None:
+        with open(os.path.join(self.output_folder, f"{os.path.basename(self.input_file_path)}.json"), "w") as f:
+            f.write(str(time.time()))
+        time.sleep(0.3)
+
+
+@pytest.fixture
+def pipelines(tmp_path: PosixPath, monkeypatch) -> List[Pipeline]:
+    monkeypatch.setenv("XL_IDP_PATH_DATACORE", str(tmp_path))
+    pipelines: List[Pipeline] = [
+        Pipeline("dkp", "dkp", __name__, "SlowConverter"),
+        Pipeline("forecast", "flat_forecast", __name__, "SlowConverter"),
+    ]
+    for pipeline in pipelines:
+        os.makedirs(pipeline.xls_path)
+        pipeline.prepare_folders()
+    return pipelines
+
+
+def run_until_idle(scheduler: Scheduler, timeout: float = 20) -> List[Tuple[Pipeline, str, int]]:
+    finished: List[Tuple[Pipeline, str, int]] = []
+    deadline: float = time.time() + timeout
+    scheduler.dispatch()
+    while not scheduler.is_idle() and time.time() < deadline:
+        time.sleep(0.05)
+        finished.extend(scheduler.run_pending())
+    return finished
+
+
+def test_get_pipeline_limits(monkeypatch) -> None:
+    monkeypatch.setenv("DATACORE_PIPELINE_LIMITS", "dkp=2")
+    assert get_pipeline_limits(4, ["dkp", "forecast"]) == {"dkp": 2, "forecast": 3}
+    monkeypatch.delenv("DATACORE_PIPELINE_LIMITS")
+    assert get_pipeline_limits(1, ["forecast"]) == {"forecast": 1}
+
+
+def test_burst_does_not_starve_other_pipeline(pipelines: List[Pipeline], monkeypatch) -> None:
+    """
+    A burst of DKP files must not delay a forecast file that arrived after it:
+    the DKP limit keeps a worker free and the forecast starts in the first wave.
+    """
+    dkp, forecast = pipelines
+    monkeypatch.setenv("DATACORE_PIPELINE_LIMITS", "dkp=1")
+    scheduler: Scheduler = Scheduler(pipelines, workers=2)
+    try:
+        for index in range(4):
+            path: str = os.path.join(dkp.xls_path, f"dkp_{index}.xlsx")
+            open(path, "w").close()
+            scheduler.submit(dkp, path)
+        forecast_file: str = os.path.join(forecast.xls_path, "forecast.xlsx")
+        open(forecast_file, "w").close()
+        scheduler.submit(forecast, forecast_file)
+        scheduler.submit(forecast, forecast_file)
+
+        finished: List[Tuple[Pipeline, str, int]] = run_until_idle(scheduler)
+    finally:
+        scheduler.shutdown()
+
+    assert sorted(os.path.basename(path) for _, path, _ in finished) == [
+        "dkp_0.xlsx", "dkp_1.xlsx", "dkp_2.xlsx", "dkp_3.xlsx", "forecast.xlsx"
+    ]
+    assert all(exit_code == 0 for _, _, exit_code in finished)
+    assert sorted(os.listdir(dkp.done_path)) == ["dkp_0.xlsx", "dkp_1.xlsx", "dkp_2.xlsx", "dkp_3.xlsx"]
+
+    with open(os.path.join(dkp.json_path, "dkp_1.xlsx.json")) as f:
+        second_dkp_started: float = float(f.read())
+    with open(os.path.join(forecast.json_path, "forecast.xlsx.json")) as f:
+        forecast_started: float = float(f.read())
+    assert forecast_started < second_dkp_started
+
+
+def test_collect_contains_worker_exception(pipelines: List[Pipeline]) -> None:
+    """
+    An exception raised by a worker marks the file as failed instead of stopping the daemon.
+    """
+    dkp, _ = pipelines
+    path: str = os.path.join(dkp.xls_path, "dkp.xlsx")
+    open(path, "w").close()
+    future: Future = Future()
+    future.set_exception(FileNotFoundError(path))
+    scheduler: Scheduler = Scheduler(pipelines, workers=1)
+    try:
+        scheduler.running[future] = (dkp, path)
+        scheduler.in_flight.add(path)
+        assert scheduler.collect() == [(dkp, path, 1)]
+    finally:
+        scheduler.shutdown()
+    assert scheduler.is_idle()
+    assert os.path.exists(os.path.join(dkp.xls_path, "error_dkp.xlsx"))
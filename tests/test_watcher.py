@@ -0,0 +1,73 @@
+import os
+import time
+import pytest
+from pathlib import PosixPath
+from typing import Any, List, Tuple
+from scripts.watcher import BaseWatcher, InotifyWatcher, PollingWatcher
+
+DEBOUNCE: float = 0.3
+
+
+def accept_xlsx(name: str) -> bool:
+    return name.endswith(".xlsx") and "error_" not in name
+
+
+def wait_ready(watcher: BaseWatcher, timeout: float = 3) -> List[Tuple[Any, str]]:
+    """
+    Collects the ready files until something is returned or the timeout expires.
+    """
+    deadline: float = time.time() + timeout
+    while time.time() < deadline:
+        if ready := watcher.get_ready(0.1):
+            return ready
+    return []
+
+
+@pytest.fixture(params=[InotifyWatcher, PollingWatcher])
+def watcher(request) -> BaseWatcher:
+    watcher: BaseWatcher = request.param()
+    yield watcher
+    watcher.close()
+
+
+def test_existing_files_are_ready_after_debounce(watcher: BaseWatcher, tmp_path: PosixPath) -> None:
+    """
+    Files that were uploaded before the start are handed out by their modification time.
+    """
+    old_file: PosixPath = tmp_path / "old.xlsx"
+    old_file.write_text("data")
+    os.utime(old_file, (time.time() - 60, time.time() - 60))
+    (tmp_path / "error_old.xlsx").write_text("data")
+    watcher.add_folder(str(tmp_path), DEBOUNCE, "pipeline", accept_xlsx)
+    assert watcher.get_ready(0.1) == [("pipeline", str(old_file))]
+
+
+def test_new_file_waits_for_debounce(watcher: BaseWatcher, tmp_path: PosixPath) -> None:
+    """
+    A new file is returned only once, and not earlier than the debounce window after the last write.
+    """
+    watcher.add_folder(str(tmp_path), DEBOUNCE, "pipeline", accept_xlsx)
+    new_file: PosixPath = tmp_path / "new.xlsx"
+    written_at: float = time.time()
+    new_file.write_text("data")
+    (tmp_path / "notes.txt").write_text("data")
+    assert wait_ready(watcher) == [("pipeline", str(new_file))]
+    assert time.time() - written_at >= DEBOUNCE
+    assert wait_ready(watcher, timeout=DEBOUNCE * 2) == []
+
+
+def test_subfolders_are_ignored(watcher: BaseWatcher, tmp_path: PosixPath) -> None:
+    done: PosixPath = tmp_path / "done"
+    done.mkdir()
+    watcher.add_folder(str(tmp_path), DEBOUNCE, "pipeline", accept_xlsx)
+    (done / "processed.xlsx").write_text("data")
+    assert wait_ready(watcher, timeout=DEBOUNCE * 2) == []
+
+
+def test_removed_file_is_forgotten(watcher: BaseWatcher, tmp_path: PosixPath) -> None:
+    watcher.add_folder(str(tmp_path), DEBOUNCE, "pipeline", accept_xlsx)
+    new_file: PosixPath = tmp_path / "new.xlsx"
+    new_file.write_text("data")
+    watcher.get_ready(0.05)
+    new_file.unlink()
+    assert wait_ready(watcher, timeout=DEBOUNCE * 2) == []
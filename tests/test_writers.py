@@ -0,0 +1,230 @@
+import os
+import json
+import pytest
+import numpy as np
+import pandas as pd
+from pathlib import PosixPath
+from typing import List
+from scripts.settings_dkp import ClickHouseClientPool
+from clickhouse_connect.driver.exceptions import OperationalError
+from scripts.encoders import StdlibEncoder
+from scripts.writers import ClickHouseWriter, JsonWriter, create_writer, iter_frame_records
+
+
+@pytest.mark.parametrize("records", [
+    [],
+    [{"client": "РУСКОН", "month": 1, "teu": None, "nested": {"a": [1, 2.5]}}],
+    [{"client": "A\nB", "flag": True}, {"client": "C", "flag": False, "value": 1e-05}],
+])
+def test_json_writer_matches_json_dump(tmp_path: PosixPath, records: list) -> None:
+    """
+    Tests that the streamed array is byte-for-byte the same as `json.dump` with indent=4.
+    """
+    path: str = str(tmp_path / "out.json")
+    with JsonWriter(path, StdlibEncoder(JsonWriter.indent)) as writer:
+        writer.write_many(iter(records))
+
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == json.dumps(records, ensure_ascii=False, indent=4)
+    assert writer.count == len(records)
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_json_writer_keeps_previous_file_on_error(tmp_path: PosixPath) -> None:
+    """
+    Tests that an error while writing leaves neither a partial output nor a temporary file.
+    """
+    path: str = str(tmp_path / "out.json")
+    with open(path, "w") as f:
+        f.write("previous")
+
+    with pytest.raises(SystemExit):
+        with JsonWriter(path) as writer:
+            writer.write({"client": "A"})
+            raise SystemExit(5)
+
+    assert os.listdir(tmp_path) == ["out.json"]
+    with open(path) as f:
+        assert f.read() == "previous"
+
+
+def test_iter_frame_records() -> None:
+    """
+    Tests that the records are the same as the ones of `df.replace({np.nan: None, "NaT": None}).to_dict('records')`.
+    """
+    df: pd.DataFrame = pd.DataFrame({
+        "client": [" РУСКОН", None, "NaT", np.nan],
+        "teu": [1, 2, 3, 4],
+        "rate": [1.5, np.nan, 2.0, 3.0],
+        "mixed": [np.int64(1), "a", 2.5, None],
+        "flag": [True, False, True, False],
+        "date": pd.to_datetime(["2024-05-01", None, "2024-05-03", "2024-05-04"])
+    }, index=[3, 5, 8, 9])
+
+    records: List[dict] = list(iter_frame_records(df, chunk_size=3))
+
+    assert records == df.replace({np.nan: None, "NaT": None}).to_dict('records')
+    assert [type(record["teu"]) for record in records] == [int] * 4
+    assert type(records[0]["mixed"]) is int
+
+
+@pytest.mark.parametrize("output_format, filename", [
+    (None, "plan.xlsx.json"),
+    ("json", "plan.xlsx.json"),
+    ("ndjson", "plan.xlsx.ndjson"),
+])
+def test_create_writer(tmp_path: PosixPath, monkeypatch, output_format: str, filename: str) -> None:
+    """
+    Tests that the output format and the extension are selected by DATACORE_OUTPUT_FORMAT.
+    """
+    if output_format:
+        monkeypatch.setenv("DATACORE_OUTPUT_FORMAT", output_format)
+    else:
+        monkeypatch.delenv("DATACORE_OUTPUT_FORMAT", raising=False)
+    monkeypatch.setenv("DATACORE_JSON_BACKEND", "json")
+    records: list = [{"client": "РУСКОН", "teu": None}, {"client": "A\nB", "teu": 2.5}]
+    with create_writer(str(tmp_path), "plan.xlsx") as writer:
+        writer.write_many(records)
+
+    with open(tmp_path / filename, encoding="utf-8") as f:
+        content: str = f.read()
+    if output_format == "ndjson":
+        assert content == '{"client": "РУСКОН", "teu": null}\n{"client": "A\\nB", "teu": 2.5}\n'
+        assert [json.loads(line) for line in content.splitlines()] == records
+    else:
+        assert json.loads(content) == records
+
+
+def test_create_writer_unknown_format(tmp_path: PosixPath, monkeypatch) -> None:
+    monkeypatch.setenv("DATACORE_OUTPUT_FORMAT", "xml")
+    with pytest.raises(ValueError):
+        create_writer(str(tmp_path), "plan.xlsx")
+
+
+class FakeClickHouse(object):
+    """
+    Records the commands and the inserts, or fails like an unreachable server.
+    """
+    def __init__(self, reachable: bool = True):
+        self.reachable: bool = reachable
+        self.commands: List[tuple] = []
+        self.inserts: List[tuple] = []
+
+    def command(self, cmd: str, parameters: dict = None, settings: dict = None) -> None:
+        self.commands.append((cmd, parameters))
+
+    def insert(self, table: str, data: list, column_names: list, column_oriented: bool) -> None:
+        assert column_oriented
+        self.inserts.append((table, column_names, data))
+
+    def create_client(self) -> "FakeClickHouse":
+        if not self.reachable:
+            raise OperationalError("Connection refused")
+        return self
+
+
+@pytest.fixture
+def sink(tmp_path: PosixPath, monkeypatch, mocker) -> FakeClickHouse:
+    """
+    Selects the ClickHouse sink with batches of 2 records and replaces the server with a fake one.
+    """
+    monkeypatch.setenv("DATACORE_SINK", "clickhouse")
+    monkeypatch.setenv("DATACORE_CLICKHOUSE_BATCH", "2")
+    monkeypatch.delenv("DATACORE_OUTPUT_FORMAT", raising=False)
+    server: FakeClickHouse = FakeClickHouse()
+    mocker.patch("scripts.settings_dkp.clickhouse_pool", ClickHouseClientPool())
+    mocker.patch.object(ClickHouseClientPool, "_create_client", side_effect=lambda: server.create_client())
+    return server
+
+
+records: list = [
+    {"client": "A", "teu": 1, "original_file_name": "plan.xlsx"},
+    {"client": "B", "teu": None, "original_file_name": "plan.xlsx"},
+    {"client": "C", "teu": 2.5, "original_file_name": "plan.xlsx"},
+]
+
+
+def test_clickhouse_writer_inserts_columns(sink: FakeClickHouse, tmp_path: PosixPath) -> None:
+    """
+    Tests that the rows of the file are deleted once and the records are inserted by columns in batches.
+    """
+    with create_writer(str(tmp_path), "plan.xlsx", table="forecast") as writer:
+        writer.write_many(records)
+
+    assert isinstance(writer, ClickHouseWriter)
+    assert writer.count == writer.inserted == 3
+    assert sink.commands == [(
+        "ALTER TABLE forecast DELETE WHERE original_file_name = %(original_file_name)s",
+        {"original_file_name": "plan.xlsx"}
+    )]
+    assert sink.inserts == [
+        ("forecast", ["client", "teu", "original_file_name"], [["A", "B"], [1, None], ["plan.xlsx", "plan.xlsx"]]),
+        ("forecast", ["client", "teu", "original_file_name"], [["C"], [2.5], ["plan.xlsx"]]),
+    ]
+    assert os.listdir(tmp_path) == []
+
+
+def test_clickhouse_writer_falls_back_to_file(sink: FakeClickHouse, tmp_path: PosixPath) -> None:
+    """
+    Tests that the records are written to the JSON file if ClickHouse is unreachable.
+    """
+    sink.reachable = False
+    with create_writer(str(tmp_path), "plan.xlsx", table="forecast") as writer:
+        writer.write_many(records)
+
+    assert writer.use_fallback and writer.count == 3
+    with open(tmp_path / "plan.xlsx.json", encoding="utf-8") as f:
+        assert json.load(f) == records
+    assert os.listdir(tmp_path) == ["plan.xlsx.json"]
+
+
+def test_clickhouse_writer_deletes_inserted_rows_on_error(sink: FakeClickHouse, tmp_path: PosixPath) -> None:
+    """
+    Tests that the rows inserted before an error are deleted, so a failed file leaves no data.
+    """
+    with pytest.raises(SystemExit):
+        with create_writer(str(tmp_path), "plan.xlsx", table="forecast") as writer:
+            writer.write_many(records)
+            raise SystemExit(5)
+
+    assert len(sink.inserts) == 1
+    assert len(sink.commands) == 2
+
+
+def test_parquet_writer_keeps_types(tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Tests that DataFrames keep their dtypes and records with mixed types are written as strings.
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setenv("DATACORE_OUTPUT_FORMAT", "parquet")
+    df: pd.DataFrame = pd.DataFrame({
+        "client": ["A", None], "teu": [1.5, np.nan], "month": [1, 2], "date": ["NaT", "x"]
+    })
+    with create_writer(str(tmp_path), "flat.xlsx") as writer:
+        writer.write_frame(df)
+    with create_writer(str(tmp_path), "dkp.xlsx") as writer:
+        writer.write_many([{"client": "A", "size": 20}, {"client": "B", "size": "40/20", "extra": True}])
+
+    flat = pq.read_table(tmp_path / "flat.xlsx.parquet")
+    assert [str(field.type) for field in flat.schema] == ["string", "double", "int64", "string"]
+    assert flat.to_pylist() == [
+        {"client": "A", "teu": 1.5, "month": 1, "date": None},
+        {"client": None, "teu": None, "month": 2, "date": "x"},
+    ]
+    assert pq.read_table(tmp_path / "dkp.xlsx.parquet").to_pylist() == [
+        {"client": "A", "size": "20", "extra": None},
+        {"client": "B", "size": "40/20", "extra": True},
+    ]
+    assert sorted(os.listdir(tmp_path)) == ["dkp.xlsx.parquet", "flat.xlsx.parquet"]
+
+
+def test_parquet_writer_keeps_record_order(tmp_path: PosixPath, monkeypatch) -> None:
+    """
+    Tests that the columns follow the order of the record fields instead of the hash order of a set.
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setenv("DATACORE_OUTPUT_FORMAT", "parquet")
+    fields: list = ["year", "month", "department", "client", "direction", "teu", "profit", "original_file_name"]
+    with create_writer(str(tmp_path), "dkp.xlsx") as writer:
+        writer.write_many([dict.fromkeys(fields[:5], 1), dict.fromkeys(fields, 2)])
+    assert pq.read_table(tmp_path / "dkp.xlsx.parquet").column_names == fields